@@ -1,32 +1,55 @@
 from datetime import datetime
-import uuid
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Tuple
 import os
 from dotenv import load_dotenv
 import json
 from pydantic import ValidationError
 import traceback
+import copy
 import logging
+import math
 import time
+import random
+import asyncio
 
 from .models import (
     LessonRequest, LessonResult, AssessmentRequest, AssessmentResult,
-    LabRequest, Lab, Step, LabQuestion, TeachingTipRequest, ModelInfo
+    LabRequest, Lab, Step, LabQuestion, TeachingTipRequest, ModelInfo, Job,
+    BatchItem, BatchRequest
 )
 from .openrouter import (
-    generate_content, sanitize_and_parse_json, 
-    get_available_models, get_model_by_id, RECOMMENDED_MODELS, get_system_prompt
+    generate_content, stream_content, sanitize_and_parse_json, 
+    get_available_models, get_model_by_id, RECOMMENDED_MODELS, get_system_prompt,
+    RESPONSE_CACHE, INFLIGHT_REQUESTS, STATE_STORE, CIRCUIT_BREAKER, add_call_observer
 )
+from .errors import UpstreamError, RateLimitError, CircuitOpenError, FAILURE_CIRCUIT_OPEN
+from .retry import RetryPolicy, prime_stream
+from .generation import (
+    build_lesson_prompt, build_assessment_prompt, build_lab_prompt,
+    build_lesson_result, build_assessment_result, build_lab_result, GENERATION_KINDS
+)
+from .json_stream import StreamingJSONParser
 from .model_manager import ModelManager
+from .lru_cache import LRUCache
+from .hedging import Hedger
+from .batch import BatchRunner, BATCH_MAX_ITEMS
+from .jobs import JobQueue, QueueFullError, public_job, check_callback_url, DEFAULT_PRIORITY, MIN_PRIORITY, MAX_PRIORITY
+from .logging_config import configure_logging
+from .prompts import calculate_max_tokens, budget_max_tokens, observe_completion, TOKEN_BUDGET
+from .semantic_cache import create_semantic_cache, SEMANTIC_CACHE_VERIFY_RATE
+from .rag import get_rag_stats, get_index, RAG_ENABLED
+from .library import create_content_library, LIBRARY_PAGE_SIZE, LIBRARY_MAX_PAGE_SIZE
+from .health import create_health_prober, HEALTH_PROBE_ENABLED
+from .concurrency import ConcurrencyLimiter, ConcurrencyMiddleware, CONCURRENCY_LIMIT_ENABLED
+from .prewarm import create_prewarmer, PREWARM_ENABLED
+from . import http_client, metrics, tracing
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (JSON lines written off the event loop, see logging_config)
+configure_logging()
 logger = logging.getLogger("edugenie.api")
 
 # Load environment variables
@@ -56,6 +79,14 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Adaptive per-endpoint and per-model concurrency limits for /generate/*,
+# shedding excess requests with 503 before they do any work. Added before CORS
+# so that CORS wraps it and the browser can read the 503s
+concurrency_limiter = ConcurrencyLimiter(get_model_by_id)
+if CONCURRENCY_LIMIT_ENABLED:
+    app.add_middleware(ConcurrencyMiddleware, limiter=concurrency_limiter)
+    add_call_observer(concurrency_limiter.observe_call)
+
 # Configure CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -65,11 +96,88 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization"],
 )
 
+# Time every request for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Give every request an id (X-Request-ID) and trace a sample of them
+app.add_middleware(tracing.TracingMiddleware)
+
 # Initialize ModelManager for smart model selection
 model_manager = ModelManager(
     models=get_available_models(),
-    recommended_models=RECOMMENDED_MODELS
+    recommended_models=RECOMMENDED_MODELS,
+    store=STATE_STORE,
+    breaker=CIRCUIT_BREAKER
 )
+# Feed upstream call latencies and outcomes into model routing and /metrics
+add_call_observer(model_manager.observe_call)
+add_call_observer(metrics.observe_call)
+
+# Background model health checks, read by /status; real calls count as checks
+health_prober = create_health_prober()
+add_call_observer(health_prober.observe_call)
+
+# Hedge slow generations with a second request to the next best model
+hedger = Hedger(model_manager.model_stats.latency_percentile)
+
+def hedge_alternative(model_id: str) -> str:
+    """Pick the model to send a hedge request to"""
+    return model_manager.get_best_model(exclude_models=[model_id])
+
+# Retry failed generations with backoff, switching models where that helps
+retry_policy = RetryPolicy()
+
+def retry_alternative(model_id: str, tried: List[str]) -> Optional[str]:
+    """Pick the model to retry on, or None if every model has been tried"""
+    alternative = model_manager.get_best_model(exclude_models=tried)
+    return None if alternative in tried else alternative
+
+def record_model_failure(model_id: str, error: Exception) -> None:
+    """Count a failed call for /models/stats (calls refused by an open circuit were never made)"""
+    if not (isinstance(error, UpstreamError) and error.kind == FAILURE_CIRCUIT_OPEN):
+        model_manager.record_error(model_id)
+
+@app.on_event("startup")
+async def open_http_client():
+    """Open the pooled OpenRouter client once per worker"""
+    await http_client.start_client()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close the pooled OpenRouter client and its keep-alive connections"""
+    await http_client.close_client()
+
+@app.on_event("startup")
+async def open_rag_index():
+    """Map the retrieval index before the first request needs it"""
+    if RAG_ENABLED:
+        try:
+            await asyncio.to_thread(get_index)
+        except Exception as e:
+            logger.warning("Could not open the retrieval index: %s", e)
+
+# Background generation jobs (see /jobs endpoints)
+job_queue = JobQueue()
+
+@app.on_event("startup")
+async def start_job_queue():
+    """Start the background job workers"""
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    """Stop the background job workers; unfinished jobs are resumed by another worker"""
+    await job_queue.stop()
+
+@app.on_event("startup")
+async def start_health_prober():
+    """Start checking model health in the background"""
+    if HEALTH_PROBE_ENABLED:
+        await health_prober.start()
+
+@app.on_event("shutdown")
+async def stop_health_prober():
+    """Stop the background model health checks"""
+    await health_prober.stop()
 
 # Domain-specific fallback tips when rate limits are hit
 FALLBACK_TIPS = {
@@ -86,8 +194,48 @@ FALLBACK_TIPS = {
 }
 
 # Teaching tip cache to minimize API calls
-TEACHING_TIP_CACHE = {}
 CACHE_EXPIRY = 24 * 60 * 60  # 24 hours in seconds
+FALLBACK_TIP_EXPIRY = 4 * 60 * 60  # Fallback tips expire sooner so real tips replace them
+TEACHING_TIP_CACHE = LRUCache(
+    max_entries=int(os.getenv("TEACHING_TIP_CACHE_MAX_ENTRIES", "100")),
+    max_bytes=int(os.getenv("TEACHING_TIP_CACHE_MAX_BYTES", str(1024 * 1024))),
+    ttl=CACHE_EXPIRY
+)
+metrics.track_cache("responses", RESPONSE_CACHE)
+metrics.track_cache("teaching_tips", TEACHING_TIP_CACHE)
+
+# Near-duplicate generation requests (None unless SEMANTIC_CACHE_ENABLED)
+SEMANTIC_CACHE = create_semantic_cache()
+if SEMANTIC_CACHE is not None:
+    metrics.track_cache("semantic", SEMANTIC_CACHE)
+# Background regenerations checking semantic cache hits, kept so they aren't garbage collected
+_semantic_verifications = set()
+
+# Every generated result, searchable under /library (None unless LIBRARY_ENABLED)
+CONTENT_LIBRARY = create_content_library()
+# Background writes of request counts, kept so they aren't garbage collected
+_library_writes = set()
+
+@app.on_event("shutdown")
+async def flush_library():
+    """Write the request counts not yet in the content library"""
+    if CONTENT_LIBRARY is not None:
+        await flush_library_requests()
+
+# Generates the most requested content into the response cache every night
+prewarmer = create_prewarmer(CONTENT_LIBRARY)
+
+@app.on_event("startup")
+async def start_prewarmer():
+    """Start the daily cache pre-warming"""
+    if PREWARM_ENABLED and prewarmer is not None:
+        await prewarmer.start()
+
+@app.on_event("shutdown")
+async def stop_prewarmer():
+    """Stop the daily cache pre-warming"""
+    if prewarmer is not None:
+        await prewarmer.stop()
 
 @app.get("/")
 async def root():
@@ -109,50 +257,370 @@ async def get_model_stats():
     """Get current model usage statistics"""
     return model_manager.get_model_stats()
 
-@app.post("/generate/lesson", response_model=LessonResult)
-async def generate_lesson(request: LessonRequest):
-    """Generate a lesson plan based on the provided parameters"""
+def circuit_open_error(error: CircuitOpenError) -> HTTPException:
+    """Answer a request for a model whose circuit is open with 503 and when to retry"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after or 0)))}
+    )
+
+def parse_model_response(response: str, model_id: str) -> Dict[str, Any]:
+    """
+    Parse a model's JSON response, recording the outcome for model routing
+    
+    Args:
+        response: The raw model response
+        model_id: The model that produced it
+        
+    Returns:
+        The parsed JSON
+    """
     try:
-        # Add flags for assessment and activities in the prompt
-        assessment_instruction = "Include assessment questions with answers." if request.includeAssessment else "Do not include assessment questions."
-        activities_instruction = "Include engaging student activities in the lesson plan." if request.includeActivities else "No need to include student activities."
+        with tracing.span("parse", model=model_id, characters=len(response)):
+            parsed_response = sanitize_and_parse_json(response)
+    except ValueError:
+        model_manager.record_parse(model_id, False)
+        raise
+    model_manager.record_parse(model_id, True)
+    return parsed_response
+
+def semantic_cache_lookup(request: Optional[BaseModel]) -> Optional[Tuple[str, float, bool]]:
+    """
+    Look a generation request up in the semantic cache
+    
+    Args:
+        request: The generation request, or None to skip the cache
         
-        prompt = f"""
-        Create a detailed lesson plan about "{request.topic}" for grade level "{request.gradeLevel}" with a duration of "{request.duration}".
-        {f"Additional context: {request.additionalNotes}" if request.additionalNotes else ""}
+    Returns:
+        (stored model response, similarity, whether the request was identical), or None on a miss
+    """
+    if SEMANTIC_CACHE is None or request is None:
+        return None
+    with tracing.span("semantic_cache_lookup") as span:
+        hit = SEMANTIC_CACHE.lookup(request)
+        span.set_attribute("hit", hit is not None)
+        if hit is not None:
+            span.set_attribute("similarity", round(hit[1], 3))
+    return hit
+
+def semantic_cache_store(request: Optional[BaseModel], response: str, model_id: str) -> None:
+    """Store a model response that parsed and validated for a generation request, with the model that generated it"""
+    if SEMANTIC_CACHE is not None and request is not None:
+        SEMANTIC_CACHE.store(request, response, model_id)
+
+async def verify_semantic_hit(prompt: str, model_id: str, max_tokens: int, served: Dict[str, Any]) -> None:
+    """
+    Regenerate a request answered from the semantic cache and judge the hit
+    
+    Args:
+        prompt: The request's own prompt
+        model_id: The model to use
+        max_tokens: Maximum tokens to generate
+        served: The parsed response that was served
+    """
+    try:
+        response = await generate_content(prompt=prompt, model_id=model_id, temperature=0.7, max_tokens=max_tokens)
+        fresh = sanitize_and_parse_json(response)
+    except Exception as e:
+        logger.warning("Could not verify semantic cache hit: %s", e)
+        return
+    correct = SEMANTIC_CACHE.record_verification(served, fresh)
+    logger.info(
+        "Semantic cache hit verified",
+        extra={"correct": correct, "served_title": served.get("title"), "fresh_title": fresh.get("title")}
+    )
+
+def schedule_semantic_verification(prompt: str, model_id: str, max_tokens: int, served: Dict[str, Any], exact: bool) -> None:
+    """Verify a sample of SEMANTIC_CACHE_VERIFY_RATE of the near-duplicate (not identical) hits"""
+    if exact or SEMANTIC_CACHE_VERIFY_RATE <= 0 or random.random() >= SEMANTIC_CACHE_VERIFY_RATE:
+        return
+    task = asyncio.create_task(verify_semantic_hit(prompt, model_id, max_tokens, served))
+    _semantic_verifications.add(task)
+    task.add_done_callback(_semantic_verifications.discard)
+
+async def flush_library_requests() -> None:
+    """Write the content library's request counts from a thread"""
+    try:
+        await asyncio.to_thread(CONTENT_LIBRARY.flush_requests)
+    except Exception as e:
+        logger.warning("Could not write request counts to the content library: %s", e)
+
+def library_record_request(request: BaseModel) -> None:
+    """Count a generation request for cache pre-warming; a failure here doesn't fail the request"""
+    if CONTENT_LIBRARY is None:
+        return
+    try:
+        due = CONTENT_LIBRARY.record_request(request)
+    except Exception as e:
+        logger.warning("Could not count the request in the content library: %s", e)
+        return
+    if due:
+        task = asyncio.create_task(flush_library_requests())
+        _library_writes.add(task)
+        task.add_done_callback(_library_writes.discard)
+
+async def library_save(request: Optional[BaseModel], result: BaseModel, model_id: str) -> None:
+    """Add a generated result to the content library; a failure here doesn't fail the generation"""
+    if CONTENT_LIBRARY is None or request is None:
+        return
+    try:
+        await asyncio.to_thread(CONTENT_LIBRARY.save, request, result, model_id)
+    except Exception as e:
+        logger.warning("Could not save %s to the content library: %s", getattr(result, "id", "result"), e)
+
+async def reused_response(request: BaseModel, stream: bool) -> Optional[Response]:
+    """
+    Answer a generation request with a stored result for an equivalent request
+    
+    Args:
+        request: The generation request
+        stream: Whether the client asked for Server-Sent Events
+        
+    Returns:
+        The response, or None if the library has nothing for the request
+    """
+    if CONTENT_LIBRARY is None:
+        return None
+    with tracing.span("library_lookup") as span:
+        stored = await asyncio.to_thread(CONTENT_LIBRARY.find_match, request)
+        span.set_attribute("hit", stored is not None)
+    if stored is None:
+        return None
+    
+    headers = {"X-Library-Id": stored["id"]}
+    if not stream:
+        return JSONResponse(stored["result"], headers=headers)
+    
+    async def events() -> AsyncIterator[str]:
+        yield format_sse("start", json.dumps({"model": stored["model"], "library": stored["id"]}))
+        yield format_sse("result", json.dumps(stored["result"]))
+    response = sse_response(events())
+    response.headers.update(headers)
+    return response
+
+async def build_prompt_off_loop(build_prompt: Callable[[BaseModel], str], request: BaseModel) -> str:
+    """Build a prompt, in a thread when retrieval is on, so index searches don't block the event loop"""
+    if RAG_ENABLED:
+        return await asyncio.to_thread(build_prompt, request)
+    return build_prompt(request)
+
+def hedge_max_tokens(model_id: str, prompt: str, request: Optional[BaseModel]) -> int:
+    """Get the max_tokens for a hedge request to another model"""
+    model = get_model_by_id(model_id)
+    return budget_max_tokens(request, model, prompt) if request is not None else calculate_max_tokens(model)
+
+async def generate_result(
+    prompt: str,
+    model_id: str,
+    max_tokens: int,
+    build_result: Callable[[Dict[str, Any]], BaseModel],
+    request: Optional[BaseModel] = None
+) -> BaseModel:
+    """
+    Generate, parse and validate a result, hedging to another model if slow
+    
+    Upstream failures are retried by the retry policy, usually on another
+    model; a response that doesn't parse or validate is not.
+    
+    Args:
+        prompt: The prompt to send
+        model_id: The model to use
+        max_tokens: Maximum tokens to generate with this model
+        build_result: Builds the validated result from the parsed JSON
+        request: The generation request, to answer near-duplicates from the semantic cache
         
-        IMPORTANT INSTRUCTIONS:
-        {assessment_instruction}
-        {activities_instruction}
+    Returns:
+        The first valid result
+    """
+    hit = semantic_cache_lookup(request)
+    if hit is not None:
+        response, _, exact = hit
+        parsed_response = sanitize_and_parse_json(response)
+        schedule_semantic_verification(prompt, model_id, max_tokens, copy.deepcopy(parsed_response), exact)
+        with tracing.span("validate"):
+            return build_result(parsed_response)
+    
+    async def generate(candidate_id: str) -> BaseModel:
+        with tracing.span("generate", model=candidate_id, hedge=candidate_id != model_id):
+            candidate_max_tokens = max_tokens if candidate_id == model_id else hedge_max_tokens(candidate_id, prompt, request)
+            try:
+                response = await generate_content(
+                    prompt=prompt,
+                    model_id=candidate_id,
+                    temperature=0.7,
+                    max_tokens=candidate_max_tokens
+                )
+            except UpstreamError as e:
+                record_model_failure(candidate_id, e)
+                raise
+            parsed_response = parse_model_response(response, candidate_id)
+            with tracing.span("validate"):
+                result = build_result(parsed_response)
+            if request is not None:
+                observe_completion(request, response, candidate_max_tokens)
+            semantic_cache_store(request, response, candidate_id)
+            await library_save(request, result, candidate_id)
+            return result
+    
+    async def attempt(attempt_model_id: str) -> BaseModel:
+        result, winning_model_id = await hedger.run(attempt_model_id, generate, hedge_alternative)
+        if winning_model_id != attempt_model_id:
+            logger.info(f"Hedge request to {winning_model_id} beat {attempt_model_id}")
+        return result
+    
+    return await retry_policy.run(model_id, attempt, retry_alternative)
+
+def format_sse(event: str, data: str) -> str:
+    """
+    Format a single Server-Sent Event
+    
+    Args:
+        event: The event name
+        data: The event payload, already serialized as JSON
         
-        Format your response as a JSON object with the following structure:
-        {{
-            "title": "Descriptive title for the lesson",
-            "gradeLevel": "{request.gradeLevel}",
-            "subject": "Subject area",
-            "duration": "{request.duration}",
-            "overview": "Brief overview of the lesson (1-2 paragraphs)",
-            "objectives": ["learning objective 1", "learning objective 2", ...],
-            "materials": ["material 1", "material 2", ...],
-            "plan": "Detailed lesson plan with sections for introduction, instruction, practice, etc.",
-            "assessment": "Description of assessment methods",
-            "questions": [
-                {{
-                    "text": "Question text",
-                    "options": ["option 1", "option 2", "option 3", "option 4"],
-                    "answer": "Correct answer",
-                    "bloomsLevel": "Knowledge/Comprehension/Application/Analysis/Synthesis/Evaluation"
-                }},
-                ...
-            ],
-            "tags": ["relevant", "tags", "for", "this", "lesson"]
-        }}
-
-        IMPORTANT: Your response must be a valid JSON object with no additional text before or after.
-        """
+    Returns:
+        The encoded event
+    """
+    return f"event: {event}\ndata: {data}\n\n"
+
+async def stream_generation(
+    prompt: str,
+    model_id: str,
+    max_tokens: int,
+    build_result: Callable[[Dict[str, Any]], BaseModel],
+    request: Optional[BaseModel] = None
+) -> AsyncIterator[str]:
+    """
+    Relay a streamed generation to the client as Server-Sent Events
+    
+    Emits a "start" event straight away, a "model" event if a hedge request
+    or a retry on another model produced the first token (upstream failures
+    before the first token are retried), a "token" event per upstream
+    delta, a "field" event as each top-level field of the JSON response
+    completes, and finally either a "result" event with the validated result
+    model or an "error" event. A near-duplicate answered from the semantic
+    cache is sent the same way, as one "token" event, and its "start" event
+    carries the similarity.
+    
+    Args:
+        prompt: The prompt to send
+        model_id: The model to use
+        max_tokens: Maximum tokens to generate
+        build_result: Builds the validated result from the parsed JSON
+        request: The generation request, to answer near-duplicates from the semantic cache
+        
+    Yields:
+        Encoded SSE events
+    """
+    hit = semantic_cache_lookup(request)
+    if hit is not None:
+        response, similarity, exact = hit
+        yield format_sse("start", json.dumps({"model": model_id, "semantic_cache": {"similarity": round(similarity, 3)}}))
+        try:
+            yield format_sse("token", json.dumps({"delta": response}))
+            parser = StreamingJSONParser()
+            for path, value in parser.feed(response):
+                yield format_sse("field", json.dumps({"path": path, "value": value}))
+            parsed_response = parser.close()
+            schedule_semantic_verification(prompt, model_id, max_tokens, copy.deepcopy(parsed_response), exact)
+            with tracing.span("validate"):
+                result = build_result(parsed_response)
+            yield format_sse("result", result.model_dump_json())
+        except ValueError as e:
+            yield format_sse("error", json.dumps({"status": 400, "detail": f"Failed to parse AI response: {str(e)}"}))
+        return
+    
+    yield format_sse("start", json.dumps({"model": model_id}))
+    
+    parser = StreamingJSONParser()
+    chunks: List[str] = []
+    requested_model_id = model_id
+    # Failures once tokens have been sent can't be retried
+    streaming = False
+    
+    async def open_stream(attempt_model_id: str) -> Tuple[AsyncIterator[str], str, str]:
+        try:
+            deltas, stream_model_id = await hedger.stream(
+                attempt_model_id,
+                lambda candidate_id: stream_content(
+                    prompt=prompt,
+                    model_id=candidate_id,
+                    temperature=0.7,
+                    max_tokens=max_tokens if candidate_id == requested_model_id else hedge_max_tokens(candidate_id, prompt, request)
+                ),
+                hedge_alternative
+            )
+            return await prime_stream(deltas), stream_model_id, attempt_model_id
+        except UpstreamError as e:
+            record_model_failure(attempt_model_id if e.model_id is None else e.model_id, e)
+            raise
+    
+    try:
+        deltas, stream_model_id, attempt_model_id = await retry_policy.run(model_id, open_stream, retry_alternative)
+        streaming = True
+        if stream_model_id != model_id:
+            model_id = stream_model_id
+            yield format_sse("model", json.dumps({"model": model_id, "hedged": stream_model_id != attempt_model_id}))
+        
+        async for delta in deltas:
+            chunks.append(delta)
+            yield format_sse("token", json.dumps({"delta": delta}))
+            for path, value in parser.feed(delta):
+                yield format_sse("field", json.dumps({"path": path, "value": value}))
+        
+        # Parsing happened as the deltas arrived, so only the repairs are recorded
+        try:
+            with tracing.span("parse", model=model_id):
+                parsed_response = parser.close()
+        except ValueError:
+            metrics.observe_parse(None, parser.repairs, failed=True)
+            model_manager.record_parse(model_id, False)
+            raise
+        metrics.observe_parse(None, parser.repairs)
+        model_manager.record_parse(model_id, True)
+        with tracing.span("validate"):
+            result = build_result(parsed_response)
+        if request is not None:
+            # Only the first model's budget is known here; a hedge's is a similar size
+            observe_completion(request, "".join(chunks), max_tokens)
+        semantic_cache_store(request, "".join(chunks), model_id)
+        await library_save(request, result, model_id)
+        yield format_sse("result", result.model_dump_json())
+    except ValueError as e:
+        yield format_sse("error", json.dumps({"status": 400, "detail": f"Failed to parse AI response: {str(e)}"}))
+    except CircuitOpenError as e:
+        yield format_sse("error", json.dumps({"status": 503, "detail": str(e), "retry_after": e.retry_after}))
+    except Exception as e:
+        if streaming or not isinstance(e, UpstreamError):
+            record_model_failure(model_id, e)
+        yield format_sse("error", json.dumps({"status": 500, "detail": f"Failed to generate content: {str(e)}"}))
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap an SSE event stream in a response that proxies will not buffer"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate/lesson", response_model=LessonResult)
+async def generate_lesson(request: LessonRequest, stream: bool = Query(False), reuse: bool = Query(False)):
+    """Generate a lesson plan based on the provided parameters; with reuse, return a stored result for an equivalent request if there is one"""
+    try:
+        library_record_request(request)
+        if reuse:
+            reused = await reused_response(request, stream)
+            if reused is not None:
+                return reused
+        
+        with tracing.span("build_prompt"):
+            prompt = await build_prompt_off_loop(build_lesson_prompt, request)
         
         # Get the best model to use - either the requested one or a substitute if rate limited
-        model_id = model_manager.get_best_model(request.model)
+        with tracing.span("select_model", requested=request.model) as span:
+            model_id = model_manager.get_best_model(request.model)
+            span.set_attribute("model", model_id)
         
         # If we're using a different model than requested, log it
         if model_id != request.model:
@@ -162,306 +630,240 @@ async def generate_lesson(request: LessonRequest):
         if not model:
             raise HTTPException(status_code=400, detail=f"Invalid model ID: {model_id}")
             
-        # Calculate optimal max_tokens based on model's context length
-        # For very large models, we can use more tokens for output
-        context_length = model["context_length"]
-        max_tokens = min(8000, context_length // 4)  # Cap at 8000 but use up to 1/4 of context window
+        max_tokens = budget_max_tokens(request, model, prompt)
         
-        # Special case for the largest models
-        if context_length >= 500000:  # For models like Llama 4 Scout and Gemini
-            max_tokens = min(12000, context_length // 8)  # Allow up to 12K tokens for massive models
-            
-        try:
-            response = await generate_content(
-                prompt=prompt,
-                model_id=model_id,
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
-            
-            parsed_response = sanitize_and_parse_json(response)
+        if stream:
+            return sse_response(stream_generation(
+                prompt, model_id, max_tokens,
+                lambda parsed: build_lesson_result(parsed, request),
+                request
+            ))
             
-            # Ensure the plan is a string
-            if parsed_response.get("plan") and not isinstance(parsed_response["plan"], str):
-                parsed_response["plan"] = str(parsed_response["plan"])
-            
-            # Create the lesson result
-            lesson_result = LessonResult(
-                id=f"lesson-{uuid.uuid4()}",
-                title=parsed_response.get("title", f"{request.topic} - Lesson Plan"),
-                gradeLevel=parsed_response.get("gradeLevel", request.gradeLevel),
-                subject=parsed_response.get("subject", request.topic.split(" ")[0]),
-                duration=parsed_response.get("duration", request.duration),
-                overview=parsed_response.get("overview", "Overview not generated."),
-                objectives=parsed_response.get("objectives", []),
-                materials=parsed_response.get("materials", []),
-                plan=parsed_response.get("plan", "Plan not generated."),
-                assessment=parsed_response.get("assessment", "Assessment not generated."),
-                questions=parsed_response.get("questions", []),
-                tags=parsed_response.get("tags", [request.topic.split(" ")[0], request.gradeLevel, "Lesson Plan"]),
-                createdAt=datetime.now().isoformat()
-            )
-            
-            return lesson_result
-        except Exception as model_error:
-            # Record the error for this model
-            model_manager.record_error(model_id)
-            
-            # Check if this is a rate limit error
-            error_message = str(model_error).lower()
-            if "rate limit" in error_message or "429" in error_message:
-                logger.warning(f"Rate limit error for model {model_id}, trying another model")
-                
-                # Try with a different model instead
-                alternative_model_id = model_manager.get_best_model()
-                if alternative_model_id != model_id:
-                    logger.info(f"Retrying with alternative model {alternative_model_id}")
-                    
-                    # Update the request and call ourselves again
-                    request.model = alternative_model_id
-                    return await generate_lesson(request)
-            
-            # If not a rate limit or retry failed, raise the original error
-            raise model_error
+        # Failures are retried, on another model if need be, by generate_result
+        return await generate_result(
+            prompt, model_id, max_tokens,
+            lambda parsed: build_lesson_result(parsed, request),
+            request
+        )
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise circuit_open_error(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse AI response: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate lesson: {str(e)}")
 
 @app.post("/generate/assessment", response_model=AssessmentResult)
-async def generate_assessment(request: AssessmentRequest):
-    """Generate an assessment based on the provided parameters"""
+async def generate_assessment(request: AssessmentRequest, stream: bool = Query(False), reuse: bool = Query(False)):
+    """Generate an assessment based on the provided parameters; with reuse, return a stored result for an equivalent request if there is one"""
     try:
-        prompt = f"""
-        Create a detailed assessment about "{request.topic}" for grade level "{request.gradeLevel}" with {request.numberOfQuestions} questions.
-        Question types to include: {", ".join(request.questionTypes)}
-        Bloom's taxonomy levels to target: {", ".join(request.bloomsLevels)}
-        {f"Additional instructions: {request.additionalInstructions}" if request.additionalInstructions else ""}
+        library_record_request(request)
+        if reuse:
+            reused = await reused_response(request, stream)
+            if reused is not None:
+                return reused
         
-        EXTREMELY IMPORTANT: 
-        - EVERY question MUST include an "answer" field with the correct answer.
-        - For multiple-choice questions, the "answer" MUST be the FULL TEXT of the correct option, not just A, B, C, D.
-        - For true-false questions, the "answer" MUST be either "True" or "False".
-        - For short-answer and essay questions, provide a sample correct answer.
-        - Do not skip providing an answer for ANY question type.
+        with tracing.span("build_prompt"):
+            prompt = build_assessment_prompt(request)
         
-        Format your response as a JSON object with the following structure:
-        {{
-            "title": "Descriptive title for the assessment",
-            "gradeLevel": "{request.gradeLevel}",
-            "instructions": "Instructions for taking the assessment",
-            "questions": [
-                {{
-                    "text": "Question text",
-                    "type": "one of: multiple-choice, true-false, short-answer, essay",
-                    "options": ["option 1", "option 2", "option 3", "option 4"] (for multiple-choice and true-false only),
-                    "answer": "FULL TEXT of the correct answer - THIS IS REQUIRED FOR ALL QUESTIONS",
-                    "bloomsLevel": "Targeted Bloom's level"
-                }},
-                ...
-            ],
-            "tags": ["relevant", "tags", "for", "this", "assessment"]
-        }}
-
-        IMPORTANT: Your response must be a valid JSON object with no additional text before or after. EVERY QUESTION MUST HAVE AN ANSWER FIELD FILLED IN.
-        """
+        # Get the best model to use - either the requested one or a substitute if rate limited
+        with tracing.span("select_model", requested=request.model) as span:
+            model_id = model_manager.get_best_model(request.model)
+            span.set_attribute("model", model_id)
         
-        model = get_model_by_id(request.model)
+        model = get_model_by_id(model_id)
         if not model:
-            raise HTTPException(status_code=400, detail=f"Invalid model ID: {request.model}")
+            raise HTTPException(status_code=400, detail=f"Invalid model ID: {model_id}")
             
-        # Calculate optimal max_tokens based on model's context length
-        # For very large models, we can use more tokens for output
-        context_length = model["context_length"]
-        max_tokens = min(8000, context_length // 4)  # Cap at 8000 but use up to 1/4 of context window
+        max_tokens = budget_max_tokens(request, model, prompt)
         
-        # Special case for the largest models
-        if context_length >= 500000:  # For models like Llama 4 Scout and Gemini
-            max_tokens = min(12000, context_length // 8)  # Allow up to 12K tokens for massive models
+        if stream:
+            return sse_response(stream_generation(
+                prompt, model_id, max_tokens,
+                lambda parsed: build_assessment_result(parsed, request),
+                request
+            ))
             
-        response = await generate_content(
-            prompt=prompt,
-            model_id=request.model,
-            temperature=0.7,
-            max_tokens=max_tokens
-        )
-        
-        parsed_response = sanitize_and_parse_json(response)
-        
-        # Validate and ensure answers are present for each question
-        questions = parsed_response.get("questions", [])
-        
-        # Debug logging for questions and answers
-        print(f"Assessment generated with {len(questions)} questions")
-        for i, question in enumerate(questions):
-            answer = question.get("answer")
-            print(f"Question {i+1} ({question.get('type')}): Answer present: {answer is not None}, Answer: {answer}")
-        
-        for question in questions:
-            # Ensure each question has an answer field
-            if "answer" not in question or not question["answer"]:
-                # For multiple-choice, default to the first option if no answer provided
-                if question.get("type") == "multiple-choice" and question.get("options"):
-                    question["answer"] = question["options"][0]
-                    print(f"Setting default answer for multiple-choice: {question['answer']}")
-                # For true-false, default to "True" if no answer provided
-                elif question.get("type") == "true-false":
-                    question["answer"] = "True"
-                    print(f"Setting default answer for true-false: True")
-                # For other types, provide a placeholder answer
-                else:
-                    question["answer"] = "Sample answer placeholder - requires manual input"
-                    print(f"Setting default answer placeholder for {question.get('type')}")
-            # For multiple choice, ensure the answer is the full text of an option, not just a letter
-            elif question.get("type") == "multiple-choice" and question.get("options"):
-                options = question.get("options", [])
-                answer = question.get("answer", "")
-                
-                # Check if the answer is just a letter like "A", "B", "C", "D"
-                if len(answer) == 1 and answer.upper() in "ABCD":
-                    # Convert letter to index (A=0, B=1, etc.)
-                    index = ord(answer.upper()) - ord('A')
-                    # Make sure index is valid
-                    if 0 <= index < len(options):
-                        question["answer"] = options[index]
-                        print(f"Converting letter answer '{answer}' to full text: '{question['answer']}'")
-                # Also check for answers like "(A)" or "A)"
-                elif (len(answer) <= 3 and 
-                      (answer.upper().startswith("(") or answer.upper().endswith(")")) and
-                      any(letter in answer.upper() for letter in "ABCD")):
-                    # Extract the letter
-                    letter = ''.join(c for c in answer.upper() if c in "ABCD")
-                    index = ord(letter) - ord('A')
-                    # Make sure index is valid
-                    if 0 <= index < len(options):
-                        question["answer"] = options[index]
-                        print(f"Converting parenthesized letter answer '{answer}' to full text: '{question['answer']}'")
-                # If answer is not in the options, default to the first option
-                elif answer not in options:
-                    print(f"Answer '{answer}' not found in options, setting to first option")
-                    question["answer"] = options[0]
-        
-        # Create the assessment result
-        assessment_result = AssessmentResult(
-            id=f"assessment-{uuid.uuid4()}",
-            title=parsed_response.get("title", f"{request.topic} Assessment"),
-            gradeLevel=parsed_response.get("gradeLevel", request.gradeLevel),
-            instructions=parsed_response.get("instructions", f"This assessment covers key concepts related to {request.topic}."),
-            questions=questions,
-            tags=parsed_response.get("tags", [request.topic.split(" ")[0], request.gradeLevel, *request.bloomsLevels]),
-            createdAt=datetime.now().isoformat()
+        return await generate_result(
+            prompt, model_id, max_tokens,
+            lambda parsed: build_assessment_result(parsed, request),
+            request
         )
-        
-        return assessment_result
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise circuit_open_error(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse AI response: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate assessment: {str(e)}")
 
 @app.post("/generate/lab", response_model=Lab)
-async def generate_lab(request: LabRequest):
-    """Generate a virtual lab based on the provided parameters"""
+async def generate_lab(request: LabRequest, stream: bool = Query(False), reuse: bool = Query(False)):
+    """Generate a virtual lab based on the provided parameters; with reuse, return a stored result for an equivalent request if there is one"""
     try:
-        prompt = f"""
-        Create a detailed virtual lab about "{request.topic}" for grade level "{request.gradeLevel}".
-        {f"Additional notes: {request.additionalNotes}" if request.additionalNotes else ""}
+        library_record_request(request)
+        if reuse:
+            reused = await reused_response(request, stream)
+            if reused is not None:
+                return reused
         
-        Format your response as a JSON object with the following structure:
-        {{
-            "title": "Descriptive title for the lab",
-            "description": "Brief description of the lab (1-2 sentences)",
-            "category": "science category (physics, chemistry, biology, earth, etc.)",
-            "gradeLevel": "{request.gradeLevel}",
-            "objectives": ["learning objective 1", "learning objective 2", ...],
-            "steps": [
-                {{
-                    "title": "Step 1 title",
-                    "description": "Detailed description of step 1"
-                }},
-                ...
-            ],
-            "questions": [
-                {{
-                    "text": "Question to consider during the lab",
-                    "hint": "Optional hint for the question"
-                }},
-                ...
-            ],
-            "tags": ["relevant", "tags", "for", "this", "lab"]
-        }}
-
-        IMPORTANT: Your response must be a valid JSON object with no additional text before or after.
-        """
+        with tracing.span("build_prompt"):
+            prompt = await build_prompt_off_loop(build_lab_prompt, request)
+        
+        # Get the best model to use - either the requested one or a substitute if rate limited
+        with tracing.span("select_model", requested=request.model) as span:
+            model_id = model_manager.get_best_model(request.model)
+            span.set_attribute("model", model_id)
         
-        model = get_model_by_id(request.model)
+        model = get_model_by_id(model_id)
         if not model:
-            raise HTTPException(status_code=400, detail=f"Invalid model ID: {request.model}")
+            raise HTTPException(status_code=400, detail=f"Invalid model ID: {model_id}")
             
-        # Calculate optimal max_tokens based on model's context length
-        # For very large models, we can use more tokens for output
-        context_length = model["context_length"]
-        max_tokens = min(8000, context_length // 4)  # Cap at 8000 but use up to 1/4 of context window
+        max_tokens = budget_max_tokens(request, model, prompt)
         
-        # Special case for the largest models
-        if context_length >= 500000:  # For models like Llama 4 Scout and Gemini
-            max_tokens = min(12000, context_length // 8)  # Allow up to 12K tokens for massive models
+        if stream:
+            return sse_response(stream_generation(
+                prompt, model_id, max_tokens,
+                lambda parsed: build_lab_result(parsed, request),
+                request
+            ))
             
-        response = await generate_content(
-            prompt=prompt,
-            model_id=request.model,
-            temperature=0.7,
-            max_tokens=max_tokens
+        return await generate_result(
+            prompt, model_id, max_tokens,
+            lambda parsed: build_lab_result(parsed, request),
+            request
         )
-        
-        parsed_response = sanitize_and_parse_json(response)
-        
-        # For labs, we'll use preset thumbnails and URLs based on the category
-        lab_resources = {
-            "physics": {
-                "thumbnail": "https://phet.colorado.edu/sims/html/circuit-construction-kit-dc/latest/circuit-construction-kit-dc-600.png",
-                "url": "https://phet.colorado.edu/sims/html/circuit-construction-kit-dc/latest/circuit-construction-kit-dc_en.html"
-            },
-            "chemistry": {
-                "thumbnail": "https://phet.colorado.edu/sims/html/balancing-chemical-equations/latest/balancing-chemical-equations-600.png",
-                "url": "https://phet.colorado.edu/sims/html/balancing-chemical-equations/latest/balancing-chemical-equations_en.html"
-            },
-            "biology": {
-                "thumbnail": "https://cdn.britannica.com/31/123131-050-8BA9CC21/animal-cell.jpg",
-                "url": "https://learn.genetics.utah.edu/content/cells/insideacell/"
-            },
-            "earth": {
-                "thumbnail": "https://phet.colorado.edu/sims/html/plate-tectonics/latest/plate-tectonics-600.png",
-                "url": "https://phet.colorado.edu/sims/html/plate-tectonics/latest/plate-tectonics_en.html"
-            }
-        }
-
-        category = parsed_response.get("category", "").lower() or "physics"
-        resources = lab_resources.get(category, lab_resources["physics"])
-        
-        # Create the lab result
-        lab_result = Lab(
-            id=f"lab-{uuid.uuid4()}",
-            title=parsed_response.get("title", f"{request.topic} Lab"),
-            description=parsed_response.get("description", f"An interactive lab about {request.topic}."),
-            category=parsed_response.get("category", "physics").lower(),
-            gradeLevel=parsed_response.get("gradeLevel", request.gradeLevel),
-            thumbnail=resources["thumbnail"],
-            url=resources["url"],
-            objectives=parsed_response.get("objectives", []),
-            steps=parsed_response.get("steps", []),
-            questions=parsed_response.get("questions", []),
-            tags=parsed_response.get("tags", [request.topic.split(" ")[0], request.gradeLevel, "Lab"])
-        )
-        
-        return lab_result
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise circuit_open_error(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse AI response: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate lab: {str(e)}")
 
+# Request model, prompt builder and result builder for each batch item kind
+BATCH_KINDS = GENERATION_KINDS
+
+# Concurrency limits shared by every batch in this worker
+batch_runner = BatchRunner()
+
+async def generate_batch_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generate one batch item on the best available model
+    
+    Args:
+        item: The item kind and its validated request
+        
+    Returns:
+        The model used and the result as a dict
+    """
+    _, build_prompt, build_result = BATCH_KINDS[item["kind"]]
+    request = item["request"]
+    library_record_request(request)
+    
+    # Chosen when the item starts, so items spread over whichever models are healthy then
+    model_id = model_manager.get_best_model(request.model)
+    model = get_model_by_id(model_id)
+    if not model:
+        raise HTTPException(status_code=400, detail=f"Invalid model ID: {model_id}")
+    
+    prompt = await build_prompt_off_loop(build_prompt, request)
+    async with batch_runner.model_slot(model_id):
+        # Upstream failures are counted and retried by generate_result
+        result = await generate_result(
+            prompt, model_id, budget_max_tokens(request, model, prompt),
+            lambda parsed: build_result(parsed, request),
+            request
+        )
+    
+    return {"model": model_id, "result": result.model_dump(mode="json")}
+
+def batch_item_error(error: Exception) -> Dict[str, Any]:
+    """Describe a failed batch item the way the single-item endpoints would"""
+    if isinstance(error, HTTPException):
+        return {"status": error.status_code, "detail": error.detail}
+    if isinstance(error, ValidationError):
+        return {"status": 422, "detail": error.errors(include_url=False)}
+    if isinstance(error, CircuitOpenError):
+        return {"status": 503, "detail": str(error), "retry_after": error.retry_after}
+    if isinstance(error, ValueError):
+        return {"status": 400, "detail": f"Failed to parse AI response: {str(error)}"}
+    return {"status": 500, "detail": f"Failed to generate content: {str(error)}"}
+
+async def stream_batch(items: List[BatchItem]) -> AsyncIterator[str]:
+    """
+    Generate batch items concurrently, streaming each result as it completes
+    
+    Emits a "start" event, an "item" event per item (in completion order,
+    with the item's index and client id) and a final "done" event.
+    
+    Args:
+        items: The batch items
+        
+    Yields:
+        Encoded SSE events
+    """
+    started = time.monotonic()
+    yield format_sse("start", json.dumps({"items": len(items)}))
+    
+    def item_event(index: int, outcome: Dict[str, Any], duplicate_of: Optional[int] = None) -> str:
+        item = items[index]
+        event = {"index": index, "id": item.id, "kind": item.kind, **outcome}
+        if duplicate_of is not None:
+            event["duplicate_of"] = duplicate_of
+        return format_sse("item", json.dumps(event))
+    
+    # Validate each item on its own so one bad item doesn't reject the batch
+    valid = []
+    failed = 0
+    for index, item in enumerate(items):
+        try:
+            request = BATCH_KINDS[item.kind][0](**item.request)
+        except ValidationError as e:
+            failed += 1
+            yield item_event(index, {"status": "failed", "error": batch_item_error(e)})
+            continue
+        valid.append({"index": index, "kind": item.kind, "request": request})
+    
+    async for indices, succeeded, outcome in batch_runner.run(
+        valid,
+        # Identical items are generated once
+        lambda item: item["kind"] + ":" + item["request"].model_dump_json(),
+        generate_batch_item
+    ):
+        if succeeded:
+            outcome = {"status": "succeeded", **outcome}
+        else:
+            failed += len(indices)
+            outcome = {"status": "failed", "error": batch_item_error(outcome)}
+        first = valid[indices[0]]["index"]
+        for position in indices:
+            index = valid[position]["index"]
+            yield item_event(index, outcome, duplicate_of=first if index != first else None)
+    
+    yield format_sse("done", json.dumps({
+        "items": len(items),
+        "succeeded": len(items) - failed,
+        "failed": failed,
+        "elapsed": round(time.monotonic() - started, 3)
+    }))
+
+@app.post("/generate/batch")
+async def generate_batch(batch: BatchRequest):
+    """Generate a mix of lessons, assessments and labs, streaming results as they complete"""
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="A batch needs at least one item")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {BATCH_MAX_ITEMS} items")
+    
+    return sse_response(stream_batch(batch.items))
+
 @app.post("/generate/teaching-tip")
 async def generate_teaching_tip(request: TeachingTipRequest):
     """Generate a teaching tip for the specified subject"""
@@ -486,12 +888,12 @@ async def generate_teaching_tip(request: TeachingTipRequest):
         subject_key = request.subject.lower()
         cache_key = f"{subject_key}:{model_id}"
         
-        if cache_key in TEACHING_TIP_CACHE:
-            cache_entry = TEACHING_TIP_CACHE[cache_key]
-            # If cache is still valid (less than 24 hours old)
-            if time.time() - cache_entry["timestamp"] < CACHE_EXPIRY:
-                logger.info(f"Using cached teaching tip for subject: {subject_key}")
-                return {"tip": cache_entry["tip"]}
+        cache_entry = TEACHING_TIP_CACHE.get(cache_key)
+        if cache_entry is not None:
+            logger.info(f"Using cached teaching tip for subject: {subject_key}")
+            if cache_entry.get("is_fallback"):
+                return {"tip": cache_entry["tip"], "source": "fallback"}
+            return {"tip": cache_entry["tip"]}
         
         # Create a well-formatted prompt
         prompt = f"""
@@ -506,90 +908,69 @@ async def generate_teaching_tip(request: TeachingTipRequest):
         # Log the request
         logger.info(f"Generating teaching tip for subject: {request.subject} using model: {model_id}")
 
-        # Call the OpenRouter API
-        try:
-            response = await generate_content(
-                prompt=prompt,
-                model_id=model_id,
-                system_prompt=get_system_prompt("education"),
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
-            
+        async def attempt(attempt_model_id: str) -> str:
+            try:
+                response = await generate_content(
+                    prompt=prompt,
+                    model_id=attempt_model_id,
+                    system_prompt=get_system_prompt("education"),
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+            except UpstreamError as e:
+                record_model_failure(attempt_model_id, e)
+                raise
             # Validate the response is not empty
             if not response or not response.strip():
                 logger.warning("Empty response received from model")
                 raise ValueError("Empty response received from model")
-                
-            # Save to cache
-            TEACHING_TIP_CACHE[cache_key] = {
-                "tip": response.strip(),
-                "timestamp": time.time()
-            }
-            
-            # Trim cache if it gets too large (keep most recent 100 entries)
-            if len(TEACHING_TIP_CACHE) > 100:
-                # Sort by timestamp and keep only the most recent entries
-                sorted_keys = sorted(TEACHING_TIP_CACHE.keys(), 
-                                    key=lambda k: TEACHING_TIP_CACHE[k]["timestamp"], 
-                                    reverse=True)
-                # Remove oldest entries
-                for key in sorted_keys[100:]:
-                    del TEACHING_TIP_CACHE[key]
-            
-            # Return the response
-            result = {"tip": response.strip()}
-            logger.info(f"Successfully generated teaching tip: {result['tip'][:50]}...")
-            return result
-            
-        except Exception as api_error:
-            # Record the error for this model
-            model_manager.record_error(model_id)
-            
-            error_message = str(api_error).lower()
-            logger.error(f"Error during API call: {error_message}")
+            return response
+
+        # Call the OpenRouter API, retrying on other models if needed
+        try:
+            response = await retry_policy.run(model_id, attempt, retry_alternative)
+        except (RateLimitError, CircuitOpenError) as api_error:
+            # Every model we could try is out of capacity: use a fallback tip
+            logger.warning(f"No model available for teaching tip: {api_error}")
+            subject = request.subject.lower()
             
-            # Check if this is a rate limit error
-            if "rate limit" in error_message or "429" in error_message:
-                logger.warning(f"Rate limit error for model {model_id}")
-                
-                # Try with a different model if this was a rate limit error
-                if model_id == request.model:  # Only retry once to avoid loops
-                    alternative_model_id = model_manager.get_best_model(exclude_models=[model_id])
-                    if alternative_model_id != model_id:
-                        logger.info(f"Retrying with alternative model {alternative_model_id}")
-                        request.model = alternative_model_id
-                        return await generate_teaching_tip(request)
-                
-                # If retry not possible or this was already a retry, use fallback
-                subject = request.subject.lower()
-                
-                # Find the most relevant tip based on subject
-                tip = None
-                for key, value in FALLBACK_TIPS.items():
-                    if key in subject:
-                        tip = value
-                        break
-                        
-                # If no specific match, use the general education tip
-                if not tip:
-                    tip = FALLBACK_TIPS["education"]
-                
-                # Save fallback tip to cache with shorter expiration (4 hours)
-                TEACHING_TIP_CACHE[cache_key] = {
-                    "tip": tip,
-                    "timestamp": time.time(),
-                    "is_fallback": True
-                }
+            # Find the most relevant tip based on subject
+            tip = None
+            for key, value in FALLBACK_TIPS.items():
+                if key in subject:
+                    tip = value
+                    break
                     
-                logger.info(f"Returning fallback teaching tip for subject: {subject}")
-                return {"tip": tip, "source": "fallback"}
+            # If no specific match, use the general education tip
+            if not tip:
+                tip = FALLBACK_TIPS["education"]
             
-            # For other errors, propagate the error
+            # Save fallback tip to cache with shorter expiration (4 hours)
+            TEACHING_TIP_CACHE.put(cache_key, {
+                "tip": tip,
+                "timestamp": time.time(),
+                "is_fallback": True
+            }, ttl=FALLBACK_TIP_EXPIRY)
+                
+            logger.info(f"Returning fallback teaching tip for subject: {subject}")
+            return {"tip": tip, "source": "fallback"}
+        except Exception as api_error:
+            logger.error(f"Error during API call: {str(api_error)}")
             raise HTTPException(
                 status_code=502,
                 detail=f"Error communicating with AI model: {str(api_error)}"
             )
+            
+        # Save to cache
+        TEACHING_TIP_CACHE.put(cache_key, {
+            "tip": response.strip(),
+            "timestamp": time.time()
+        })
+        
+        # Return the response
+        result = {"tip": response.strip()}
+        logger.info(f"Successfully generated teaching tip: {result['tip'][:50]}...")
+        return result
 
     except HTTPException:
         # Re-raise HTTP exceptions directly
@@ -607,46 +988,237 @@ async def generate_teaching_tip(request: TeachingTipRequest):
 async def health_check():
     return {"status": "ok"} 
 
+def job_handler(endpoint: Callable, request_model: Callable[..., BaseModel]):
+    """
+    Build a job handler that runs a generation endpoint
+    
+    Args:
+        endpoint: The endpoint function, e.g. generate_lesson
+        request_model: The endpoint's request model
+        
+    Returns:
+        Coroutine function taking the request as a dict and returning the result as a dict
+    """
+    async def handler(request: Dict[str, Any]) -> Dict[str, Any]:
+        # Jobs run outside any request, so each gets its own id and trace
+        tracing.set_request_id()
+        with tracing.start_trace(f"job {endpoint.__name__}", kind="internal"):
+            result = await endpoint(request_model(**request), stream=False, reuse=False)
+        return result.model_dump(mode="json")
+    return handler
+
+job_queue.register("lesson", job_handler(generate_lesson, LessonRequest))
+job_queue.register("assessment", job_handler(generate_assessment, AssessmentRequest))
+job_queue.register("lab", job_handler(generate_lab, LabRequest))
+
+async def submit_job(
+    kind: str,
+    request: BaseModel,
+    response: Response,
+    priority: int,
+    callback_url: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Queue a generation job, answering 429 with Retry-After if the queue is full
+    
+    Args:
+        kind: The job kind
+        request: The validated generation request
+        response: The response, to set the Location header on
+        priority: 0 (lowest) to 9 (highest)
+        callback_url: Optional URL to POST the finished job to
+        
+    Returns:
+        The queued job
+    """
+    if callback_url:
+        try:
+            await check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        job = job_queue.submit(kind, request.model_dump(mode="json"), priority, callback_url)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return public_job(job)
+
+@app.post("/jobs/lesson", response_model=Job, status_code=202)
+async def submit_lesson_job(
+    request: LessonRequest,
+    response: Response,
+    priority: int = Query(DEFAULT_PRIORITY, ge=MIN_PRIORITY, le=MAX_PRIORITY),
+    callback_url: Optional[str] = Query(None)
+):
+    """Queue a lesson plan generation; poll /jobs/{id} or wait for the callback"""
+    return await submit_job("lesson", request, response, priority, callback_url)
+
+@app.post("/jobs/assessment", response_model=Job, status_code=202)
+async def submit_assessment_job(
+    request: AssessmentRequest,
+    response: Response,
+    priority: int = Query(DEFAULT_PRIORITY, ge=MIN_PRIORITY, le=MAX_PRIORITY),
+    callback_url: Optional[str] = Query(None)
+):
+    """Queue an assessment generation; poll /jobs/{id} or wait for the callback"""
+    return await submit_job("assessment", request, response, priority, callback_url)
+
+@app.post("/jobs/lab", response_model=Job, status_code=202)
+async def submit_lab_job(
+    request: LabRequest,
+    response: Response,
+    priority: int = Query(DEFAULT_PRIORITY, ge=MIN_PRIORITY, le=MAX_PRIORITY),
+    callback_url: Optional[str] = Query(None)
+):
+    """Queue a virtual lab generation; poll /jobs/{id} or wait for the callback"""
+    return await submit_job("lab", request, response, priority, callback_url)
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """Get the status of a generation job, and its result once finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return public_job(job)
+
+def get_content_library():
+    """The content library, or 503 if it is disabled"""
+    if CONTENT_LIBRARY is None:
+        raise HTTPException(status_code=503, detail="The content library is disabled (LIBRARY_ENABLED)")
+    return CONTENT_LIBRARY
+
+@app.get("/library")
+async def search_library(
+    q: Optional[str] = Query(None, description="Words to search titles, topics, subjects, tags and summaries for"),
+    kind: Optional[str] = Query(None, pattern="^(lesson|assessment|lab)$"),
+    subject: Optional[str] = Query(None),
+    gradeLevel: Optional[str] = Query(None),
+    tag: Optional[str] = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(LIBRARY_PAGE_SIZE, ge=1, le=LIBRARY_MAX_PAGE_SIZE)
+):
+    """Search previously generated lessons, assessments and labs"""
+    library = get_content_library()
+    with tracing.span("library_search"):
+        return await asyncio.to_thread(library.search, q, kind, subject, gradeLevel, tag, page, page_size)
+
+@app.get("/library/{content_id}")
+async def get_library_content(content_id: str):
+    """Get a previously generated result with the request that produced it"""
+    library = get_content_library()
+    with tracing.span("library_get"):
+        content = await asyncio.to_thread(library.get, content_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Content not found: {content_id}")
+    return content
+
+PROCESS_STARTED = time.time()
+
+def get_process_stats() -> Dict[str, Any]:
+    """
+    Get this worker process's id, uptime and memory use
+
+    Reads /proc/self/statm where available (Linux); elsewhere falls back to
+    peak RSS from getrusage, which is all the platform offers.
+
+    Returns:
+        Dictionary with pid, uptime in seconds and RSS in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss = peak if sys.platform == "darwin" else peak * 1024
+    return {
+        "pid": os.getpid(),
+        "uptime": time.time() - PROCESS_STARTED,
+        "rss_bytes": rss,
+    }
+
+@app.get("/status/process")
+async def process_status():
+    """
+    Get process and cache counters for the worker that answers
+
+    Unlike /status this makes no upstream call, so load tests can poll it.
+    Counters are per worker: with several workers, poll until every pid has
+    been seen.
+    """
+    return {
+        "process": get_process_stats(),
+        "inflight": INFLIGHT_REQUESTS.stats(),
+        "cache": {
+            "responses": RESPONSE_CACHE.stats(),
+            "teaching_tips": TEACHING_TIP_CACHE.stats(),
+        },
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Get metrics in the Prometheus text format, summed over every worker"""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/status/pool")
+async def http_pool_status():
+    """Get connection pool statistics for the shared OpenRouter client"""
+    return http_client.get_pool_stats()
+
 @app.get("/status")
 async def api_status():
-    """Get comprehensive API status including rate limits and model availability"""
+    """
+    Get comprehensive API status including rate limits and model availability
+
+    Makes no upstream call: model availability comes from the health table
+    kept up to date by the background prober (see app/health.py).
+    """
     try:
-        # Test connection to OpenRouter with minimal call
-        test_model = "meta-llama/llama-4-scout:free"
-        test_prompt = "echo 'ok'"
+        model_health = health_prober.snapshot()
         
-        try:
-            # Try a minimal API call
-            await generate_content(
-                prompt=test_prompt,
-                model_id=test_model,
-                max_tokens=10,
-                temperature=0.1
-            )
-            openrouter_status = "ok"
-        except Exception as e:
-            error_message = str(e).lower()
-            if "rate limit" in error_message or "429" in error_message:
-                openrouter_status = "rate_limited"
-            else:
-                openrouter_status = "error"
-            
         # Compile comprehensive status
         status = {
             "api": {
                 "status": "ok",
                 "timestamp": datetime.now().isoformat(),
-                "uptime": "unknown",  # Could be implemented with server start time
+                "started_at": datetime.fromtimestamp(PROCESS_STARTED).isoformat(),
+                "uptime": time.time() - PROCESS_STARTED,
             },
+            "process": get_process_stats(),
             "openrouter": {
-                "status": openrouter_status,
+                "status": health_prober.overall_status(model_health),
                 "models_count": len(get_available_models()),
                 "recommended_models": RECOMMENDED_MODELS,
+                "models": model_health,
+                "prober": health_prober.stats(),
             },
             "model_manager": model_manager.get_model_stats(),
+            "http_pool": http_client.get_pool_stats(),
+            "inflight": INFLIGHT_REQUESTS.stats(),
+            "hedging": hedger.stats(),
+            "retry": retry_policy.stats(),
+            "prewarm": prewarmer.stats() if prewarmer is not None else {"enabled": False},
+            "concurrency": concurrency_limiter.stats() if CONCURRENCY_LIMIT_ENABLED else {"enabled": False},
+            "jobs": job_queue.stats(),
+            "batch": batch_runner.stats(),
+            "tracing": tracing.get_tracing_stats(),
+            "token_budget": TOKEN_BUDGET.stats(),
+            "rag": get_rag_stats(),
+            "library": CONTENT_LIBRARY.stats() if CONTENT_LIBRARY is not None else {"enabled": False},
+            "semantic_cache": SEMANTIC_CACHE.stats() if SEMANTIC_CACHE is not None else {"enabled": False},
             "cache": {
+                "responses": RESPONSE_CACHE.stats(),
                 "teaching_tips": {
-                    "size": len(TEACHING_TIP_CACHE),
+                    **TEACHING_TIP_CACHE.stats(),
                     "subjects": list(set(key.split(":")[0] for key in TEACHING_TIP_CACHE.keys())),
                 }
             }
@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Callable, Awaitable, AsyncIterator, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.batch")
+
+T = TypeVar("T")
+
+# Batch configuration
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+# Items generating at once across all batches in a worker process
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Items generating at once with any one model
+BATCH_CONCURRENCY_PER_MODEL = int(os.getenv("BATCH_CONCURRENCY_PER_MODEL", "3"))
+
+
+class BatchRunner:
+    """
+    Runs the items of batch requests concurrently, within concurrency limits
+
+    Identical items in a batch run once and share their outcome. Outcomes
+    are yielded as each item finishes, not in request order, and an item
+    that fails doesn't stop the others. The limits are shared by every
+    batch running in the process.
+    """
+
+    def __init__(self, concurrency: int = BATCH_CONCURRENCY, per_model: int = BATCH_CONCURRENCY_PER_MODEL):
+        """
+        Initialize the runner
+
+        Args:
+            concurrency: Most items running at once
+            per_model: Most items running at once with one model
+        """
+        self.concurrency = concurrency
+        self.per_model = per_model
+        self._slots = asyncio.Semaphore(concurrency)
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        self.items = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    @asynccontextmanager
+    async def model_slot(self, model_id: str) -> AsyncIterator[None]:
+        """
+        Hold one of a model's concurrency slots
+
+        Args:
+            model_id: The model about to be called
+        """
+        semaphore = self._model_slots.get(model_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_model)
+            self._model_slots[model_id] = semaphore
+        async with semaphore:
+            yield
+
+    async def run(
+        self,
+        items: List[T],
+        key: Callable[[T], str],
+        work: Callable[[T], Awaitable[Any]]
+    ) -> AsyncIterator[Tuple[List[int], bool, Any]]:
+        """
+        Run every item, yielding outcomes as they complete
+
+        Args:
+            items: The batch items
+            key: Returns the same string for items that are identical
+            work: Runs one item and returns its result
+
+        Yields:
+            (indices of the items sharing the outcome, succeeded, result or exception)
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(key(item), []).append(index)
+        self.items += len(items)
+        self.deduplicated += len(items) - len(groups)
+
+        async def run_group(indices: List[int]) -> Tuple[List[int], bool, Any]:
+            async with self._slots:
+                try:
+                    return indices, True, await work(items[indices[0]])
+                except Exception as e:
+                    self.failed += 1
+                    return indices, False, e
+
+        tasks = [asyncio.ensure_future(run_group(indices)) for indices in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The client went away: stop the items still running
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batch statistics
+
+        Returns:
+            Dictionary with limits and item counters
+        """
+        return {
+            "concurrency": self.concurrency,
+            "per_model": self.per_model,
+            "items": self.items,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+        }
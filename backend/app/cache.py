@@ -0,0 +1,421 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable
+
+from dotenv import load_dotenv
+
+from .lru_cache import LRUCache
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.cache")
+
+# Response cache configuration
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "sqlite").lower()
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))  # 24 hours in seconds
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "responses.sqlite3")
+)
+CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# A hit refreshes an entry's LRU time only if it is older than this, so most hits don't write
+CACHE_ACCESS_RESOLUTION = 60.0
+
+
+def make_cache_key(
+    model_id: str,
+    system_prompt: Optional[str],
+    prompt: str,
+    temperature: float
+) -> str:
+    """
+    Build a stable cache key for a generation request
+
+    Unlike the built-in hash(), this is the same in every worker process
+    and across restarts. max_tokens is left out: only responses that weren't
+    cut short are cached, and they answer a prompt whatever its budget.
+
+    Args:
+        model_id: The model ID
+        system_prompt: The system prompt
+        prompt: The user prompt
+        temperature: The sampling temperature
+
+    Returns:
+        A hex digest identifying the request
+    """
+    payload = json.dumps(
+        [model_id, system_prompt or "", prompt, round(float(temperature), 4)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """
+    Interface for response cache stores
+
+    Values are strings (the raw model output). Every backend keeps hit, miss
+    and eviction counters for the current process.
+    """
+
+    name = "base"
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get a cached value
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """
+        Store a value
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl: Time to live in seconds (defaults to the backend TTL)
+        """
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        """Remove a value if present"""
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        """Remove every value"""
+        raise NotImplementedError
+
+    def size(self) -> Dict[str, int]:
+        """
+        Get the current size of the store
+
+        Returns:
+            Dictionary with "entries" and "bytes"
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+
+        Returns:
+            Dictionary with the backend name, size and counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            **self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "ttl": self.ttl,
+        }
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with TTLs, bounded by entry count and total bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self._lru = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._lru.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._lru.put(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        self._lru.delete(key)
+
+    async def clear(self) -> None:
+        self._lru.clear()
+
+    def size(self) -> Dict[str, int]:
+        return {"entries": len(self._lru), "bytes": self._lru.bytes}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self._lru.stats()}
+
+
+class SQLiteCache(CacheBackend):
+    """
+    SQLite-backed cache shared by every worker on the host
+
+    Uses WAL mode so readers don't block the writer. Entry count and total
+    size are kept in a meta row by triggers, so limit checks don't scan the
+    table. When a limit is exceeded, expired rows go first, then the least
+    recently used (to within CACHE_ACCESS_RESOLUTION seconds, so that most
+    hits are plain reads). Queries run in a thread, one at a time per
+    process, so a busy database never blocks the event loop. size() reports
+    the totals as this process last read them (on opening the database and
+    after each write), so stats never query the database.
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: float = CACHE_TTL
+    ):
+        super().__init__(ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        # The connection is shared by the threads running queries; transactions must not interleave
+        self._lock = threading.Lock()
+        self._entries = 0
+        self._bytes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database lazily, once per process (connections can't cross a fork)"""
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at);
+            CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at);
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_meta (id, entries, bytes) VALUES (0, 0, 0);
+            CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+                UPDATE cache_meta SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+                UPDATE cache_meta SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+            END;
+        """)
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        self._read_size(conn)
+        return conn
+
+    def _read_size(self, conn: sqlite3.Connection) -> None:
+        """Refresh the totals size() reports (called with the lock held)"""
+        self._entries, self._bytes = conn.execute("SELECT entries, bytes FROM cache_meta WHERE id = 0").fetchone()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, accessed_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+                self._read_size(conn)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            if now - accessed_at >= CACHE_ACCESS_RESOLUTION:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    def _set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        size = len(value.encode("utf-8"))
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # DELETE + INSERT (rather than REPLACE) so the triggers keep the totals right
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.execute(
+                    "INSERT INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, expires_at, now)
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._read_size(conn)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Bring the store back within its limits (called inside a write transaction)"""
+        entries, total_bytes = conn.execute("SELECT entries, bytes FROM cache_meta WHERE id = 0").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Expired rows are free to drop first
+        removed = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        self.expirations += max(removed, 0)
+
+        while True:
+            entries, total_bytes = conn.execute("SELECT entries, bytes FROM cache_meta WHERE id = 0").fetchone()
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            # Remove the least recently used rows in small batches
+            batch = max(1, entries - self.max_entries)
+            removed = conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (min(batch, 100),)
+            ).rowcount
+            if removed <= 0:
+                break
+            self.evictions += removed
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM cache WHERE key = ?", (key,))
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM cache", ())
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(sql, params)
+            self._read_size(conn)
+
+    def size(self) -> Dict[str, int]:
+        # Other workers' writes show up here after this process's next write
+        return {"entries": self._entries, "bytes": self._bytes}
+
+
+class RedisCache(CacheBackend):
+    """
+    Remote cache backed by Redis (or any client with the same async get/set/delete API)
+
+    TTLs are enforced by Redis itself; size-based eviction should be handled
+    by the server's maxmemory policy (e.g. allkeys-lru), which is reported
+    through the evictions counter when available.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_REDIS_URL, client: Any = None, prefix: str = "edugenie:cache:", ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError:
+                raise Exception("The 'redis' package is required for RESPONSE_CACHE_BACKEND=redis. Install it with: pip install redis")
+            client = redis_asyncio.from_url(url, decode_responses=True)
+        self.client = client
+        self._entries = 0
+        self._bytes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await self.client.set(self.prefix + key, value, ex=max(1, int(self.ttl if ttl is None else ttl)))
+        self._entries += 1
+        self._bytes += len(value.encode("utf-8"))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self) -> None:
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+    def size(self) -> Dict[str, int]:
+        # Redis is shared, so only what this process has written is known locally
+        return {"entries": self._entries, "bytes": self._bytes}
+
+
+# Registry of cache backends selectable with RESPONSE_CACHE_BACKEND
+CACHE_BACKENDS: Dict[str, Callable[[], CacheBackend]] = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "redis": RedisCache,
+}
+
+
+def register_cache_backend(name: str, factory: Callable[[], CacheBackend]) -> None:
+    """
+    Register a custom cache backend
+
+    Args:
+        name: The name to select it with in RESPONSE_CACHE_BACKEND
+        factory: Callable returning a CacheBackend instance
+    """
+    CACHE_BACKENDS[name.lower()] = factory
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    """
+    Create the configured cache backend
+
+    Args:
+        backend: Name of a registered backend
+
+    Returns:
+        A CacheBackend instance
+    """
+    factory = CACHE_BACKENDS.get(backend.lower())
+    if factory is None:
+        logger.warning(f"Unknown cache backend '{backend}', using in-memory cache")
+        factory = MemoryCache
+    return factory()
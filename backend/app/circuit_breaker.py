@@ -0,0 +1,274 @@
+import os
+import time
+import logging
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+from .errors import CircuitOpenError, MODEL_FAILURES, FAILURE_MALFORMED
+from .shared_state import StateStore, MemoryStateStore
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.circuit_breaker")
+
+# Circuit breaker configuration
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))  # Consecutive failures that open a circuit
+CIRCUIT_BASE_COOLDOWN = float(os.getenv("CIRCUIT_BASE_COOLDOWN", "30"))  # Seconds open after the first trip
+CIRCUIT_MAX_COOLDOWN = float(os.getenv("CIRCUIT_MAX_COOLDOWN", "600"))  # Doubling stops here
+CIRCUIT_HALF_OPEN_TRIALS = int(os.getenv("CIRCUIT_HALF_OPEN_TRIALS", "1"))  # Trial calls at once while half-open
+# A trial that reports nothing for this long (e.g. its worker died) frees its slot
+CIRCUIT_TRIAL_TIMEOUT = float(os.getenv("CIRCUIT_TRIAL_TIMEOUT", "180"))
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breakers, shared by the workers through the state store
+
+    A circuit opens after `threshold` consecutive failures of one kind of
+    check: calls (429s, 5xx, timeouts, connection errors) or responses
+    (unparseable JSON), since a model can answer every call with text that
+    is of no use. While open, calls to the model fail at once with
+    CircuitOpenError. After the cool-down the circuit is half-open and lets
+    up to `trials` calls through: a success closes it, a failure opens it
+    again for twice as long, up to `max_cooldown`. A 429's Retry-After
+    lengthens the cool-down when it is longer.
+    """
+
+    def __init__(
+        self,
+        store: Optional[StateStore] = None,
+        threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        base_cooldown: float = CIRCUIT_BASE_COOLDOWN,
+        max_cooldown: float = CIRCUIT_MAX_COOLDOWN,
+        trials: int = CIRCUIT_HALF_OPEN_TRIALS,
+        trial_timeout: float = CIRCUIT_TRIAL_TIMEOUT,
+        enabled: bool = CIRCUIT_BREAKER_ENABLED
+    ):
+        """
+        Initialize the breakers
+
+        Args:
+            store: Where circuit state is kept; pass a shared store so that
+                every worker stops calling a model one of them found dead
+            threshold: Consecutive failures that open a circuit
+            base_cooldown: Seconds a circuit stays open the first time
+            max_cooldown: Longest cool-down after repeated trips
+            trials: Calls let through at once while half-open
+            trial_timeout: Seconds after which an unreported trial frees its slot
+            enabled: Whether circuits ever open
+        """
+        self.store = store or MemoryStateStore()
+        self.threshold = threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.trials = trials
+        self.trial_timeout = trial_timeout
+        self.enabled = enabled
+        self.failures: Dict[str, int] = {}
+        self.rejected = 0
+        self.opened = 0
+
+    def _key(self, model_id: str) -> str:
+        return f"circuit:{model_id}"
+
+    def _view(self, circuit: Optional[Dict[str, Any]], now: float) -> Dict[str, Any]:
+        """The circuit as it stands now: an open circuit past its cool-down is half-open"""
+        circuit = dict(circuit or {"state": CLOSED, "failures": 0, "malformed": 0, "cooldown": 0.0})
+        if circuit["state"] == OPEN and now >= circuit["open_until"]:
+            circuit.update(state=HALF_OPEN, trials=0, trial_until=0.0)
+        if circuit["state"] == HALF_OPEN and now >= circuit.get("trial_until", 0.0):
+            # Trials that never reported back don't block the circuit forever
+            circuit["trials"] = 0
+        return circuit
+
+    def state(self, model_id: str) -> str:
+        """Get a model's circuit state ("closed", "open" or "half_open") without changing it"""
+        return self._view(self.store.get(self._key(model_id)), time.time())["state"]
+
+    def available(self, model_id: str) -> bool:
+        """
+        Check whether a call to the model would be let through, without taking a trial slot
+
+        Args:
+            model_id: The model ID
+
+        Returns:
+            False while the circuit is open or its half-open trials are all in use
+        """
+        if not self.enabled:
+            return True
+        circuit = self._view(self.store.get(self._key(model_id)), time.time())
+        if circuit["state"] == OPEN:
+            return False
+        return circuit["state"] == CLOSED or circuit["trials"] < self.trials
+
+    def retry_after(self, model_id: str) -> float:
+        """Get the seconds until the model's circuit lets a call through (0 if it would now)"""
+        now = time.time()
+        circuit = self._view(self.store.get(self._key(model_id)), now)
+        if circuit["state"] == OPEN:
+            return circuit["open_until"] - now
+        if circuit["state"] == HALF_OPEN and circuit["trials"] >= self.trials:
+            return max(circuit["trial_until"] - now, 0.0)
+        return 0.0
+
+    def check(self, model_id: str) -> None:
+        """
+        Let a call through or fail it at once
+
+        A call let through while half-open takes a trial slot, which is
+        given back by record_success(), record_failure() or release().
+
+        Args:
+            model_id: The model about to be called
+
+        Raises:
+            CircuitOpenError: If the circuit is open or has no free trial slot
+        """
+        if not self.enabled:
+            return
+        current = self.store.get(self._key(model_id))
+        if current is None or current["state"] == CLOSED:
+            # Closed circuits need no store write
+            return
+        now = time.time()
+
+        def admit(circuit):
+            circuit = self._view(circuit, now)
+            if circuit["state"] == CLOSED:
+                return circuit, None
+            if circuit["state"] == HALF_OPEN and circuit["trials"] < self.trials:
+                circuit["trials"] += 1
+                circuit["trial_until"] = now + self.trial_timeout
+                return circuit, None
+            wait = circuit["open_until"] - now if circuit["state"] == OPEN else circuit["trial_until"] - now
+            return circuit, max(wait, 0.0)
+
+        wait = self.store.update(self._key(model_id), admit)
+        if wait is not None:
+            self.rejected += 1
+            raise CircuitOpenError(
+                f"Circuit open for model: {model_id}. Try a different model or wait {wait:.0f} seconds.",
+                model_id,
+                retry_after=wait
+            )
+
+    def record_success(self, model_id: str, response: bool = False) -> None:
+        """
+        Record a successful call, or a response that parsed
+
+        Args:
+            model_id: The model
+            response: True for a parsed response, False for a completed call
+        """
+        if not self.enabled:
+            return
+        counter = "malformed" if response else "failures"
+        current = self.store.get(self._key(model_id))
+        if current is None or (current["state"] == CLOSED and current[counter] == 0):
+            # Nothing to reset; skip the store write on the common path
+            return
+        now = time.time()
+
+        def succeed(circuit):
+            circuit = self._view(circuit, now)
+            circuit[counter] = 0
+            if circuit["state"] == HALF_OPEN:
+                circuit["trials"] = max(circuit["trials"] - 1, 0)
+                # Close once neither kind of check is still failing
+                if circuit["failures"] < self.threshold and circuit["malformed"] < self.threshold:
+                    logger.info("Circuit for %s closed", model_id, extra={"model": model_id})
+                    circuit.update(state=CLOSED, cooldown=0.0)
+            return circuit, None
+
+        self.store.update(self._key(model_id), succeed)
+
+    def record_failure(self, model_id: str, kind: str, retry_after: Optional[float] = None) -> None:
+        """
+        Record a failed call or an unparseable response
+
+        Args:
+            model_id: The model
+            kind: The failure kind (see app/errors.py); kinds that say
+                nothing about the model, such as a bad request, only free
+                the trial slot
+            retry_after: Seconds the upstream asked us to wait, if any
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        counted = kind in MODEL_FAILURES
+        if counted:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+        def fail(circuit):
+            circuit = self._view(circuit, now)
+            if circuit["state"] == HALF_OPEN:
+                circuit["trials"] = max(circuit["trials"] - 1, 0)
+            if not counted or circuit["state"] == OPEN:
+                return circuit, False
+
+            counter = "malformed" if kind == FAILURE_MALFORMED else "failures"
+            circuit[counter] += 1
+            if circuit["state"] == CLOSED and circuit[counter] < self.threshold:
+                return circuit, False
+
+            # Tripped, or a half-open trial failed: open again for longer
+            cooldown = min(self.max_cooldown, max(self.base_cooldown, circuit["cooldown"] * 2))
+            cooldown = max(cooldown, retry_after or 0.0)
+            circuit.update(state=OPEN, cooldown=cooldown, open_until=now + cooldown, last_failure=kind)
+            return circuit, True
+
+        if self.store.update(self._key(model_id), fail):
+            self.opened += 1
+            logger.warning("Circuit for %s opened after %s", model_id, kind, extra={"model": model_id})
+
+    def release(self, model_id: str) -> None:
+        """Give back a trial slot taken by check() for a call that was never made"""
+        if not self.enabled:
+            return
+        now = time.time()
+
+        def free(circuit):
+            circuit = self._view(circuit, now)
+            if circuit["state"] == HALF_OPEN:
+                circuit["trials"] = max(circuit["trials"] - 1, 0)
+            return circuit, None
+
+        self.store.update(self._key(model_id), free)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get circuit statistics
+
+        Returns:
+            Dictionary with each known circuit's state and this worker's
+            failure counts by kind, fast failures and trips
+        """
+        now = time.time()
+        circuits = {}
+        for key in self.store.keys("circuit:"):
+            circuit = self._view(self.store.get(key), now)
+            circuits[key[len("circuit:"):]] = {
+                "state": circuit["state"],
+                "consecutive_failures": circuit["failures"],
+                "consecutive_malformed": circuit["malformed"],
+                "cooldown": circuit["cooldown"],
+                "retry_after": round(max(circuit.get("open_until", now) - now, 0.0), 3) if circuit["state"] == OPEN else 0.0,
+                "last_failure": circuit.get("last_failure"),
+            }
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "circuits": circuits,
+            "failures": dict(self.failures),
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
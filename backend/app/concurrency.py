@@ -0,0 +1,367 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.concurrency")
+
+# The model whose slot the current request holds (set by ConcurrencyMiddleware)
+_admitted_model: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("admitted_model", default=None)
+
+# Adaptive concurrency limit configuration (per worker process)
+CONCURRENCY_LIMIT_ENABLED = os.getenv("CONCURRENCY_LIMIT_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+CONCURRENCY_INITIAL_LIMIT = int(os.getenv("CONCURRENCY_INITIAL_LIMIT", "20"))
+CONCURRENCY_MIN_LIMIT = int(os.getenv("CONCURRENCY_MIN_LIMIT", "2"))
+CONCURRENCY_MAX_LIMIT = int(os.getenv("CONCURRENCY_MAX_LIMIT", "200"))
+# Multiplicative decrease applied to a limit when its latency or errors show congestion
+CONCURRENCY_BACKOFF = float(os.getenv("CONCURRENCY_BACKOFF", "0.75"))
+# Congestion is recent latency above this multiple of the usual (baseline) latency
+CONCURRENCY_LATENCY_TOLERANCE = float(os.getenv("CONCURRENCY_LATENCY_TOLERANCE", "2.0"))
+# Requests over the limit wait this many seconds for a slot, at most this many per limit, before a 503
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "2"))
+CONCURRENCY_MAX_QUEUE = int(os.getenv("CONCURRENCY_MAX_QUEUE", "50"))
+# Endpoints that are limited; everything else (/health, /models, /status...) is never queued
+CONCURRENCY_PATHS = os.getenv(
+    "CONCURRENCY_PATHS",
+    "/generate/lesson,/generate/assessment,/generate/lab,/generate/batch,/generate/teaching-tip"
+)
+
+# Latency smoothing: a fast average tracks the current latency; the baseline
+# follows it down at once but up only slowly, so a slowdown stands out
+SHORT_ALPHA = 0.3
+BASELINE_ALPHA = 0.01
+# Samples needed before latency alone can lower a limit
+MIN_SAMPLES = 10
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit adjusted by additive increase, multiplicative decrease (AIMD)
+
+    Each completed call reports its latency. While the limit is in full use
+    and calls are as fast as usual, it grows by about one per limit's worth
+    of completions. When recent latency rises above `tolerance` times the
+    baseline (the lowest recent latency, rising slowly), or a call fails
+    from overload, the limit is multiplied by `backoff`, at most once per
+    typical call duration so one burst of slow calls counts as one signal.
+    Callers over the limit wait in FIFO order for up to the queue timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = CONCURRENCY_INITIAL_LIMIT,
+        min_limit: int = CONCURRENCY_MIN_LIMIT,
+        max_limit: int = CONCURRENCY_MAX_LIMIT,
+        backoff: float = CONCURRENCY_BACKOFF,
+        tolerance: float = CONCURRENCY_LATENCY_TOLERANCE,
+        max_queue: int = CONCURRENCY_MAX_QUEUE
+    ):
+        """
+        Initialize the limit
+
+        Args:
+            name: Name shown in statistics
+            initial: Starting limit
+            min_limit: Lowest the limit can go
+            max_limit: Highest the limit can go
+            backoff: Factor applied to the limit on congestion
+            tolerance: Recent/baseline latency ratio treated as congestion
+            max_queue: Most callers waiting for a slot
+        """
+        self.name = name
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self.short_latency: Optional[float] = None
+        self.baseline_latency: Optional[float] = None
+        self.samples = 0
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < math.floor(self.limit)
+
+    async def acquire(self, timeout: float = CONCURRENCY_QUEUE_TIMEOUT) -> bool:
+        """
+        Take a slot, waiting up to `timeout` seconds if the limit is reached
+
+        Args:
+            timeout: Seconds to wait in the queue (0 to fail at once)
+
+        Returns:
+            True if a slot was taken (call release() when done), False if shed
+        """
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if timeout <= 0 or len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except asyncio.CancelledError:
+            # Give back a slot handed over just as the caller went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+        if waiter.cancelled():
+            self.shed += 1
+            return False
+        # release() handed this waiter its slot
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        """Give back a slot taken by acquire()"""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to waiting callers, oldest first"""
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(True)
+
+    def observe(self, latency: float, overloaded: bool = False) -> None:
+        """
+        Adjust the limit after a call
+
+        Args:
+            latency: Seconds the call took
+            overloaded: Whether it failed in a way that suggests overload (429, 5xx, timeout)
+        """
+        if not overloaded:
+            self.samples += 1
+            if self.short_latency is None:
+                self.short_latency = self.baseline_latency = latency
+            else:
+                self.short_latency += SHORT_ALPHA * (latency - self.short_latency)
+                self.baseline_latency = min(self.baseline_latency, self.short_latency)
+                self.baseline_latency += BASELINE_ALPHA * (self.short_latency - self.baseline_latency)
+
+        congested = overloaded or (
+            self.samples >= MIN_SAMPLES and self.short_latency > self.tolerance * self.baseline_latency
+        )
+        now = time.monotonic()
+        if congested:
+            if now - self._last_decrease >= (self.short_latency or 0.0):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif self.in_flight >= math.floor(self.limit) and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+            self._wake()
+
+    def retry_after(self) -> float:
+        """Estimate the seconds until a shed caller would get a slot"""
+        latency = self.short_latency or 1.0
+        return min(60.0, max(1.0, latency * (len(self._waiters) + 1) / max(self.limit, 1.0)))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get limit statistics
+
+        Returns:
+            Dictionary with the current limit, usage, latencies and counters
+        """
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "short_latency": self.short_latency,
+            "baseline_latency": self.baseline_latency,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    Adaptive limits per endpoint and per model, created on first use
+
+    Endpoint limits learn from how long each request takes to answer;
+    model limits learn from upstream call latency and outcomes (see
+    observe_call), so a slow model is throttled without holding back the
+    others. Both the slot and the learning are keyed on the model a request
+    asks for, which is all the middleware knows when it admits it.
+    """
+
+    def __init__(self, known_models: Callable[[str], Any], queue_timeout: float = CONCURRENCY_QUEUE_TIMEOUT):
+        """
+        Initialize the limiter
+
+        Args:
+            known_models: Returns a truthy value for model IDs that get a limit of their own
+            queue_timeout: Seconds a request waits for a slot before being shed
+        """
+        self.known_models = known_models
+        self.queue_timeout = queue_timeout
+        self.endpoints: Dict[str, AdaptiveLimit] = {}
+        self.models: Dict[str, AdaptiveLimit] = {}
+
+    def endpoint(self, path: str) -> AdaptiveLimit:
+        if path not in self.endpoints:
+            self.endpoints[path] = AdaptiveLimit(path)
+        return self.endpoints[path]
+
+    def model(self, model_id: Optional[str]) -> Optional[AdaptiveLimit]:
+        if not isinstance(model_id, str) or not self.known_models(model_id):
+            return None
+        if model_id not in self.models:
+            self.models[model_id] = AdaptiveLimit(model_id)
+        return self.models[model_id]
+
+    def observe_call(self, model_id: str, latency: float, outcome: str, completion_tokens: Optional[int]) -> None:
+        """
+        Call observer (see add_call_observer) adjusting the model's limit
+
+        A call made for an admitted request adjusts the limit of the model
+        the request asked for, whose slot it holds, even if it went to a
+        substitute or hedge model; other calls (jobs, pre-warming) adjust
+        the limit of the model called.
+        """
+        limit = self.model(_admitted_model.get() or model_id)
+        if limit is not None:
+            limit.observe(latency, overloaded=outcome != "ok")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get limiter statistics
+
+        Returns:
+            Dictionary with every endpoint and model limit's statistics
+        """
+        return {
+            "queue_timeout": self.queue_timeout,
+            "endpoints": {path: limit.stats() for path, limit in self.endpoints.items()},
+            "models": {model_id: limit.stats() for model_id, limit in self.models.items()},
+        }
+
+
+class ConcurrencyMiddleware:
+    """
+    ASGI middleware admitting generation requests through the adaptive limits
+
+    Only POSTs to the configured paths are limited; the requested model is
+    read from the JSON body, which is then replayed to the app. A request
+    takes a slot for its endpoint and for its model, waits briefly if
+    either is full, and otherwise gets a 503 with Retry-After before any
+    work is done. The slots are held until the response is fully sent, so
+    streams count for as long as they run.
+    """
+
+    def __init__(self, app, limiter: ConcurrencyLimiter, paths: Optional[List[str]] = None):
+        self.app = app
+        self.limiter = limiter
+        self.paths = set(paths if paths is not None else
+                         (path.strip() for path in CONCURRENCY_PATHS.split(",") if path.strip()))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Read the body to find the model, then hand the app the same messages
+        messages = []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                break
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        model_id = None
+        try:
+            body = json.loads(b"".join(message.get("body", b"") for message in messages) or b"{}")
+            if isinstance(body, dict):
+                model_id = body.get("model")
+        except ValueError:
+            pass
+
+        endpoint_limit = self.limiter.endpoint(scope["path"])
+        model_limit = self.limiter.model(model_id)
+        started = time.monotonic()
+        if not await endpoint_limit.acquire(self.limiter.queue_timeout):
+            await self._shed(send, endpoint_limit)
+            return
+        if model_limit is not None:
+            remaining = self.limiter.queue_timeout - (time.monotonic() - started)
+            if not await model_limit.acquire(max(remaining, 0.0)):
+                endpoint_limit.release()
+                await self._shed(send, model_limit)
+                return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        began = time.monotonic()
+        admitted = _admitted_model.set(model_id if model_limit is not None else None)
+        try:
+            await self.app(scope, replay, send_with_status)
+        finally:
+            _admitted_model.reset(admitted)
+            endpoint_limit.observe(time.monotonic() - began, overloaded=status == 429 or status >= 500)
+            endpoint_limit.release()
+            if model_limit is not None:
+                model_limit.release()
+
+    async def _shed(self, send, limit: AdaptiveLimit) -> None:
+        """Answer 503 with a Retry-After estimate"""
+        logger.warning("Shedding request: concurrency limit for %s reached (%d)", limit.name, math.floor(limit.limit))
+        body = json.dumps({"detail": f"Server busy: too many requests for {limit.name}, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(limit.retry_after())).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,142 @@
+import time
+from typing import Mapping, Optional
+
+# Kinds of upstream failure
+FAILURE_RATE_LIMITED = "rate_limited"
+FAILURE_SERVER = "server_error"
+FAILURE_TIMEOUT = "timeout"
+FAILURE_CONNECTION = "connection"
+FAILURE_MALFORMED = "malformed"
+FAILURE_CLIENT = "client_error"
+FAILURE_CIRCUIT_OPEN = "circuit_open"
+
+# Failures that say something about the model's health (a bad request doesn't)
+MODEL_FAILURES = (FAILURE_RATE_LIMITED, FAILURE_SERVER, FAILURE_TIMEOUT, FAILURE_CONNECTION, FAILURE_MALFORMED)
+
+
+class UpstreamError(Exception):
+    """
+    A failed call to a model
+
+    Subclasses say what went wrong; `kind` is one of the FAILURE_* names.
+    The messages are the ones the API has always returned.
+    """
+
+    kind = FAILURE_SERVER
+
+    def __init__(
+        self,
+        message: str,
+        model_id: Optional[str] = None,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.model_id = model_id
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitError(UpstreamError):
+    """The model (or our local limiter for it) has no capacity; `local` is True for the latter"""
+
+    kind = FAILURE_RATE_LIMITED
+
+    def __init__(self, message: str, model_id: Optional[str] = None, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None, local: bool = False):
+        super().__init__(message, model_id, status_code, retry_after)
+        self.local = local
+
+
+class UpstreamServerError(UpstreamError):
+    """OpenRouter or the model's provider failed (5xx or an error without a client-side cause)"""
+
+    kind = FAILURE_SERVER
+
+
+class UpstreamTimeoutError(UpstreamError):
+    """The call took longer than the client timeouts allow"""
+
+    kind = FAILURE_TIMEOUT
+
+
+class UpstreamConnectionError(UpstreamError):
+    """The call could not be sent or the connection broke"""
+
+    kind = FAILURE_CONNECTION
+
+
+class MalformedResponseError(UpstreamError):
+    """The response was not the JSON shape the API returns"""
+
+    kind = FAILURE_MALFORMED
+
+
+class UpstreamClientError(UpstreamError):
+    """The request was refused as invalid (4xx other than 429)"""
+
+    kind = FAILURE_CLIENT
+
+
+class CircuitOpenError(UpstreamError):
+    """The model's circuit breaker is open, so the call was not attempted"""
+
+    kind = FAILURE_CIRCUIT_OPEN
+
+
+def retry_after_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Read how long to wait from upstream rate limit headers
+
+    Uses Retry-After (seconds), or X-RateLimit-Reset (epoch seconds or
+    milliseconds) when X-RateLimit-Remaining is 0.
+
+    Args:
+        headers: Response headers
+
+    Returns:
+        Seconds to wait, or None if the headers don't say
+    """
+    def number(name: str) -> Optional[float]:
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    retry_after = number("retry-after")
+    if retry_after is not None:
+        return max(retry_after, 0.0)
+    remaining = number("x-ratelimit-remaining")
+    reset = number("x-ratelimit-reset")
+    if reset is not None and remaining is not None and remaining <= 0:
+        # OpenRouter sends milliseconds; accept seconds too
+        reset_at = reset / 1000.0 if reset > 1e11 else reset
+        return max(reset_at - time.time(), 0.0)
+    return None
+
+
+def error_for_status(
+    status_code: Optional[int],
+    message: str,
+    model_id: str,
+    headers: Optional[Mapping[str, str]] = None
+) -> UpstreamError:
+    """
+    Build the typed error for a failed response
+
+    Args:
+        status_code: The HTTP status, or the error code in the response body
+        message: The error message
+        model_id: The model called
+        headers: Response headers, for Retry-After
+
+    Returns:
+        RateLimitError for 429s and messages about rate limits,
+        UpstreamClientError for other 4xx, UpstreamServerError otherwise
+    """
+    retry_after = retry_after_from_headers(headers) if headers is not None else None
+    if status_code == 429 or "rate limit" in message.lower():
+        return RateLimitError(message, model_id, status_code, retry_after)
+    if isinstance(status_code, int) and 400 <= status_code < 500:
+        return UpstreamClientError(message, model_id, status_code)
+    return UpstreamServerError(message, model_id, status_code, retry_after)
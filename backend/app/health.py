@@ -0,0 +1,289 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from . import http_client
+from .model_stats import OUTCOME_OK, OUTCOME_RATE_LIMITED
+from .shared_state import StateStore
+from .openrouter import API_URL, API_CALLS, STATE_STORE, AVAILABLE_MODELS, build_headers, build_payload
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.health")
+
+# Health probe configuration
+HEALTH_PROBE_ENABLED = os.getenv("HEALTH_PROBE_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "900"))  # Seconds between checks of a model
+HEALTH_PROBE_JITTER = float(os.getenv("HEALTH_PROBE_JITTER", "0.2"))  # +/- fraction of the interval
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "15"))
+# Seconds between looking for models that are due, at most
+HEALTH_PROBE_TICK = 30.0
+
+# Model health statuses
+HEALTH_OK = "ok"
+HEALTH_RATE_LIMITED = "rate_limited"
+HEALTH_ERROR = "error"
+HEALTH_UNKNOWN = "unknown"
+
+PROBE_PROMPT = "Reply with OK."
+PROBE_SYSTEM_PROMPT = "You are a health check. Answer in one word."
+
+
+def _status_for_outcome(outcome: str) -> str:
+    if outcome == OUTCOME_OK:
+        return HEALTH_OK
+    if outcome == OUTCOME_RATE_LIMITED:
+        return HEALTH_RATE_LIMITED
+    return HEALTH_ERROR
+
+
+class HealthProber:
+    """
+    Background checks of every model, kept in a health table shared by the workers
+
+    Each model is probed every `interval` seconds (plus or minus `jitter`)
+    with a one-token completion that skips the response cache. Real
+    upstream calls also count as checks, so models in regular use are
+    rarely probed at all. Rows live in the shared state store, where a
+    worker claims a due model before probing it, so several workers don't
+    probe the same model at once. /status reads the table instead of
+    calling a model.
+    """
+
+    def __init__(
+        self,
+        model_ids: List[str],
+        store: StateStore = STATE_STORE,
+        interval: float = HEALTH_PROBE_INTERVAL,
+        jitter: float = HEALTH_PROBE_JITTER,
+        timeout: float = HEALTH_PROBE_TIMEOUT
+    ):
+        """
+        Initialize the prober
+
+        Args:
+            model_ids: The models to check
+            store: Where the health table is kept
+            interval: Seconds between checks of a model
+            jitter: Random spread of the interval, as a fraction of it
+            timeout: Seconds a probe may take
+        """
+        self.model_ids = model_ids
+        self.store = store
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self._task: Optional[asyncio.Task] = None
+        self.probes = 0
+        self.probe_failures = 0
+        self.skipped = 0
+
+    def _key(self, model_id: str) -> str:
+        return f"model_health:{model_id}"
+
+    def _next_check(self, now: float) -> float:
+        spread = self.interval * self.jitter
+        return now + self.interval + random.uniform(-spread, spread)
+
+    async def start(self) -> None:
+        """Start probing in the background"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop probing"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """Probe due models until cancelled"""
+        tick = min(HEALTH_PROBE_TICK, self.interval / 4)
+        # Workers start together; spread their first look over one tick
+        await asyncio.sleep(random.uniform(0, tick))
+        while True:
+            try:
+                await self.probe_due()
+            except Exception:
+                logger.exception("Model health check failed")
+            await asyncio.sleep(tick)
+
+    def _claim(self, model_id: str) -> bool:
+        """Mark a due model as being checked by this worker; False if it isn't due"""
+        now = time.time()
+
+        def claim(row):
+            row = row or {"status": HEALTH_UNKNOWN, "failures": 0}
+            if row.get("next_check_at", 0) > now:
+                return row, False
+            return {**row, "next_check_at": self._next_check(now)}, True
+
+        return self.store.update(self._key(model_id), claim)
+
+    async def probe_due(self) -> int:
+        """
+        Probe every model whose last check is older than the interval
+
+        Returns:
+            The number of models probed
+        """
+        due = [model_id for model_id in self.model_ids if self._claim(model_id)]
+        await asyncio.gather(*(self.probe(model_id) for model_id in due))
+        return len(due)
+
+    async def probe(self, model_id: str) -> str:
+        """
+        Check one model with a minimal completion and record the result
+
+        Skipped (leaving the last result in place) when the local rate
+        limiter has no capacity for the model, so probes never take calls
+        that requests are waiting for.
+
+        Args:
+            model_id: The model ID from OpenRouter
+
+        Returns:
+            The recorded status, or the previous one if skipped
+        """
+        if not API_CALLS.can_acquire(model_id):
+            self.skipped += 1
+            row = self.store.get(self._key(model_id)) or {}
+            return row.get("status", HEALTH_UNKNOWN)
+        API_CALLS.consume(model_id)
+
+        self.probes += 1
+        data = build_payload(PROBE_PROMPT, model_id, PROBE_SYSTEM_PROMPT, 0.0, 1)
+        started = time.monotonic()
+        error = None
+        try:
+            response = await http_client.post(API_URL, headers=build_headers(), json=data, timeout=self.timeout)
+            API_CALLS.update_from_headers(model_id, response.headers)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            upstream_error = body.get("error") if isinstance(body, dict) else None
+            if response.status_code == 429 or (upstream_error and upstream_error.get("code") == 429):
+                status = HEALTH_RATE_LIMITED
+                error = (upstream_error or {}).get("message", "HTTP Error: 429")
+            elif response.status_code != 200 or upstream_error or "choices" not in body:
+                status = HEALTH_ERROR
+                error = (upstream_error or {}).get("message") or f"HTTP Error: {response.status_code}"
+            else:
+                status = HEALTH_OK
+        except httpx.TimeoutException:
+            status, error = HEALTH_ERROR, f"Timed out after {self.timeout:.0f}s"
+        except httpx.RequestError as e:
+            status, error = HEALTH_ERROR, f"Request error: {e}"
+
+        if status != HEALTH_OK:
+            self.probe_failures += 1
+            logger.info("Health probe of %s: %s (%s)", model_id, status, error, extra={"model": model_id})
+        self.record(model_id, status, time.monotonic() - started, error, "probe")
+        return status
+
+    def record(self, model_id: str, status: str, latency: float, error: Optional[str], source: str) -> None:
+        """
+        Store a check result in the health table
+
+        Args:
+            model_id: The model ID
+            status: "ok", "rate_limited" or "error"
+            latency: Seconds the call took
+            error: The error message, if any
+            source: "probe" or "traffic"
+        """
+        now = time.time()
+
+        def apply(row):
+            row = row or {"failures": 0}
+            failures = 0 if status == HEALTH_OK else row.get("failures", 0) + 1
+            return {
+                **row,
+                "status": status,
+                "latency": latency,
+                "error": error,
+                "source": source,
+                "checked_at": now,
+                "failures": failures,
+                "next_check_at": max(row.get("next_check_at", 0), self._next_check(now)),
+            }, None
+
+        self.store.update(self._key(model_id), apply)
+
+    def observe_call(self, model_id: str, latency: float, outcome: str, completion_tokens: Optional[int]) -> None:
+        """Call observer (see add_call_observer): a real upstream call is a check too"""
+        try:
+            self.record(model_id, _status_for_outcome(outcome), latency, None, "traffic")
+        except Exception:
+            logger.exception("Could not record model health")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read the health table
+
+        Returns:
+            Dictionary mapping model IDs to their last status, latency, error,
+            check time and age in seconds ("unknown" if never checked)
+        """
+        now = time.time()
+        table = {}
+        for model_id in self.model_ids:
+            row = self.store.get(self._key(model_id)) or {}
+            checked_at = row.get("checked_at")
+            table[model_id] = {
+                "status": row.get("status", HEALTH_UNKNOWN) if checked_at else HEALTH_UNKNOWN,
+                "latency": row.get("latency"),
+                "error": row.get("error"),
+                "source": row.get("source"),
+                "consecutive_failures": row.get("failures", 0),
+                "checked_at": datetime.fromtimestamp(checked_at).isoformat() if checked_at else None,
+                "age": now - checked_at if checked_at else None,
+            }
+        return table
+
+    def overall_status(self, table: Dict[str, Dict[str, Any]]) -> str:
+        """
+        Summarize the health table
+
+        Args:
+            table: The result of snapshot()
+
+        Returns:
+            "ok" if any model is healthy, else "rate_limited" if any model is
+            rate limited, else "error" if any model has been checked, else "unknown"
+        """
+        statuses = {row["status"] for row in table.values()}
+        for status in (HEALTH_OK, HEALTH_RATE_LIMITED, HEALTH_ERROR):
+            if status in statuses:
+                return status
+        return HEALTH_UNKNOWN
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get prober statistics
+
+        Returns:
+            Dictionary with the configuration and this worker's probe counters
+        """
+        return {
+            "enabled": self._task is not None,
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "skipped": self.skipped,
+        }
+
+
+def create_health_prober() -> HealthProber:
+    """Create the prober for every available model"""
+    return HealthProber([model["id"] for model in AVAILABLE_MODELS])
@@ -0,0 +1,259 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.hedging")
+
+T = TypeVar("T")
+
+# Hedging configuration
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Hedge once the primary model has taken longer than this percentile of its recent latencies
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+# Bounds for the hedge delay in seconds, and the delay used before a model has any history
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "60"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "30"))
+# Streams are hedged if no token has arrived after this many seconds
+HEDGE_FIRST_TOKEN_DELAY = float(os.getenv("HEDGE_FIRST_TOKEN_DELAY", "15"))
+# Each request earns this fraction of a hedge, saved up to HEDGE_BUDGET_BURST,
+# so at most about 10% extra upstream calls are made by default
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "3"))
+
+
+class Hedger:
+    """
+    Sends a second, hedge request to another model when the first is slow
+
+    If the primary model hasn't answered (or, for streams, produced its first
+    token) by a deadline based on its own latency percentiles, the same work
+    is started on the next best model. Whichever valid result arrives first
+    wins and the other request is cancelled. Hedges are paid for from a
+    budget that grows with the number of requests, so they can't multiply
+    upstream quota use.
+    """
+
+    def __init__(
+        self,
+        latency_percentile: Callable[[str, float], Optional[float]],
+        enabled: bool = HEDGING_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        min_delay: float = HEDGE_MIN_DELAY,
+        max_delay: float = HEDGE_MAX_DELAY,
+        default_delay: float = HEDGE_DEFAULT_DELAY,
+        first_token_delay: float = HEDGE_FIRST_TOKEN_DELAY,
+        budget_ratio: float = HEDGE_BUDGET_RATIO,
+        budget_burst: float = HEDGE_BUDGET_BURST
+    ):
+        """
+        Initialize the hedger
+
+        Args:
+            latency_percentile: Returns a model's latency percentile in seconds, or None without history
+            enabled: Whether to hedge at all
+            percentile: The latency percentile (0-100) used as the hedge deadline
+            min_delay: Shortest hedge delay in seconds
+            max_delay: Longest hedge delay in seconds
+            default_delay: Hedge delay for models without latency history
+            first_token_delay: Seconds to wait for a stream's first token before hedging
+            budget_ratio: Hedges earned per request
+            budget_burst: Most hedges that can be saved up
+        """
+        self.latency_percentile = latency_percentile
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.first_token_delay = first_token_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.budget = budget_burst
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def delay_for(self, model_id: str) -> float:
+        """
+        Get how long to wait for a model before hedging
+
+        Args:
+            model_id: The primary model
+
+        Returns:
+            The delay in seconds
+        """
+        delay = self.latency_percentile(model_id, self.percentile)
+        if delay is None:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _start_request(self) -> None:
+        self.requests += 1
+        self.budget = min(self.budget_burst, self.budget + self.budget_ratio)
+
+    def _hedge_model(self, model_id: str, alternative: Callable[[str], Optional[str]]) -> Optional[str]:
+        """Pick the model to hedge to, if the budget allows a hedge"""
+        if self.budget < 1.0:
+            self.budget_exhausted += 1
+            return None
+        hedge_model = alternative(model_id)
+        if not hedge_model or hedge_model == model_id:
+            return None
+        self.budget -= 1.0
+        self.hedged += 1
+        return hedge_model
+
+    async def run(
+        self,
+        model_id: str,
+        call: Callable[[str], Awaitable[T]],
+        alternative: Callable[[str], Optional[str]]
+    ) -> Tuple[T, str]:
+        """
+        Run call on the primary model, hedging to an alternative if it is slow
+
+        Args:
+            model_id: The primary model
+            call: Does the work for a model and returns a valid result (raising otherwise)
+            alternative: Returns the model to hedge to, given the primary (None for no hedge)
+
+        Returns:
+            The first valid result and the model that produced it
+        """
+        if not self.enabled:
+            return await call(model_id), model_id
+
+        self._start_request()
+        primary = asyncio.ensure_future(call(model_id))
+        contenders = {primary: model_id}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay_for(model_id))
+            if done:
+                return primary.result(), model_id
+
+            hedge_model = self._hedge_model(model_id, alternative)
+            if hedge_model is None:
+                return await primary, model_id
+
+            logger.info(f"Model {model_id} is slow, hedging with {hedge_model}")
+            contenders[asyncio.ensure_future(call(hedge_model))] = hedge_model
+            winner, error = await self._first_success(contenders)
+        finally:
+            # Cancel the loser, or everything if this caller was cancelled
+            for task in contenders:
+                task.cancel()
+
+        if winner is None:
+            raise error
+        if winner is not primary:
+            self.hedge_wins += 1
+        return winner.result(), contenders[winner]
+
+    async def stream(
+        self,
+        model_id: str,
+        open_stream: Callable[[str], AsyncIterator[str]],
+        alternative: Callable[[str], Optional[str]]
+    ) -> Tuple[AsyncIterator[str], str]:
+        """
+        Open a stream on the primary model, hedging if its first token is slow
+
+        Args:
+            model_id: The primary model
+            open_stream: Opens the stream for a model
+            alternative: Returns the model to hedge to, given the primary (None for no hedge)
+
+        Returns:
+            The stream that produced the first token (including that token) and its model
+        """
+        primary = open_stream(model_id)
+        if not self.enabled:
+            return primary, model_id
+
+        self._start_request()
+        first = asyncio.ensure_future(primary.__anext__())
+        streams = {first: (model_id, primary)}
+        winner = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.first_token_delay)
+            hedge_model = None if done else self._hedge_model(model_id, alternative)
+            if hedge_model is None:
+                winner = first
+                return _resume(first, primary), model_id
+
+            logger.info(f"Model {model_id} has not started streaming, hedging with {hedge_model}")
+            hedge = open_stream(hedge_model)
+            streams[asyncio.ensure_future(hedge.__anext__())] = (hedge_model, hedge)
+            winner, error = await self._first_success(streams)
+        finally:
+            # Close the losing stream, or every stream if this caller was cancelled
+            for task, (_, stream) in streams.items():
+                if task is not winner:
+                    task.cancel()
+                    await _close(task, stream)
+
+        if winner is None:
+            raise error
+        winning_model, winning_stream = streams[winner]
+        if winning_model != model_id:
+            self.hedge_wins += 1
+        return _resume(winner, winning_stream), winning_model
+
+    async def _first_success(self, tasks: Dict["asyncio.Future", Any]) -> Tuple[Optional["asyncio.Future"], Optional[BaseException]]:
+        """Wait for the first task to succeed, returning it or (None, first error) if all fail"""
+        pending = set(tasks)
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                # An empty stream counts as a (valid) result
+                if error is None or isinstance(error, StopAsyncIteration):
+                    return task, None
+                logger.warning(f"Hedged request to {tasks[task]} failed: {error}")
+                first_error = first_error or error
+        return None, first_error
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hedging statistics
+
+        Returns:
+            Dictionary with request, hedge and budget counters
+        """
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_ratio": self.hedged / self.requests if self.requests else 0.0,
+            "budget_available": round(self.budget, 3),
+            "budget_exhausted": self.budget_exhausted,
+        }
+
+
+async def _resume(first: "asyncio.Future", stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Yield the already requested first item of a stream, then the rest of it"""
+    try:
+        yield await first
+    except StopAsyncIteration:
+        return
+    async for item in stream:
+        yield item
+
+
+async def _close(task: "asyncio.Future", stream: AsyncIterator[str]) -> None:
+    """Wait for a cancelled read to finish, then close its stream"""
+    await asyncio.wait({task})
+    if not task.cancelled():
+        task.exception()  # Retrieve it so it isn't logged as never retrieved
+    await stream.aclose()
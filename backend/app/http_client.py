@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.http_client")
+
+# Connection pool configuration for the shared OpenRouter client
+HTTP2_ENABLED = os.getenv("OPENROUTER_HTTP2", "True").lower() in ("true", "1", "t", "yes")
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))  # seconds
+
+# Timeouts (seconds). The read timeout matches the old per-request 180 s limit.
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "180"))
+WRITE_TIMEOUT = float(os.getenv("OPENROUTER_WRITE_TIMEOUT", "30"))
+POOL_TIMEOUT = float(os.getenv("OPENROUTER_POOL_TIMEOUT", "30"))
+
+# The long-lived client for this worker process
+_client: Optional[httpx.AsyncClient] = None
+_http2_active = False
+
+# Counters used to report pool behaviour
+POOL_STATS = {
+    "requests": 0,
+    "in_flight": 0,
+    "connections_opened": 0,
+    "pool_wait_total": 0.0,
+    "pool_wait_max": 0.0,
+}
+
+
+def _http2_available() -> bool:
+    """Return True if the optional h2 package needed for HTTP/2 is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_client() -> httpx.AsyncClient:
+    """
+    Build a pooled AsyncClient using the configured limits and timeouts
+
+    Returns:
+        A new httpx.AsyncClient
+    """
+    global _http2_active
+
+    http2 = HTTP2_ENABLED
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; falling back to HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=CONNECT_TIMEOUT,
+        read=READ_TIMEOUT,
+        write=WRITE_TIMEOUT,
+        pool=POOL_TIMEOUT,
+    )
+
+    _http2_active = http2
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+async def start_client() -> httpx.AsyncClient:
+    """
+    Open the shared client for this worker if it isn't already open
+
+    Returns:
+        The shared httpx.AsyncClient
+    """
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = create_client()
+        logger.info(
+            f"Opened shared OpenRouter client (http2={_http2_active}, "
+            f"max_connections={MAX_CONNECTIONS}, max_keepalive={MAX_KEEPALIVE_CONNECTIONS})"
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client and release its pooled connections"""
+    global _client
+
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Closed shared OpenRouter client")
+    _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared client, creating it lazily if the startup hook has not run
+    (for example when generate_content is used from a script)
+
+    Returns:
+        The shared httpx.AsyncClient
+    """
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+def pool_trace() -> Dict[str, Any]:
+    """
+    Build request extensions that measure how long a request waited for a pooled connection
+
+    The wait ends when the pool either starts a new TCP connection or starts sending
+    headers on a reused one.
+
+    Returns:
+        A dict suitable for the ``extensions`` argument of an httpx request
+    """
+    started = time.perf_counter()
+    state = {"acquired": False}
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            POOL_STATS["connections_opened"] += 1
+        if state["acquired"]:
+            return
+        if event_name == "connection.connect_tcp.started" or event_name.endswith("send_request_headers.started"):
+            state["acquired"] = True
+            waited = time.perf_counter() - started
+            POOL_STATS["pool_wait_total"] += waited
+            POOL_STATS["pool_wait_max"] = max(POOL_STATS["pool_wait_max"], waited)
+
+    return {"trace": trace}
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    """
+    POST through the shared client while recording pool statistics
+
+    Args:
+        url: The URL to post to
+        **kwargs: Extra arguments passed to httpx.AsyncClient.post
+
+    Returns:
+        The httpx.Response
+    """
+    client = get_client()
+    POOL_STATS["requests"] += 1
+    POOL_STATS["in_flight"] += 1
+    try:
+        return await client.post(url, extensions=pool_trace(), **kwargs)
+    finally:
+        POOL_STATS["in_flight"] -= 1
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    """
+    Open a streaming request through the shared client while recording pool statistics
+
+    Args:
+        method: The HTTP method
+        url: The URL to request
+        **kwargs: Extra arguments passed to httpx.AsyncClient.stream
+
+    Yields:
+        The httpx.Response, whose body has not been read yet
+    """
+    client = get_client()
+    POOL_STATS["requests"] += 1
+    POOL_STATS["in_flight"] += 1
+    try:
+        async with client.stream(method, url, extensions=pool_trace(), **kwargs) as response:
+            yield response
+    finally:
+        POOL_STATS["in_flight"] -= 1
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Get connection pool statistics for the shared client
+
+    Returns:
+        Dictionary with connection counts, in-flight requests and pool wait times
+    """
+    in_use = 0
+    idle = 0
+
+    # httpx does not expose the pool publicly, so read it defensively
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    if _client is not None and not _client.is_closed and pool is not None:
+        for connection in pool.connections:
+            if connection.is_idle():
+                idle += 1
+            else:
+                in_use += 1
+
+    requests = POOL_STATS["requests"]
+    return {
+        "open": _client is not None and not _client.is_closed,
+        "http2": _http2_active,
+        "connections": {
+            "in_use": in_use,
+            "idle": idle,
+            "max": MAX_CONNECTIONS,
+            "max_keepalive": MAX_KEEPALIVE_CONNECTIONS,
+            "opened_total": POOL_STATS["connections_opened"],
+        },
+        "requests": {
+            "total": requests,
+            "in_flight": POOL_STATS["in_flight"],
+        },
+        "pool_wait_seconds": {
+            "avg": POOL_STATS["pool_wait_total"] / requests if requests else 0.0,
+            "max": POOL_STATS["pool_wait_max"],
+            "total": POOL_STATS["pool_wait_total"],
+        },
+    }
@@ -0,0 +1,762 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import socket
+import ipaddress
+import random
+import sqlite3
+import asyncio
+import itertools
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.jobs")
+
+# Job queue configuration
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite").lower()
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "jobs.sqlite3")
+)
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))  # Queued jobs per worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))  # Jobs running at once per worker process
+JOB_CONCURRENCY_PER_KIND = int(os.getenv("JOB_CONCURRENCY_PER_KIND", "4"))
+JOB_CONCURRENCY_PER_MODEL = int(os.getenv("JOB_CONCURRENCY_PER_MODEL", "2"))
+# Per-kind and per-model overrides, e.g. JOB_KIND_CONCURRENCY='{"lesson": 6}'
+JOB_KIND_CONCURRENCY = os.getenv("JOB_KIND_CONCURRENCY", "")
+JOB_MODEL_CONCURRENCY = os.getenv("JOB_MODEL_CONCURRENCY", "")
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(24 * 60 * 60)))  # Keep finished jobs for 24 hours
+JOB_CALLBACK_ATTEMPTS = int(os.getenv("JOB_CALLBACK_ATTEMPTS", "3"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+# Comma-separated callback hosts; ".example.com" also allows its subdomains. Empty allows
+# any public host. Listed hosts may resolve to private addresses, e.g. an internal service.
+JOB_CALLBACK_ALLOWED_HOSTS = os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "")
+# How often to look for jobs left behind by worker processes that have exited
+JOB_ORPHAN_CHECK_INTERVAL = float(os.getenv("JOB_ORPHAN_CHECK_INTERVAL", "60"))
+
+# Job priorities: higher numbers run first
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+DEFAULT_PRIORITY = 5
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a full queue"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Job queue is full, retry in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+def _host_allowed(host: str, allowed: List[str]) -> bool:
+    return any(
+        host == entry or (entry.startswith(".") and (host.endswith(entry) or host == entry[1:]))
+        for entry in allowed
+    )
+
+
+async def check_callback_url(url: str, allowed_hosts: str = JOB_CALLBACK_ALLOWED_HOSTS) -> Optional[str]:
+    """
+    Check that a callback URL is safe for the server to POST to
+
+    Without an allowlist, the host must resolve to public addresses only, so
+    a callback can't be aimed at the server itself, the cloud metadata
+    service or the internal network. With one, the host must be on it.
+
+    Args:
+        url: The callback URL
+        allowed_hosts: Comma-separated allowed hosts (see JOB_CALLBACK_ALLOWED_HOSTS)
+
+    Returns:
+        The vetted address to connect to, or None for an allowlisted host
+
+    Raises:
+        ValueError: If the URL is not http(s), or its host is not allowed
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower().rstrip(".")
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("callback_url must be an http(s) URL")
+
+    allowed = [entry.strip().lower() for entry in allowed_hosts.split(",") if entry.strip()]
+    if allowed:
+        if not _host_allowed(host, allowed):
+            raise ValueError(f"callback_url host {host} is not allowed")
+        return None
+
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+            )
+        except (socket.gaierror, UnicodeError):
+            raise ValueError(f"callback_url host {host} could not be resolved")
+        # Drop any IPv6 scope ID, e.g. "fe80::1%eth0"
+        addresses = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos]
+    for address in addresses:
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"callback_url host {host} is not a public address")
+    return str(addresses[0])
+
+
+async def post_callback(url: str, payload: Dict[str, Any], address: Optional[str]) -> httpx.Response:
+    """
+    POST a callback on a short-lived client of its own
+
+    The shared OpenRouter client isn't used, so callbacks don't count in its
+    pool stats or get its timeouts. Given an address, the connection goes to
+    it rather than resolving the host again, so DNS rebinding can't swap in
+    a private address after the check; the Host header and TLS server name
+    (certificates are still verified against it) stay the URL's host.
+
+    Args:
+        url: The callback URL
+        payload: The JSON body
+        address: The address check_callback_url vetted, or None to resolve the host
+
+    Returns:
+        The response; redirects are not followed
+    """
+    target = httpx.URL(url)
+    headers, extensions = {}, {}
+    if address is not None:
+        headers["Host"] = target.netloc.decode("ascii")
+        if target.scheme == "https":
+            extensions["sni_hostname"] = target.host
+        target = target.copy_with(host=address)
+    # trust_env=False: a proxy from the environment would resolve the host itself
+    async with httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT, trust_env=False) as client:
+        return await client.post(target, json=payload, headers=headers, extensions=extensions)
+
+
+def _parse_concurrency(value: str) -> Dict[str, int]:
+    """Parse a JSON mapping of names to concurrency limits"""
+    if not value:
+        return {}
+    try:
+        return {name: int(limit) for name, limit in json.loads(value).items()}
+    except (ValueError, TypeError, AttributeError):
+        logger.warning(f"Could not parse job concurrency configuration {value!r}, ignoring it")
+        return {}
+
+
+class JobStore:
+    """Interface for where job records are kept"""
+
+    name = "base"
+
+    def create(self, job: Dict[str, Any]) -> None:
+        """
+        Store a new job
+
+        Args:
+            job: The job record, including its "id"
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job
+
+        Args:
+            job_id: The job ID
+
+        Returns:
+            The job record, or None if unknown or expired
+        """
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        """
+        Change fields of a job
+
+        Args:
+            job_id: The job ID
+            **fields: The fields to change
+        """
+        raise NotImplementedError
+
+    def claim_orphans(self, owner: str) -> List[Dict[str, Any]]:
+        """
+        Take over unfinished jobs whose owning process is gone
+
+        Args:
+            owner: The ID of the process taking them over, from current_owner()
+
+        Returns:
+            The jobs taken over, reset to queued
+        """
+        return []
+
+
+class MemoryJobStore(JobStore):
+    """Jobs kept in this worker process only; lost on restart"""
+
+    name = "memory"
+
+    # Drop finished jobs past their TTL once every this many creates
+    CLEANUP_INTERVAL = 100
+
+    def __init__(self, ttl: float = JOB_RESULT_TTL):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._creates = 0
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = dict(job)
+        self._creates += 1
+        if self._creates % self.CLEANUP_INTERVAL == 0:
+            cutoff = time.time() - self.ttl
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job["status"] in FINISHED_STATUSES and job["finished_at"] < cutoff]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Jobs kept in a SQLite file shared by every worker on the host
+
+    Any worker can answer GET /jobs/{id}, and jobs survive restarts: queued
+    or running jobs whose worker process has gone are picked up again by
+    another worker.
+    """
+
+    name = "sqlite"
+
+    # Columns stored as JSON text
+    JSON_FIELDS = ("request", "result", "callback")
+    CLEANUP_INTERVAL = 100
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: float = JOB_RESULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._creates = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database lazily, once per process (connections can't cross a fork)"""
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                model TEXT,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                request TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                callback_url TEXT,
+                callback TEXT,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at)")
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def _encode(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            name: json.dumps(value) if name in self.JSON_FIELDS and value is not None else value
+            for name, value in fields.items()
+        }
+
+    def _decode(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for name in self.JSON_FIELDS:
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+    def create(self, job: Dict[str, Any]) -> None:
+        conn = self._connection()
+        fields = self._encode(job)
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        conn.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(fields.values()))
+
+        self._creates += 1
+        if self._creates % self.CLEANUP_INTERVAL == 0:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED_STATUSES, time.time() - self.ttl)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connection().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim_orphans(self, owner: str) -> List[Dict[str, Any]]:
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY priority DESC, created_at",
+            (QUEUED, RUNNING)
+        ).fetchall()
+
+        claimed = []
+        for row in rows:
+            if row["owner"] == owner or _owner_alive(row["owner"]):
+                continue
+            # Only one worker wins the claim, even if several start at once
+            cursor = conn.execute(
+                "UPDATE jobs SET owner = ?, status = ?, started_at = NULL WHERE id = ? AND owner IS ?",
+                (owner, QUEUED, row["id"], row["owner"])
+            )
+            if cursor.rowcount == 1:
+                job = self._decode(row)
+                job.update(owner=owner, status=QUEUED, started_at=None)
+                claimed.append(job)
+        return claimed
+
+
+_owner: Optional[str] = None
+_owner_pid: Optional[int] = None
+
+
+def current_owner() -> str:
+    """
+    Get the ID this process records as the owner of its jobs
+
+    The pid alone isn't enough: a restarted worker can be given the pid of
+    the dead worker whose jobs it should resume. The process start time
+    tells them apart; where it can't be read, a random suffix is used.
+
+    Returns:
+        "<pid>:<start time>", or "<pid>:<random hex>"
+    """
+    global _owner, _owner_pid
+    pid = os.getpid()
+    if _owner_pid != pid:
+        started = _process_start(pid)
+        _owner = f"{pid}:{started if started is not None else uuid.uuid4().hex}"
+        _owner_pid = pid
+    return _owner
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """Get a process's start time in clock ticks since boot; None if unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name can contain spaces, so count fields after its closing parenthesis
+    fields = stat.rsplit(")", 1)[-1].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+def _owner_alive(owner: Optional[Any]) -> bool:
+    """Check whether the process that recorded `owner` is still running"""
+    if not owner:
+        return False
+    pid, _, started = str(owner).partition(":")
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return str(owner) == current_owner()
+    if not _process_alive(pid):
+        return False
+    if not started:
+        # Recorded before owners carried a start time
+        return True
+    current = _process_start(pid)
+    # Without /proc, a live pid has to be taken at its word
+    return current is None or current == started
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    """
+    Create the configured job store
+
+    Args:
+        backend: "memory" or "sqlite"
+
+    Returns:
+        A JobStore instance
+    """
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend != "memory":
+        logger.warning(f"Unknown job store backend '{backend}', using in-process job store")
+    return MemoryJobStore()
+
+
+# A job handler receives the validated request (as a dict) and returns the result as a dict
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """
+    Bounded priority queue running generation jobs in the background
+
+    Jobs are run by a fixed number of worker tasks, in priority order, with
+    separate concurrency limits per job kind and per model so that one slow
+    model or endpoint can't take every slot: a worker takes the highest
+    priority job whose kind and model both have a free slot, leaving the
+    others queued, so a backlog for one model never holds up the rest. When
+    the queue is full, submit() raises QueueFullError with an estimate of
+    when to retry.
+    """
+
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        max_size: int = JOB_QUEUE_MAX_SIZE,
+        workers: int = JOB_WORKERS,
+        per_kind: int = JOB_CONCURRENCY_PER_KIND,
+        per_model: int = JOB_CONCURRENCY_PER_MODEL,
+        kind_limits: Optional[Dict[str, int]] = None,
+        model_limits: Optional[Dict[str, int]] = None
+    ):
+        """
+        Initialize the queue
+
+        Args:
+            store: Where job records are kept (defaults to the configured store)
+            max_size: Most jobs waiting to run
+            workers: Most jobs running at once
+            per_kind: Most jobs of one kind running at once
+            per_model: Most jobs for one model running at once
+            kind_limits: Per-kind overrides of per_kind
+            model_limits: Per-model overrides of per_model
+        """
+        self.store = store or create_job_store()
+        self.max_size = max_size
+        self.workers = workers
+        self.per_kind = per_kind
+        self.per_model = per_model
+        self.kind_limits = kind_limits if kind_limits is not None else _parse_concurrency(JOB_KIND_CONCURRENCY)
+        self.model_limits = model_limits if model_limits is not None else _parse_concurrency(JOB_MODEL_CONCURRENCY)
+        self._handlers: Dict[str, JobHandler] = {}
+        # Queued jobs, highest priority first, then first come first served
+        self._pending: List[Tuple[int, int, Dict[str, Any]]] = []
+        # Workers waiting for a job they can run
+        self._waiters: List[asyncio.Future] = []
+        self._tasks: List[asyncio.Task] = []
+        # Running jobs per "kind:<kind>" and "model:<model>"
+        self._active: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        # Moving average of job run time, for Retry-After estimates
+        self.average_duration = 30.0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the handler for a job kind
+
+        Args:
+            kind: The job kind, e.g. "lesson"
+            handler: Coroutine function running the job
+        """
+        self._handlers[kind] = handler
+
+    @property
+    def kinds(self) -> List[str]:
+        return list(self._handlers)
+
+    async def start(self) -> None:
+        """Start the worker tasks and pick up jobs orphaned by dead workers"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._reclaim_orphans()))
+
+    async def _reclaim_orphans(self) -> None:
+        """Resume jobs left behind by stopped workers, now and then periodically"""
+        while True:
+            try:
+                for job in self.store.claim_orphans(current_owner()):
+                    logger.info(f"Resuming job {job['id']} left unfinished by a stopped worker")
+                    self._enqueue(job)
+            except Exception:
+                logger.exception("Could not check for orphaned jobs")
+            await asyncio.sleep(JOB_ORPHAN_CHECK_INTERVAL)
+
+    async def stop(self) -> None:
+        """Stop the worker tasks; running jobs are cancelled and resumed by the next worker"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self,
+        kind: str,
+        request: Dict[str, Any],
+        priority: int = DEFAULT_PRIORITY,
+        callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a job
+
+        Args:
+            kind: The job kind
+            request: The validated request, as a dict
+            priority: 0 (lowest) to 9 (highest)
+            callback_url: Optional URL to POST the finished job to
+
+        Returns:
+            The job record
+
+        Raises:
+            QueueFullError: If the queue is full
+        """
+        if kind not in self._handlers:
+            raise Exception(f"Unknown job kind: {kind}")
+        if not self._tasks:
+            raise Exception("Job queue is not running")
+        if len(self._pending) >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "model": request.get("model"),
+            "status": QUEUED,
+            "priority": max(MIN_PRIORITY, min(MAX_PRIORITY, priority)),
+            "request": request,
+            "result": None,
+            "error": None,
+            "callback_url": callback_url,
+            "callback": None,
+            "owner": current_owner(),
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        self.store.create(job)
+        self._enqueue(job)
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job
+
+        Args:
+            job_id: The job ID
+
+        Returns:
+            The job record, or None if unknown
+        """
+        return self.store.get(job_id)
+
+    def retry_after(self) -> float:
+        """Estimate how many seconds until the queue has room again"""
+        queued = len(self._pending)
+        return max(1.0, self.average_duration * (queued - self.max_size + 1) / max(1, self.workers))
+
+    def _enqueue(self, job: Dict[str, Any]) -> None:
+        bisect.insort(self._pending, (-job["priority"], next(self._sequence), job))
+        self._wake()
+
+    def _wake(self) -> None:
+        """Let waiting workers look for a job again"""
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def _slots(self, job: Dict[str, Any]) -> List[Tuple[str, int]]:
+        """The job's kind and model slots, with their limits"""
+        return [
+            (f"kind:{job['kind']}", self.kind_limits.get(job["kind"], self.per_kind)),
+            (f"model:{job['model']}", self.model_limits.get(job["model"], self.per_model)),
+        ]
+
+    def _take(self) -> Optional[Dict[str, Any]]:
+        """Remove the first queued job whose slots are free and occupy them; None if there is none"""
+        for index, (_, _, job) in enumerate(self._pending):
+            slots = self._slots(job)
+            if all(self._active.get(name, 0) < limit for name, limit in slots):
+                del self._pending[index]
+                for name, _ in slots:
+                    self._active[name] = self._active.get(name, 0) + 1
+                return job
+        return None
+
+    def _release(self, job: Dict[str, Any]) -> None:
+        for name, _ in self._slots(job):
+            self._active[name] -= 1
+        self._wake()
+
+    async def _work(self) -> None:
+        while True:
+            job = self._take()
+            if job is None:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Job {job['id']} crashed the job worker")
+            finally:
+                self._release(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        started = time.time()
+        self.store.update(job["id"], status=RUNNING, started_at=started)
+        self.running += 1
+        try:
+            result = await self._handlers[job["kind"]](job["request"])
+            fields = {"status": SUCCEEDED, "result": result}
+            self.succeeded += 1
+        except asyncio.CancelledError:
+            # Shutting down: leave the job for the next worker to resume
+            self.store.update(job["id"], status=QUEUED, started_at=None)
+            raise
+        except Exception as e:
+            fields = {"status": FAILED, "error": getattr(e, "detail", None) or str(e)}
+            self.failed += 1
+        finally:
+            self.running -= 1
+
+        finished = time.time()
+        self.average_duration += 0.2 * ((finished - started) - self.average_duration)
+        fields["finished_at"] = finished
+        self.store.update(job["id"], **fields)
+        logger.info(f"Job {job['id']} ({job['kind']}) {fields['status']} in {finished - started:.1f}s")
+
+        if job.get("callback_url"):
+            job.update(fields)
+            await self._send_callback(job)
+
+    async def _send_callback(self, job: Dict[str, Any]) -> None:
+        """POST the finished job to its callback URL, retrying with backoff"""
+        payload = public_job(job)
+        callback = {"attempts": 0, "status_code": None, "error": None}
+        try:
+            # Again, in case the host now resolves somewhere else
+            address = await check_callback_url(job["callback_url"])
+        except ValueError as e:
+            callback["error"] = str(e)
+            logger.warning(f"Callback for job {job['id']} not sent: {e}")
+            self.store.update(job["id"], callback=callback)
+            return
+        for attempt in range(JOB_CALLBACK_ATTEMPTS):
+            callback["attempts"] = attempt + 1
+            try:
+                response = await post_callback(job["callback_url"], payload, address)
+                callback["status_code"] = response.status_code
+                if response.status_code < 500:
+                    callback["error"] = None if response.status_code < 400 else f"HTTP {response.status_code}"
+                    break
+                callback["error"] = f"HTTP {response.status_code}"
+            except Exception as e:
+                callback["error"] = str(e) or type(e).__name__
+            if attempt + 1 < JOB_CALLBACK_ATTEMPTS:
+                await asyncio.sleep(random.uniform(0, 2 ** attempt))
+
+        if callback["error"]:
+            logger.warning(f"Callback for job {job['id']} failed: {callback['error']}")
+        self.store.update(job["id"], callback=callback)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue statistics
+
+        Returns:
+            Dictionary with queue depth, running jobs and outcome counters
+        """
+        return {
+            "store": self.store.name,
+            "queued": len(self._pending),
+            "max_size": self.max_size,
+            "running": self.running,
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "average_duration": round(self.average_duration, 3),
+        }
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the fields of a job that are returned to clients
+
+    Args:
+        job: The job record
+
+    Returns:
+        The job without internal bookkeeping fields
+    """
+    return {name: value for name, value in job.items() if name != "owner"}
@@ -0,0 +1,391 @@
+import re
+import json
+from json.decoder import scanstring
+from typing import Dict, Any, List, Optional, Tuple
+
+# Token patterns used by the parser
+_WHITESPACE = re.compile(r"\s*")
+_NUMBER = re.compile(r"-?(?:\d+)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_NUMBER_CHARACTERS = re.compile(r"[-+0-9.eE]+")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_\-]*")
+_INVALID_ESCAPE = re.compile(r"\\(?![\"\\/bfnrtu])")
+_UNESCAPED_DOUBLE_QUOTE = re.compile(r'(?<!\\)"')
+
+# Bare words that map to JSON literals (models sometimes emit Python spellings)
+_LITERALS = {
+    "true": True, "True": True,
+    "false": False, "False": False,
+    "null": None, "None": None,
+}
+
+# What the innermost open container expects next
+_EXPECT_KEY = 0
+_EXPECT_COLON = 1
+_EXPECT_VALUE = 2
+_EXPECT_COMMA = 3
+
+# Drop consumed text once this much of the buffer has been parsed
+_COMPACT_THRESHOLD = 4096
+
+
+class _Frame:
+    """An open object or array on the parser stack"""
+
+    __slots__ = ("container", "is_object", "key", "expect", "name")
+
+    def __init__(self, is_object: bool, name: Optional[str]):
+        self.container = {} if is_object else []
+        self.is_object = is_object
+        self.key = None
+        self.expect = _EXPECT_KEY if is_object else _EXPECT_VALUE
+        # Path of this container relative to the root, used for field events
+        self.name = name
+
+
+class StreamingJSONParser:
+    """
+    Incremental, single-pass parser for the JSON object in an AI response
+
+    Text can be fed in chunks as it arrives from the model. The parser skips
+    any prose or markdown code fence before the first "{", ignores whatever
+    follows the closing "}", and repairs common model mistakes as it goes:
+    trailing commas, missing commas, single-quoted strings, bare keys,
+    Python literals, invalid escapes and a truncated tail.
+
+    Each call to feed() returns the top-level fields that completed during
+    that chunk, e.g. ("title", "..."), ("questions[0]", {...}) and then
+    ("questions", [...]) once the array closes.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pending: List[str] = []
+        self._pos = 0
+        self._string_scan = 0
+        # Quote character of a string still waiting for its closing quote
+        self._open_quote: Optional[str] = None
+        self._stack: List[_Frame] = []
+        self._root: Optional[Dict[str, Any]] = None
+        self._started = False
+        self._done = False
+        self._events: List[Tuple[str, Any]] = []
+        self.repairs: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """True once the root object has been closed"""
+        return self._done
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Feed the next chunk of text
+
+        Args:
+            chunk: The next piece of the response
+
+        Returns:
+            List of (path, value) pairs for top-level fields completed by this chunk
+        """
+        if self._done or not chunk:
+            return []
+
+        # Inside a long string, hold chunks back until one could close it,
+        # rather than copying the whole buffer for every chunk
+        if self._open_quote is not None and self._open_quote not in chunk:
+            self._pending.append(chunk)
+            return []
+
+        self._pending.append(chunk)
+        self._buffer += "".join(self._pending)
+        self._pending = []
+        self._parse(final=False)
+        return self._take_events()
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Finish parsing, closing anything a truncated response left open
+
+        Returns:
+            The parsed object
+
+        Raises:
+            ValueError: If the text contained no JSON object
+        """
+        if not self._done:
+            if self._pending:
+                self._buffer += "".join(self._pending)
+                self._pending = []
+            self._parse(final=True)
+            if not self._started:
+                raise ValueError("Could not extract valid JSON from response")
+            if not self._done:
+                self._repair("truncated")
+                self._close_truncated()
+        self._events = []
+        return self._root
+
+    def _take_events(self) -> List[Tuple[str, Any]]:
+        events = self._events
+        self._events = []
+        return events
+
+    def _repair(self, kind: str) -> None:
+        if kind not in self.repairs:
+            self.repairs.append(kind)
+
+    def _parse(self, final: bool) -> None:
+        buffer = self._buffer
+        pos = self._pos
+        length = len(buffer)
+
+        # Skip leading prose and code fences up to the start of the object
+        if not self._started:
+            start = buffer.find("{", pos)
+            if start == -1:
+                self._pos = length
+                return
+            self._started = True
+            self._stack.append(_Frame(True, None))
+            pos = start + 1
+
+        stack = self._stack
+        while stack:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= length:
+                break
+
+            frame = stack[-1]
+            char = buffer[pos]
+            expect = frame.expect
+
+            if expect == _EXPECT_COMMA:
+                if char == ",":
+                    frame.expect = _EXPECT_KEY if frame.is_object else _EXPECT_VALUE
+                    pos += 1
+                elif char == "}" or char == "]":
+                    if (char == "}") != frame.is_object:
+                        self._repair("mismatched_bracket")
+                    pos += 1
+                    self._close_frame()
+                else:
+                    # The model forgot a comma between two members
+                    self._repair("missing_comma")
+                    frame.expect = _EXPECT_KEY if frame.is_object else _EXPECT_VALUE
+
+            elif expect == _EXPECT_KEY:
+                if char == "}":
+                    pos += 1
+                    self._close_frame()
+                elif char == '"' or char == "'":
+                    self._pos = pos
+                    key = self._scan_string(char, final)
+                    if key is None:
+                        return
+                    pos = self._pos
+                    frame.key = key
+                    frame.expect = _EXPECT_COLON
+                elif char == ",":
+                    self._repair("trailing_comma")
+                    pos += 1
+                else:
+                    match = _IDENTIFIER.match(buffer, pos)
+                    if match:
+                        if match.end() == length and not final:
+                            break
+                        self._repair("bare_key")
+                        frame.key = match.group(0)
+                        frame.expect = _EXPECT_COLON
+                        pos = match.end()
+                    else:
+                        self._repair("skipped_character")
+                        pos += 1
+
+            elif expect == _EXPECT_COLON:
+                if char == ":":
+                    frame.expect = _EXPECT_VALUE
+                    pos += 1
+                else:
+                    self._repair("missing_colon")
+                    frame.expect = _EXPECT_VALUE
+
+            else:  # _EXPECT_VALUE
+                if char == "{" or char == "[":
+                    stack.append(_Frame(char == "{", self._child_name(frame)))
+                    pos += 1
+                elif char == '"' or char == "'":
+                    self._pos = pos
+                    value = self._scan_string(char, final)
+                    if value is None:
+                        return
+                    pos = self._pos
+                    self._add_value(value)
+                elif char == "]" or char == "}":
+                    # Either an empty array, a trailing comma, or a key with no value
+                    if frame.is_object or len(frame.container):
+                        self._repair("trailing_comma")
+                    if (char == "}") != frame.is_object:
+                        self._repair("mismatched_bracket")
+                    frame.key = None
+                    pos += 1
+                    self._close_frame()
+                elif char == "-" or "0" <= char <= "9":
+                    # A number at the end of the buffer may still be growing
+                    if _NUMBER_CHARACTERS.match(buffer, pos).end() == length and not final:
+                        break
+                    match = _NUMBER.match(buffer, pos)
+                    if match:
+                        text = match.group(0)
+                        self._add_value(float(text) if "." in text or "e" in text or "E" in text else int(text))
+                        pos = match.end()
+                    else:
+                        self._repair("skipped_character")
+                        pos += 1
+                else:
+                    match = _IDENTIFIER.match(buffer, pos)
+                    if match:
+                        if match.end() == length and not final:
+                            break
+                        word = match.group(0)
+                        if word in _LITERALS:
+                            if word not in ("true", "false", "null"):
+                                self._repair("python_literal")
+                            self._add_value(_LITERALS[word])
+                        else:
+                            self._repair("bare_string")
+                            self._add_value(word)
+                        pos = match.end()
+                    else:
+                        self._repair("skipped_character")
+                        pos += 1
+
+        self._pos = pos
+        if pos > _COMPACT_THRESHOLD:
+            self._buffer = self._buffer[pos:]
+            self._pos = 0
+
+    def _scan_string(self, quote: str, final: bool) -> Optional[str]:
+        """
+        Scan the string starting at the current position
+
+        Returns None (leaving the position unchanged) if the closing quote has
+        not arrived yet. Progress is remembered, so a long string fed in many
+        small chunks is still only scanned once.
+        """
+        buffer = self._buffer
+        start = self._pos
+        search = max(self._string_scan, start + 1)
+
+        while True:
+            end = buffer.find(quote, search)
+            if end == -1:
+                if not final:
+                    self._string_scan = len(buffer)
+                    self._open_quote = quote
+                    return None
+                # Truncated inside a string: keep what we have
+                self._repair("truncated")
+                raw = buffer[start + 1:].rstrip("\\")
+                self._pos = len(buffer)
+                self._string_scan = 0
+                return self._decode_string(raw, quote)
+
+            # A quote preceded by an odd number of backslashes is escaped
+            backslashes = 0
+            index = end - 1
+            while index > start and buffer[index] == "\\":
+                backslashes += 1
+                index -= 1
+            if backslashes % 2 == 0:
+                break
+            search = end + 1
+
+        self._pos = end + 1
+        self._string_scan = 0
+        self._open_quote = None
+
+        if quote == '"':
+            try:
+                return scanstring(buffer, start + 1, False)[0]
+            except json.JSONDecodeError:
+                pass
+
+        return self._decode_string(buffer[start + 1:end], quote)
+
+    def _decode_string(self, raw: str, quote: str) -> str:
+        """Decode string contents that json could not decode directly"""
+        if quote == "'":
+            self._repair("single_quotes")
+            raw = _UNESCAPED_DOUBLE_QUOTE.sub(r'\\"', raw.replace("\\'", "'"))
+        try:
+            return scanstring(raw + '"', 0, False)[0]
+        except json.JSONDecodeError:
+            self._repair("invalid_escape")
+            raw = _INVALID_ESCAPE.sub(r"\\\\", raw)
+            try:
+                return scanstring(raw + '"', 0, False)[0]
+            except json.JSONDecodeError:
+                return raw
+
+    def _child_name(self, frame: _Frame) -> Optional[str]:
+        """Path of a container about to be opened inside ``frame``, if it is a top-level field"""
+        if len(self._stack) == 1:
+            return frame.key
+        if len(self._stack) == 2 and not frame.is_object and frame.name is not None:
+            return f"{frame.name}[{len(frame.container)}]"
+        return None
+
+    def _add_value(self, value: Any) -> None:
+        """Add a completed value to the innermost container and emit field events"""
+        frame = self._stack[-1]
+        depth = len(self._stack)
+
+        if frame.is_object:
+            if frame.key is None:
+                # A value without a key can't be placed in an object
+                self._repair("missing_key")
+            else:
+                frame.container[frame.key] = value
+                if depth == 1:
+                    self._events.append((frame.key, value))
+                frame.key = None
+        else:
+            if depth == 2 and frame.name is not None:
+                self._events.append((f"{frame.name}[{len(frame.container)}]", value))
+            frame.container.append(value)
+
+        frame.expect = _EXPECT_COMMA
+
+    def _close_frame(self) -> None:
+        """Close the innermost container and add it to its parent"""
+        frame = self._stack.pop()
+        if not self._stack:
+            self._root = frame.container
+            self._done = True
+            return
+        self._add_value(frame.container)
+
+    def _close_truncated(self) -> None:
+        """Close every container left open by a truncated response"""
+        while self._stack:
+            frame = self._stack[-1]
+            # Drop a key whose value never arrived
+            frame.key = None
+            self._close_frame()
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    Parse the JSON object in an AI response in a single pass, repairing it if needed
+
+    Args:
+        text: The full response text
+
+    Returns:
+        The parsed object
+
+    Raises:
+        ValueError: If the text contained no JSON object
+    """
+    parser = StreamingJSONParser()
+    parser.feed(text)
+    return parser.close()
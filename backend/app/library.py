@@ -0,0 +1,451 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from .prompts import REQUEST_KINDS
+from .semantic_cache import describe_request
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.library")
+
+# Content library configuration
+LIBRARY_ENABLED = os.getenv("LIBRARY_ENABLED", "True").lower() in ("true", "1", "t", "yes")
+LIBRARY_PATH = os.getenv(
+    "LIBRARY_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "library.sqlite3")
+)
+LIBRARY_PAGE_SIZE = 20
+# Request counts are kept in memory and written at most this often (seconds)
+LIBRARY_DEMAND_FLUSH_INTERVAL = 10.0
+LIBRARY_MAX_PAGE_SIZE = 100
+
+# Result fields searched besides the title, topic, subject and tags
+BODY_FIELDS = ("overview", "description", "instructions", "objectives")
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+def request_key(request: BaseModel) -> Optional[str]:
+    """
+    Get the key under which equivalent requests' results are stored
+
+    Requests share a key when they ask for the same kind of content with
+    the same normalized topic, notes and settings, whatever model they name.
+
+    Args:
+        request: A LessonRequest, AssessmentRequest or LabRequest
+
+    Returns:
+        The key, or None for other request types
+    """
+    described = describe_request(request)
+    if described is None:
+        return None
+    partition, text = described
+    return f"{partition}|{text}"
+
+
+def _match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = _WORDS.findall(query.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "title": row["title"],
+        "topic": row["topic"],
+        "subject": row["subject"],
+        "gradeLevel": row["grade_level"],
+        "tags": json.loads(row["tags"]),
+        "model": row["model"],
+        "createdAt": datetime.fromtimestamp(row["created_at"]).isoformat(),
+    }
+
+
+class ContentLibrary:
+    """
+    Every generated lesson, assessment and lab, kept in a SQLite file with a full-text index
+
+    Results are stored by id with the request that produced them, so they
+    can be searched (title, topic, subject, tags and summary text, ranked
+    by BM25), fetched again, and returned for an equivalent request instead
+    of calling a model. Requests are also counted per day, so the most
+    popular can be generated ahead of time. The file is shared by every
+    worker on the host.
+    """
+
+    def __init__(self, path: str = LIBRARY_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        # Writes run in threads and share the connection; their transactions must not interleave
+        self._lock = threading.Lock()
+        # (request JSON, kind, day) -> [count, last request time], not yet written
+        self._demand: Dict[Tuple[str, str, int], List[float]] = {}
+        self._demand_lock = threading.Lock()
+        self._demand_flushed_at = time.monotonic()
+        self.saved = 0
+        self.reused = 0
+        self.searches = 0
+        self.recorded = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database lazily, once per process (connections can't cross a fork)"""
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS content (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                subject TEXT,
+                grade_level TEXT,
+                tags TEXT NOT NULL,
+                model TEXT,
+                request_key TEXT,
+                request TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS content_request_key ON content (request_key, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS content_created ON content (kind, created_at)")
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+                id UNINDEXED, title, topic, subject, tags, body,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )
+        """)
+
+        # Requests per day, for pre-warming the response cache (see app/prewarm.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS demand (
+                request TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                last_at REAL NOT NULL,
+                PRIMARY KEY (request, day)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS demand_day ON demand (day)")
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def save(self, request: BaseModel, result: BaseModel, model_id: Optional[str]) -> None:
+        """
+        Store a generated result
+
+        Blocks on the database; call it from a thread.
+
+        Args:
+            request: The generation request
+            result: The validated LessonResult, AssessmentResult or Lab
+            model_id: The model that generated it
+        """
+        kind = REQUEST_KINDS.get(type(request).__name__)
+        if kind is None:
+            return
+        content = result.model_dump(mode="json")
+        tags = [str(tag) for tag in content.get("tags") or []]
+        subject = content.get("subject") or content.get("category")
+        body = " ".join(
+            " ".join(value) if isinstance(value, list) else str(value)
+            for value in (content.get(field) for field in BODY_FIELDS) if value
+        )
+
+        with self._lock:
+            self._write_content(content, kind, request, subject, tags, body, model_id)
+        self.saved += 1
+
+    def _write_content(
+        self,
+        content: Dict[str, Any],
+        kind: str,
+        request: BaseModel,
+        subject: Optional[str],
+        tags: List[str],
+        body: str,
+        model_id: Optional[str]
+    ) -> None:
+        """Insert a result and its full-text row in one transaction (called with the write lock held)"""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO content (id, kind, title, topic, subject, grade_level, tags, model, "
+                "request_key, request, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    content["id"], kind, content.get("title", ""), request.topic, subject,
+                    content.get("gradeLevel") or request.gradeLevel, json.dumps(tags), model_id,
+                    request_key(request), request.model_dump_json(), json.dumps(content), time.time()
+                )
+            )
+            conn.execute("DELETE FROM content_fts WHERE id = ?", (content["id"],))
+            conn.execute(
+                "INSERT INTO content_fts (id, title, topic, subject, tags, body) VALUES (?, ?, ?, ?, ?, ?)",
+                (content["id"], content.get("title", ""), request.topic, subject or "", " ".join(tags), body)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, content_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a stored result
+
+        Args:
+            content_id: The result's id
+
+        Returns:
+            The summary fields plus the request and result, or None if unknown
+        """
+        row = self._connection().execute("SELECT * FROM content WHERE id = ?", (content_id,)).fetchone()
+        if row is None:
+            return None
+        return {**_summary(row), "request": json.loads(row["request"]), "result": json.loads(row["result"])}
+
+    def find_match(self, request: BaseModel) -> Optional[Dict[str, Any]]:
+        """
+        Find the newest result generated for an equivalent request
+
+        Args:
+            request: The generation request
+
+        Returns:
+            The stored result, or None if there is none
+        """
+        key = request_key(request)
+        if key is None:
+            return None
+        row = self._connection().execute(
+            "SELECT id, model, result FROM content WHERE request_key = ? ORDER BY created_at DESC LIMIT 1", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.reused += 1
+        return {"id": row["id"], "model": row["model"], "result": json.loads(row["result"])}
+
+    def record_request(self, request: BaseModel) -> bool:
+        """
+        Count a generation request, whether or not it reaches a model
+
+        Answers from the library or the semantic cache never reach save(),
+        so this, not the stored results, tells which requests are popular.
+        Counts are kept in memory until flush_requests() writes them.
+
+        Args:
+            request: The generation request
+
+        Returns:
+            True when the counts are due to be written
+        """
+        kind = REQUEST_KINDS.get(type(request).__name__)
+        if kind is None:
+            return False
+        now = time.time()
+        key = (request.model_dump_json(), kind, int(now // 86400))
+        with self._demand_lock:
+            entry = self._demand.setdefault(key, [0, now])
+            entry[0] += 1
+            entry[1] = now
+        self.recorded += 1
+        return time.monotonic() - self._demand_flushed_at >= LIBRARY_DEMAND_FLUSH_INTERVAL
+
+    def flush_requests(self) -> int:
+        """
+        Write the request counts kept in memory
+
+        Blocks on the database; call it from a thread.
+
+        Returns:
+            The number of (request, day) rows written
+        """
+        with self._demand_lock:
+            pending, self._demand = self._demand, {}
+            self._demand_flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO demand (request, kind, day, count, last_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (request, day) DO UPDATE SET count = count + excluded.count, "
+                    "last_at = MAX(last_at, excluded.last_at)",
+                    [(request, kind, day, count, last_at) for (request, kind, day), (count, last_at) in pending.items()]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(pending)
+
+    def popular_requests(self, days: int, limit: int, min_count: int = 1) -> List[Dict[str, Any]]:
+        """
+        Get the most frequent requests of the last few days
+
+        Requests count as the same only when every field matches, since
+        that is when they share a prompt and a cached response.
+
+        Args:
+            days: Days of history to count, including today
+            limit: Most requests to return
+            min_count: Fewest times a request must have been made
+
+        Returns:
+            Dictionaries with the kind, the request, its count and when it was last made, most frequent first
+        """
+        self.flush_requests()
+        since = int(time.time() // 86400) - max(days, 1) + 1
+        rows = self._connection().execute(
+            "SELECT request, kind, SUM(count) AS count, MAX(last_at) AS last_at FROM demand WHERE day >= ? "
+            "GROUP BY request HAVING SUM(count) >= ? ORDER BY count DESC, last_at DESC LIMIT ?",
+            (since, min_count, limit)
+        ).fetchall()
+        return [
+            {"kind": row["kind"], "request": json.loads(row["request"]), "count": row["count"], "last_at": row["last_at"]}
+            for row in rows
+        ]
+
+    def forget_requests(self, days: int) -> int:
+        """
+        Drop request counts older than the last few days
+
+        Args:
+            days: Days of history to keep, including today
+
+        Returns:
+            The number of rows removed
+        """
+        since = int(time.time() // 86400) - max(days, 1) + 1
+        with self._lock:
+            return self._connection().execute("DELETE FROM demand WHERE day < ?", (since,)).rowcount
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        kind: Optional[str] = None,
+        subject: Optional[str] = None,
+        grade_level: Optional[str] = None,
+        tag: Optional[str] = None,
+        page: int = 1,
+        page_size: int = LIBRARY_PAGE_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Search stored results
+
+        Args:
+            query: Words that must all appear (as prefixes) in the title, topic, subject, tags or summary
+            kind: "lesson", "assessment" or "lab"
+            subject: Exact subject (or lab category), case-insensitive
+            grade_level: Exact grade level, case-insensitive
+            tag: A tag the result must have, case-insensitive
+            page: Page number, from 1
+            page_size: Results per page
+
+        Returns:
+            The page of result summaries, ranked by relevance when there is a
+            query and newest first otherwise, with the total number of matches
+        """
+        self.searches += 1
+        page_size = max(1, min(page_size, LIBRARY_MAX_PAGE_SIZE))
+        page = max(page, 1)
+
+        conditions: List[str] = []
+        parameters: List[Any] = []
+        if kind:
+            conditions.append("c.kind = ?")
+            parameters.append(kind)
+        if subject:
+            conditions.append("c.subject = ? COLLATE NOCASE")
+            parameters.append(subject)
+        if grade_level:
+            conditions.append("c.grade_level = ? COLLATE NOCASE")
+            parameters.append(grade_level)
+        if tag:
+            conditions.append("EXISTS (SELECT 1 FROM json_each(c.tags) WHERE json_each.value = ? COLLATE NOCASE)")
+            parameters.append(tag)
+
+        match = _match_query(query) if query else None
+        if match:
+            source = "content_fts f JOIN content c ON c.id = f.id"
+            conditions.insert(0, "content_fts MATCH ?")
+            parameters.insert(0, match)
+            order = "bm25(content_fts)"
+        else:
+            source = "content c"
+            order = "c.created_at DESC"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        conn = self._connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM {source} {where}", parameters).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT c.* FROM {source} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            (*parameters, page_size, (page - 1) * page_size)
+        ).fetchall()
+        return {
+            "items": [_summary(row) for row in rows],
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get library statistics
+
+        Returns:
+            Dictionary with the stored results per kind and this worker's counters
+        """
+        rows = self._connection().execute("SELECT kind, COUNT(*) AS count FROM content GROUP BY kind").fetchall()
+        return {
+            "path": self.path,
+            "stored": {row["kind"]: row["count"] for row in rows},
+            "saved": self.saved,
+            "reused": self.reused,
+            "searches": self.searches,
+            "requests_recorded": self.recorded,
+        }
+
+
+def create_content_library() -> Optional[ContentLibrary]:
+    """
+    Create the content library if it is enabled
+
+    Returns:
+        The library, or None when LIBRARY_ENABLED is off
+    """
+    if not LIBRARY_ENABLED:
+        return None
+    return ContentLibrary()
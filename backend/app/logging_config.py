@@ -0,0 +1,156 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" writes one JSON object per line; "text" is the human-readable format for development
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fraction of generations whose per-item detail (e.g. every assessment question)
+# is logged at INFO; at LOG_LEVEL=DEBUG it is always logged
+LOG_DETAIL_SAMPLE_RATE = float(os.getenv("LOG_DETAIL_SAMPLE_RATE", "0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed with extra={...}"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id and request_id != "-":
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without waiting on I/O
+
+    The message is rendered here, while its arguments are still valid, but
+    the formatting and the write happen on the listener thread. If the
+    queue is full (the output can't keep up) records are dropped and
+    counted rather than blocking the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than failing when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, stream=None) -> None:
+    """
+    Configure logging for the whole process
+
+    Replaces the root logger's handlers with a queue handler whose listener
+    thread writes to stderr, so logging never blocks on output. Safe to
+    call more than once; later calls reconfigure.
+
+    Args:
+        level: Root log level name
+        log_format: "json" or "text"
+        stream: Where to write (default: stderr)
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT, defaults={"request_id": "-"}))
+
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(level)
+    # httpx logs every upstream request at INFO; that's per-call detail too
+    logging.getLogger("httpx").setLevel(logging.DEBUG if level == "DEBUG" else logging.WARNING)
+
+    _listener = _QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def flush_logging() -> None:
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush_logging)
+
+
+def detail_level(logger: logging.Logger) -> Optional[int]:
+    """
+    Decide whether, and at which level, to log per-item detail
+
+    Detail such as every question of an assessment grows with the content,
+    so it is only logged at DEBUG, or for a sample of LOG_DETAIL_SAMPLE_RATE
+    of calls at INFO.
+
+    Args:
+        logger: The logger the detail would go to
+
+    Returns:
+        The level to log the detail at, or None to skip it
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return logging.DEBUG
+    if LOG_DETAIL_SAMPLE_RATE > 0 and random.random() < LOG_DETAIL_SAMPLE_RATE:
+        return logging.INFO
+    return None
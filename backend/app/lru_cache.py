@@ -0,0 +1,200 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Iterator, Tuple
+
+# How many least-recently-used entries to check for expiry on each put.
+# This keeps expired entries from piling up without ever scanning the whole cache.
+EXPIRY_SWEEP = 2
+
+
+def default_sizeof(value: Any) -> int:
+    """Estimate the size of a cached value in bytes"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(default_sizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with per-entry TTLs
+
+    get, put and delete are O(1): entries live in an OrderedDict kept in
+    recency order, so the eviction victim is always at the front. Capacity
+    can be limited by number of entries, total bytes, or both.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = 100,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = default_sizeof
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of entries (None for no limit)
+            max_bytes: Maximum total size of values in bytes (None for no limit)
+            ttl: Default time to live in seconds (None for no expiry)
+            sizeof: Function returning the size of a value in bytes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get a value and mark it as recently used
+
+        Args:
+            key: The cache key
+            default: Returned if the key is missing or expired
+
+        Returns:
+            The cached value or default
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        if entry[1] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting least recently used entries if over capacity
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl: Time to live in seconds for this entry (defaults to the cache TTL)
+        """
+        if key in self._entries:
+            self._remove(key)
+
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl is not None else float("inf")
+        size = self.sizeof(value)
+
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+
+        self._sweep_expired(now)
+
+        while self._entries and self._over_capacity():
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        """
+        Remove a value
+
+        Args:
+            key: The cache key
+
+        Returns:
+            True if the key was present
+        """
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """
+        Remove every expired entry (O(n), for periodic maintenance)
+
+        Returns:
+            The number of entries removed
+        """
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def keys(self) -> Iterator[str]:
+        """Iterate over keys from least to most recently used"""
+        return iter(list(self._entries.keys()))
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.time()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        """Total size of the cached values in bytes"""
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+
+        Returns:
+            Dictionary with size, capacity and hit/miss/eviction counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "ttl": self.ttl,
+        }
+
+    def _over_capacity(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            return True
+        return False
+
+    def _sweep_expired(self, now: float) -> None:
+        """Drop expired entries from the least recently used end, a few at a time"""
+        for _ in range(EXPIRY_SWEEP):
+            if not self._entries:
+                return
+            oldest = next(iter(self._entries))
+            if self._entries[oldest][1] > now:
+                return
+            self._remove(oldest)
+            self.expirations += 1
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,198 @@
+import os
+import time
+import logging
+from typing import Dict, Any, List, Tuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Under gunicorn each worker writes its metrics to files in this directory and
+# /metrics sums them (see gunicorn.conf.py). It has to be set before
+# prometheus_client is imported, so the client picks its file-backed mode.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger("edugenie.metrics")
+
+# Generations take seconds to minutes, so the default buckets (up to 10s) are too short
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+REQUEST_LATENCY = Histogram(
+    "edugenie_request_duration_seconds",
+    "Time to send a whole response, including streamed bodies",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "edugenie_requests_in_progress",
+    "Requests being handled",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "edugenie_upstream_duration_seconds",
+    "OpenRouter call latency",
+    ["model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_FIRST_TOKEN = Histogram(
+    "edugenie_upstream_first_token_seconds",
+    "Time from sending a streamed OpenRouter call to its first token",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_COMPLETION_TOKENS = Counter(
+    "edugenie_upstream_completion_tokens_total",
+    "Completion tokens generated by OpenRouter",
+    ["model"],
+)
+JSON_PARSE_LATENCY = Histogram(
+    "edugenie_json_parse_seconds",
+    "Time to parse a model response; path is direct, repaired or failed",
+    ["path"],
+    buckets=PARSE_BUCKETS,
+)
+JSON_REPAIRS = Counter(
+    "edugenie_json_repairs_total",
+    "Model responses needing each kind of JSON repair",
+    ["repair"],
+)
+CACHE_HITS = Counter("edugenie_cache_hits_total", "Cache lookups that found an entry", ["cache"])
+CACHE_MISSES = Counter("edugenie_cache_misses_total", "Cache lookups that found nothing", ["cache"])
+CACHE_EVICTIONS = Counter("edugenie_cache_evictions_total", "Entries evicted to stay within limits", ["cache"])
+CACHE_EXPIRATIONS = Counter("edugenie_cache_expirations_total", "Entries dropped after their TTL", ["cache"])
+RATE_LIMIT_REJECTIONS = Counter(
+    "edugenie_rate_limit_rejections_total",
+    "Calls refused by the local per-model rate limit",
+    ["model"],
+)
+MODEL_FALLBACKS = Counter(
+    "edugenie_model_fallbacks_total",
+    "Requests routed to another model than the one asked for",
+    ["requested", "chosen"],
+)
+
+_CACHE_COUNTERS = (
+    ("hits", CACHE_HITS),
+    ("misses", CACHE_MISSES),
+    ("evictions", CACHE_EVICTIONS),
+    ("expirations", CACHE_EXPIRATIONS),
+)
+
+# (name, cache, counts already exported)
+_tracked_caches: List[Tuple[str, Any, Dict[str, int]]] = []
+
+
+def track_cache(name: str, cache: Any) -> None:
+    """
+    Export a cache's hit, miss, eviction and expiration counters
+
+    The caches count these themselves (see stats()); sync_caches() adds
+    what changed since the last sync to the Prometheus counters.
+
+    Args:
+        name: The cache label
+        cache: A CacheBackend or LRUCache
+    """
+    _tracked_caches.append((name, cache, {attribute: getattr(cache, attribute) for attribute, _ in _CACHE_COUNTERS}))
+
+
+def sync_caches() -> None:
+    """Add the tracked caches' counter changes to the Prometheus counters"""
+    for name, cache, exported in _tracked_caches:
+        for attribute, counter in _CACHE_COUNTERS:
+            value = getattr(cache, attribute)
+            if value != exported[attribute]:
+                counter.labels(name).inc(max(value - exported[attribute], 0))
+                exported[attribute] = value
+
+
+def observe_call(model_id: str, latency: float, outcome: str, completion_tokens: Optional[int]) -> None:
+    """
+    Record a finished OpenRouter call (a call observer, see add_call_observer)
+
+    Args:
+        model_id: The model called
+        latency: Seconds the call took
+        outcome: OUTCOME_OK, OUTCOME_RATE_LIMITED or OUTCOME_ERROR
+        completion_tokens: Tokens generated, if reported
+    """
+    UPSTREAM_LATENCY.labels(model_id, outcome).observe(latency)
+    if completion_tokens:
+        UPSTREAM_COMPLETION_TOKENS.labels(model_id).inc(completion_tokens)
+
+
+def observe_parse(seconds: Optional[float], repairs: Optional[List[str]], failed: bool = False) -> None:
+    """
+    Record parsing a model response
+
+    Args:
+        seconds: Time spent parsing, or None if it was spread over a stream
+        repairs: Repairs the parser made (None or empty if none)
+        failed: Whether no JSON could be recovered
+    """
+    if seconds is not None:
+        path = "failed" if failed else ("repaired" if repairs else "direct")
+        JSON_PARSE_LATENCY.labels(path).observe(seconds)
+    for repair in repairs or ():
+        JSON_REPAIRS.labels(repair).inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render every metric in the Prometheus text format
+
+    Returns:
+        (body, content type)
+    """
+    sync_caches()
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request until its response is fully sent
+
+    Requests are labelled with the route's path template (e.g.
+    /jobs/{job_id}), so the number of series stays bounded; requests that
+    match no route are labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(endpoint, scope["method"], str(status)).observe(time.perf_counter() - started)
+            sync_caches()
@@ -1,31 +1,69 @@
+import os
 import time
 import random
 from typing import Dict, List, Optional, Any
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from .rate_limiter import RateLimiter, parse_rate_limits
+from .shared_state import StateStore, MemoryStateStore
+from .model_stats import ModelStats, OUTCOME_OK
+from .circuit_breaker import CircuitBreaker
+from .errors import FAILURE_MALFORMED
+from . import metrics
+
 logger = logging.getLogger("edugenie.model_manager")
 
+# "adaptive" routes to the model with the best observed throughput and reliability,
+# "static" walks the recommended models in their configured order
+ROUTING_MODES = ("adaptive", "static")
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "adaptive").lower()
+
 class ModelManager:
     """
     Manages AI model selection and throttling to avoid rate limits
     """
     
-    def __init__(self, models: List[Dict[str, Any]], recommended_models: List[str]):
+    def __init__(
+        self,
+        models: List[Dict[str, Any]],
+        recommended_models: List[str],
+        store: Optional[StateStore] = None,
+        routing: str = MODEL_ROUTING,
+        breaker: Optional[CircuitBreaker] = None
+    ):
         """
         Initialize the model manager
         
         Args:
             models: List of available models
             recommended_models: List of recommended model IDs
+            store: Where usage and error state is kept; pass a shared store so
+                that every worker sees the same limits and failing models
+            routing: "adaptive" or "static" model routing
+            breaker: The per-model circuit breakers; models whose circuit is
+                open are never picked while another model is usable
         """
         self.models = models
+        self.models_by_id = {model["id"]: model for model in models}
         self.recommended_models = recommended_models
-        self.model_usage = {}  # Track model usage
-        self.model_errors = {}  # Track model errors
+        if routing not in ROUTING_MODES:
+            logger.warning(f"Unknown model routing mode '{routing}', using adaptive routing")
+            routing = "adaptive"
+        self.routing = routing
+        # Observed latency, throughput and reliability per model (per worker)
+        self.model_stats = ModelStats()
+        self.store = store or MemoryStateStore()
+        self.breaker = breaker or CircuitBreaker(self.store)
         self.call_window = 60 * 60  # 1 hour in seconds
         self.max_calls_per_window = 15  # Maximum calls per model per window
+        # Track model usage with a token bucket per model
+        self.model_usage = RateLimiter(
+            self.max_calls_per_window,
+            self.call_window,
+            limits=parse_rate_limits(os.getenv("MODEL_MANAGER_RATE_LIMITS", "")),
+            store=self.store,
+            namespace="model_usage"
+        )
         
     def get_best_model(self, preferred_model_id: Optional[str] = None, exclude_models: List[str] = None) -> str:
         """
@@ -38,26 +76,31 @@ class ModelManager:
         Returns:
             The model ID to use
         """
-        current_time = time.time()
-        
-        # Initialize exclude_models if None
-        if exclude_models is None:
-            exclude_models = []
-        
-        # Clean up old usage data
-        for model_id in list(self.model_usage.keys()):
-            if current_time - self.model_usage[model_id]["timestamp"] > self.call_window:
-                del self.model_usage[model_id]
-                
-        # Clean up old error data
-        for model_id in list(self.model_errors.keys()):
-            if current_time - self.model_errors[model_id]["timestamp"] > self.call_window:
-                del self.model_errors[model_id]
+        model_id = self._select_model(preferred_model_id, exclude_models)
+        if preferred_model_id and model_id != preferred_model_id:
+            # The preferred ID comes from the client, so unknown IDs share one label
+            requested = preferred_model_id if preferred_model_id in self.models_by_id else "unknown"
+            metrics.MODEL_FALLBACKS.labels(requested, model_id).inc()
+        return model_id
+    
+    def _select_model(self, preferred_model_id: Optional[str], exclude_models: Optional[List[str]]) -> str:
+        # Use a set so exclusion checks are O(1)
+        exclude_models = set(exclude_models or ())
         
         # If preferred model is available and not rate limited, use it
         if preferred_model_id and preferred_model_id not in exclude_models and self._can_use_model(preferred_model_id):
             self._increment_usage(preferred_model_id)
             return preferred_model_id
+        
+        # Route to the usable model with the best expected throughput
+        if self.routing == "adaptive":
+            best_model = self.model_stats.best(
+                model_id for model_id in self.models_by_id
+                if model_id not in exclude_models and self._can_use_model(model_id)
+            )
+            if best_model:
+                self._increment_usage(best_model)
+                return best_model
             
         # Try recommended models in order
         for model_id in self.recommended_models:
@@ -74,32 +117,20 @@ class ModelManager:
                 self._increment_usage(model_id)
                 return model_id
                 
-        # If all models are rate limited, use the least used one
+        # If all models are rate limited or failing, use the one that frees up soonest
         least_used = None
-        min_usage = float('inf')
+        min_wait = float('inf')
         
         for model_id in available_models:
-            # Skip models with recent errors
-            if model_id in self.model_errors and current_time - self.model_errors[model_id]["timestamp"] < 5 * 60:
-                continue
-                
-            usage = 0
-            if model_id in self.model_usage:
-                usage = self.model_usage[model_id]["count"]
+            wait = max(self.model_usage.time_until_available(model_id), self.breaker.retry_after(model_id))
                 
-            if usage < min_usage:
-                min_usage = usage
+            if wait < min_wait:
+                min_wait = wait
                 least_used = model_id
                 
         if least_used:
             self._increment_usage(least_used)
             return least_used
-            
-        # Last resort: use the first recommended model that's not excluded
-        for model_id in self.recommended_models:
-            if model_id not in exclude_models:
-                self._increment_usage(model_id)
-                return model_id
         
         # Absolute last resort: use the first recommended model even if it's excluded
         default_model = self.recommended_models[0]
@@ -108,7 +139,7 @@ class ModelManager:
     
     def _can_use_model(self, model_id: str) -> bool:
         """
-        Check if a model can be used based on usage and errors
+        Check if a model can be used based on usage and its circuit breaker
         
         Args:
             model_id: The model ID to check
@@ -116,27 +147,12 @@ class ModelManager:
         Returns:
             True if the model can be used, False otherwise
         """
-        current_time = time.time()
-        
-        # Check for recent errors with this model
-        if model_id in self.model_errors:
-            error_data = self.model_errors[model_id]
-            
-            # If the model has had multiple errors recently, avoid it
-            if (current_time - error_data["timestamp"] < 5 * 60 and 
-                error_data["count"] >= 3):
-                return False
+        # Models that keep failing are avoided until their circuit lets calls through again
+        if not self.breaker.available(model_id):
+            return False
         
         # Check usage limits
-        if model_id in self.model_usage:
-            usage_data = self.model_usage[model_id]
-            
-            # If within window and exceeded limit
-            if (current_time - usage_data["timestamp"] < self.call_window and 
-                usage_data["count"] >= self.max_calls_per_window):
-                return False
-                
-        return True
+        return self.model_usage.can_acquire(model_id)
     
     def _increment_usage(self, model_id: str) -> None:
         """
@@ -145,35 +161,83 @@ class ModelManager:
         Args:
             model_id: The model ID to increment
         """
-        current_time = time.time()
-        
-        if model_id in self.model_usage:
-            # If within window, increment; otherwise reset
-            if current_time - self.model_usage[model_id]["timestamp"] < self.call_window:
-                self.model_usage[model_id]["count"] += 1
-            else:
-                self.model_usage[model_id] = {"count": 1, "timestamp": current_time}
-        else:
-            self.model_usage[model_id] = {"count": 1, "timestamp": current_time}
+        self.model_usage.consume(model_id)
     
     def record_error(self, model_id: str) -> None:
         """
-        Record an error for a model
+        Count an error for a model, for /models/stats
+        
+        Model selection goes by the circuit breakers, which see each
+        upstream call's outcome directly.
         
         Args:
             model_id: The model ID that had an error
         """
         current_time = time.time()
         
-        if model_id in self.model_errors:
+        def increment(error_data):
             # If within window, increment; otherwise reset
-            if current_time - self.model_errors[model_id]["timestamp"] < self.call_window:
-                self.model_errors[model_id]["count"] += 1
-            else:
-                self.model_errors[model_id] = {"count": 1, "timestamp": current_time}
-        else:
-            self.model_errors[model_id] = {"count": 1, "timestamp": current_time}
+            if error_data and current_time - error_data["timestamp"] < self.call_window:
+                return {"count": error_data["count"] + 1, "timestamp": current_time}, None
+            return {"count": 1, "timestamp": current_time}, None
+        
+        # Errors older than the window are reset anyway, so let the store drop them
+        self.store.update(f"model_errors:{model_id}", increment, ttl=self.call_window)
+    
+    @property
+    def model_errors(self) -> Dict[str, Dict[str, Any]]:
+        """Error counts and last error time per model, as seen by every worker"""
+        errors = {}
+        for key in self.store.keys("model_errors:"):
+            error_data = self.store.get(key)
+            if error_data:
+                errors[key[len("model_errors:"):]] = error_data
+        return errors
             
+    def get_model(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get model info by ID
+        
+        Args:
+            model_id: The model ID
+            
+        Returns:
+            The model info, or None if the model is unknown
+        """
+        return self.models_by_id.get(model_id)
+    
+    def observe_call(
+        self,
+        model_id: str,
+        latency: float,
+        outcome: str = OUTCOME_OK,
+        completion_tokens: Optional[int] = None
+    ) -> None:
+        """
+        Record a finished upstream call for routing
+        
+        Args:
+            model_id: The model called
+            latency: Seconds the call took
+            outcome: "ok", "rate_limited" or "error"
+            completion_tokens: Tokens generated, if known
+        """
+        self.model_stats.record_call(model_id, latency, outcome, completion_tokens)
+    
+    def record_parse(self, model_id: str, success: bool) -> None:
+        """
+        Record whether a model's response parsed as the expected JSON
+        
+        Args:
+            model_id: The model that produced the response
+            success: True if it parsed
+        """
+        self.model_stats.record_parse(model_id, success)
+        if success:
+            self.breaker.record_success(model_id, response=True)
+        else:
+            self.breaker.record_failure(model_id, FAILURE_MALFORMED)
+    
     def get_model_stats(self) -> Dict[str, Any]:
         """
         Get current model usage and error statistics
@@ -182,8 +246,13 @@ class ModelManager:
             Dictionary with model usage and error information
         """
         stats = {
-            "usage": self.model_usage,
+            "usage": self.model_usage.stats(),
             "errors": self.model_errors,
+            "circuits": self.breaker.stats(),
+            "routing": {
+                "mode": self.routing,
+                "models": self.model_stats.stats()
+            },
             "recommended_models": self.recommended_models,
             "available_models": [model["id"] for model in self.models]
         }
@@ -0,0 +1,287 @@
+import os
+import math
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Iterable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Routing configuration
+# Weight of the newest observation in the moving averages (0-1)
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+# How strongly rarely used models are explored (0 = always pick the best known model)
+ROUTING_EXPLORATION = float(os.getenv("ROUTING_EXPLORATION", "0.3"))
+# Assumed latency in seconds for a model that has not been called yet
+ROUTING_PRIOR_LATENCY = float(os.getenv("ROUTING_PRIOR_LATENCY", "20"))
+# Number of recent latencies kept per model for percentiles
+LATENCY_WINDOW = 200
+
+# Call outcomes reported to record_call
+OUTCOME_OK = "ok"
+OUTCOME_RATE_LIMITED = "rate_limited"
+OUTCOME_ERROR = "error"
+
+
+def _ewma(current: Optional[float], value: float, alpha: float) -> float:
+    return value if current is None else current + alpha * (value - current)
+
+
+def _rate(current: Optional[float]) -> float:
+    # Success rates start at 1, so a single failure doesn't rule a model out
+    return 1.0 if current is None else current
+
+
+def percentile(sorted_values: list, q: float) -> Optional[float]:
+    """
+    Get a percentile by linear interpolation
+
+    Args:
+        sorted_values: Values in ascending order
+        q: The percentile (0-100)
+
+    Returns:
+        The percentile, or None if there are no values
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class ModelRecord:
+    """Rolling statistics for one model"""
+
+    __slots__ = (
+        "calls", "successes", "rate_limited", "errors", "parses", "parse_failures",
+        "latency", "tokens_per_second", "success_rate", "rate_limit_rate",
+        "parse_success_rate", "latencies", "last_call"
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.parses = 0
+        self.parse_failures = 0
+        # Moving averages; None until the first observation
+        self.latency: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.success_rate: Optional[float] = None
+        self.rate_limit_rate: Optional[float] = None
+        self.parse_success_rate: Optional[float] = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_call = 0.0
+
+
+class ModelStats:
+    """
+    Per-model latency, throughput and reliability statistics used for routing
+
+    Every observation updates exponentially weighted moving averages in O(1).
+    A model's score is its expected rate of usable responses: the chance a
+    call succeeds, isn't rate limited and returns parseable JSON, divided by
+    its typical latency. Like a UCB1 bandit, models never called are tried
+    first and rarely used models get a bonus, so that a model that was slow
+    or failing earlier still gets the occasional chance to recover.
+    """
+
+    def __init__(
+        self,
+        alpha: float = ROUTING_EWMA_ALPHA,
+        exploration: float = ROUTING_EXPLORATION,
+        prior_latency: float = ROUTING_PRIOR_LATENCY
+    ):
+        """
+        Initialize the statistics
+
+        Args:
+            alpha: Weight of the newest observation in the moving averages
+            exploration: Size of the exploration bonus for rarely used models
+            prior_latency: Assumed latency in seconds for models never called
+        """
+        self.alpha = alpha
+        self.exploration = exploration
+        self.prior_latency = prior_latency
+        self._records: Dict[str, ModelRecord] = {}
+        self.total_calls = 0
+
+    def _record(self, model_id: str) -> ModelRecord:
+        record = self._records.get(model_id)
+        if record is None:
+            record = ModelRecord()
+            self._records[model_id] = record
+        return record
+
+    def record_call(
+        self,
+        model_id: str,
+        latency: float,
+        outcome: str = OUTCOME_OK,
+        completion_tokens: Optional[int] = None
+    ) -> None:
+        """
+        Record a finished upstream call
+
+        Args:
+            model_id: The model called
+            latency: Seconds the call took
+            outcome: OUTCOME_OK, OUTCOME_RATE_LIMITED or OUTCOME_ERROR
+            completion_tokens: Tokens generated, if known
+        """
+        record = self._record(model_id)
+        alpha = self.alpha
+        record.calls += 1
+        record.last_call = time.time()
+        self.total_calls += 1
+
+        succeeded = outcome == OUTCOME_OK
+        limited = outcome == OUTCOME_RATE_LIMITED
+        record.success_rate = _ewma(_rate(record.success_rate), 1.0 if succeeded else 0.0, alpha)
+        record.rate_limit_rate = _ewma(record.rate_limit_rate or 0.0, 1.0 if limited else 0.0, alpha)
+
+        if succeeded:
+            record.successes += 1
+            # Failures return early, so only successful calls say how fast a model is
+            record.latency = _ewma(record.latency, latency, alpha)
+            record.latencies.append(latency)
+            if completion_tokens and latency > 0:
+                record.tokens_per_second = _ewma(record.tokens_per_second, completion_tokens / latency, alpha)
+        elif limited:
+            record.rate_limited += 1
+        else:
+            record.errors += 1
+
+    def record_parse(self, model_id: str, success: bool) -> None:
+        """
+        Record whether a model's response parsed as the expected JSON
+
+        Args:
+            model_id: The model that produced the response
+            success: True if it parsed
+        """
+        record = self._record(model_id)
+        record.parses += 1
+        if not success:
+            record.parse_failures += 1
+        record.parse_success_rate = _ewma(_rate(record.parse_success_rate), 1.0 if success else 0.0, self.alpha)
+
+    def throughput(self, model_id: str) -> float:
+        """
+        Get a model's expected rate of usable responses
+
+        Args:
+            model_id: The model ID
+
+        Returns:
+            Usable responses per second of latency (0 if never called)
+        """
+        record = self._records.get(model_id)
+        if record is None or record.calls == 0:
+            return 0.0
+        latency = self.prior_latency if record.latency is None else max(record.latency, 0.001)
+        return record.success_rate * _rate(record.parse_success_rate) / latency
+
+    def score(self, model_id: str, scale: Optional[float] = None) -> float:
+        """
+        Get a model's routing score (higher is better)
+
+        Args:
+            model_id: The model ID
+            scale: Size of the exploration bonus (defaults to the best known throughput)
+
+        Returns:
+            Expected throughput plus the exploration bonus, or infinity for
+            a model that has never been called
+        """
+        record = self._records.get(model_id)
+        if record is None or record.calls == 0:
+            return float("inf")
+        if scale is None:
+            scale = self._best_throughput(self._records)
+
+        # UCB1-style bonus, shrinking as a model is called more often
+        bonus = self.exploration * scale * math.sqrt(2.0 * math.log(self.total_calls + 1) / record.calls)
+        return self.throughput(model_id) + bonus
+
+    def best(self, model_ids: Iterable[str]) -> Optional[str]:
+        """
+        Get the highest scoring model
+
+        Args:
+            model_ids: Candidate model IDs
+
+        Returns:
+            The best model ID, or None if there are no candidates
+        """
+        candidates = list(model_ids)
+        scale = self._best_throughput(candidates)
+        best_model = None
+        best_score = -1.0
+        for model_id in candidates:
+            score = self.score(model_id, scale)
+            if score > best_score:
+                best_model = model_id
+                best_score = score
+        return best_model
+
+    def _best_throughput(self, model_ids: Iterable[str]) -> float:
+        best = max((self.throughput(model_id) for model_id in model_ids), default=0.0)
+        return best or 1.0 / self.prior_latency
+
+    def latency_percentile(self, model_id: str, q: float) -> Optional[float]:
+        """
+        Get a percentile of a model's recent successful call latencies
+
+        Args:
+            model_id: The model ID
+            q: The percentile (0-100)
+
+        Returns:
+            The latency in seconds, or None if the model has no successful calls
+        """
+        record = self._records.get(model_id)
+        if record is None:
+            return None
+        return percentile(sorted(record.latencies), q)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get every model's statistics and current score
+
+        Returns:
+            Dictionary of model ID to statistics
+        """
+        models = {}
+        scale = self._best_throughput(self._records)
+        for model_id, record in self._records.items():
+            latencies = sorted(record.latencies)
+            models[model_id] = {
+                # Models never called have no score yet (they are tried first)
+                "score": round(self.score(model_id, scale), 6) if record.calls else None,
+                "throughput": round(self.throughput(model_id), 6),
+                "calls": record.calls,
+                "successes": record.successes,
+                "rate_limited": record.rate_limited,
+                "errors": record.errors,
+                "parses": record.parses,
+                "parse_failures": record.parse_failures,
+                "latency_ewma": _round(record.latency),
+                "latency_p50": _round(percentile(latencies, 50)),
+                "latency_p95": _round(percentile(latencies, 95)),
+                "latency_p99": _round(percentile(latencies, 99)),
+                "tokens_per_second": _round(record.tokens_per_second),
+                "success_rate": _round(record.success_rate),
+                "rate_limit_rate": _round(record.rate_limit_rate),
+                "parse_success_rate": _round(record.parse_success_rate),
+                "last_call": record.last_call,
+            }
+        return models
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 4)
@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Literal
 from pydantic import BaseModel, Field
 
 class Question(BaseModel):
@@ -85,4 +85,27 @@ class ModelInfo(BaseModel):
     input_cost: str
     output_cost: str
     context_length: int
-    is_free: bool = True 
\ No newline at end of file
+    is_free: bool = True 
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    model: Optional[str] = None
+    status: str
+    priority: int
+    request: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    callback_url: Optional[str] = None
+    callback: Optional[Dict[str, Any]] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class BatchItem(BaseModel):
+    kind: Literal["lesson", "assessment", "lab"]
+    request: Dict[str, Any]
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
@@ -1,15 +1,33 @@
 import os
 import json
+import asyncio
 import httpx
 import time
-from typing import Dict, Any, List, Optional
+import logging
+from typing import Dict, Any, List, Optional, AsyncIterator, Callable
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
+from . import http_client, metrics, tracing
+from .json_stream import StreamingJSONParser
+from .cache import create_cache, make_cache_key
+from .singleflight import SingleFlight
+from .rate_limiter import RateLimiter, parse_rate_limits
+from .shared_state import create_state_store
+from .model_stats import OUTCOME_OK, OUTCOME_RATE_LIMITED, OUTCOME_ERROR
+from .circuit_breaker import CircuitBreaker
+from .errors import (
+    UpstreamError, RateLimitError, UpstreamTimeoutError, UpstreamConnectionError, MalformedResponseError,
+    error_for_status, FAILURE_RATE_LIMITED
+)
+
 load_dotenv()
 
+logger = logging.getLogger("edugenie.openrouter")
+
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-API_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Overridable to point at a local stand-in (see fake_openrouter.py)
+API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 # List of available models from the user's requirements
 AVAILABLE_MODELS = [
@@ -34,14 +52,47 @@ RECOMMENDED_MODELS = [
     "mistralai/mistral-small-3.1-24b-instruct:free"
 ]
 
-# Cache for API responses to reduce redundant calls
-RESPONSE_CACHE = {}
-CACHE_EXPIRY = 24 * 60 * 60  # 24 hours in seconds
+# Cache for API responses to reduce redundant calls, shared by all workers
+# on the host by default (see app/cache.py for the backends)
+RESPONSE_CACHE = create_cache()
+CACHE_EXPIRY = RESPONSE_CACHE.ttl
+# finish_reason of a response cut short by max_tokens
+FINISH_LENGTH = "length"
+
+# System prompt for generations that don't name one
+DEFAULT_SYSTEM_PROMPT = "You are an AI educator assistant focused on helping teachers create high-quality educational content."
+
+# Identical generations already in flight are coalesced into one upstream call.
+# Followers wait at most this long (seconds, 0 = as long as the leader takes).
+INFLIGHT_REQUESTS = SingleFlight()
+INFLIGHT_WAIT_TIMEOUT = float(os.getenv("INFLIGHT_WAIT_TIMEOUT", "0"))
+
+# Rate limit and model health state, shared by all workers on the host by
+# default so that N workers don't allow N times the intended calls
+STATE_STORE = create_state_store()
 
 # Rate limiting configuration
-API_CALLS = {}
-MAX_CALLS_PER_MODEL = 10  # Maximum calls per model per hour
+MAX_CALLS_PER_MODEL = int(os.getenv("MAX_CALLS_PER_MODEL", "10"))  # Maximum calls per model per hour
 CALL_WINDOW = 60 * 60  # 1 hour in seconds
+# Seconds a request may wait for rate limit capacity before failing (0 = fail immediately)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "0"))
+# Per-model overrides, e.g. MODEL_RATE_LIMITS='{"deepseek/deepseek-chat:free": "20/60"}'
+API_CALLS = RateLimiter(
+    MAX_CALLS_PER_MODEL,
+    CALL_WINDOW,
+    limits=parse_rate_limits(os.getenv("MODEL_RATE_LIMITS", "")),
+    store=STATE_STORE,
+    namespace="api_calls"
+)
+
+# Calls to a model that keeps failing fail fast until it recovers (see app/circuit_breaker.py)
+CIRCUIT_BREAKER = CircuitBreaker(STATE_STORE)
+
+# Model lookups by ID
+MODELS_BY_ID = {model["id"]: model for model in AVAILABLE_MODELS}
+
+# Functions told about every upstream call (see add_call_observer)
+CALL_OBSERVERS: List[Callable[[str, float, str, Optional[int]], None]] = []
 
 def get_available_models():
     """Return the list of available models"""
@@ -49,10 +100,25 @@ def get_available_models():
 
 def get_model_by_id(model_id: str):
     """Get model info by ID"""
-    for model in AVAILABLE_MODELS:
-        if model["id"] == model_id:
-            return model
-    return None
+    return MODELS_BY_ID.get(model_id)
+
+def add_call_observer(observer: Callable[[str, float, str, Optional[int]], None]) -> None:
+    """
+    Register a function called after every upstream call
+    
+    The observer receives the model ID, the call latency in seconds, the
+    outcome ("ok", "rate_limited" or "error") and the number of completion
+    tokens if known. Cache hits and coalesced followers are not reported.
+    
+    Args:
+        observer: The function to call
+    """
+    CALL_OBSERVERS.append(observer)
+
+def notify_call(model_id: str, latency: float, outcome: str, completion_tokens: Optional[int] = None) -> None:
+    """Report a finished upstream call to the registered observers"""
+    for observer in CALL_OBSERVERS:
+        observer(model_id, latency, outcome, completion_tokens)
 
 def get_system_prompt(context: str = "education") -> str:
     """
@@ -75,7 +141,7 @@ def get_system_prompt(context: str = "education") -> str:
 
 def check_rate_limit(model_id: str) -> bool:
     """
-    Check if we've exceeded the rate limit for this model
+    Check if we've exceeded the rate limit for this model, and count the call if not
     
     Args:
         model_id: The model ID to check
@@ -83,45 +149,106 @@ def check_rate_limit(model_id: str) -> bool:
     Returns:
         True if allowed, False if rate limited
     """
-    current_time = time.time()
-    
-    # Clean up expired entries
-    for key in list(API_CALLS.keys()):
-        if current_time - API_CALLS[key]["timestamp"] > CALL_WINDOW:
-            del API_CALLS[key]
+    return API_CALLS.try_acquire(model_id)
+
+async def wait_for_rate_limit(model_id: str, timeout: float = RATE_LIMIT_MAX_WAIT) -> None:
+    """
+    Wait for rate limit capacity for this model, up to a timeout
     
-    # Check if model has been used
-    if model_id in API_CALLS:
-        calls = API_CALLS[model_id]
-        
-        # If within the time window and exceeded call limit
-        if current_time - calls["timestamp"] < CALL_WINDOW and calls["count"] >= MAX_CALLS_PER_MODEL:
-            return False
+    Args:
+        model_id: The model ID
+        timeout: Maximum seconds to wait (0 to fail immediately)
         
-        # Update count if within window, or reset if window expired
-        if current_time - calls["timestamp"] < CALL_WINDOW:
-            API_CALLS[model_id]["count"] += 1
-        else:
-            API_CALLS[model_id] = {"count": 1, "timestamp": current_time}
-    else:
-        # First call for this model
-        API_CALLS[model_id] = {"count": 1, "timestamp": current_time}
+    Raises:
+        RateLimitError: If no capacity becomes available within the timeout
+    """
+    with tracing.span("rate_limit_wait", model=model_id):
+        if await API_CALLS.acquire(model_id, timeout=timeout):
+            return
     
-    return True
+    retry_after = API_CALLS.time_until_available(model_id)
+    metrics.RATE_LIMIT_REJECTIONS.labels(model_id).inc()
+    logger.warning("Local rate limit exceeded for model: %s", model_id)
+    raise RateLimitError(
+        f"Local rate limit exceeded for model: {model_id}. "
+        f"Try a different model or wait {retry_after:.0f} seconds.",
+        model_id,
+        retry_after=retry_after,
+        local=True
+    )
 
-def get_cache_key(prompt: str, model_id: str, max_tokens: int) -> str:
+def get_cache_key(
+    prompt: str,
+    model_id: str,
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7
+) -> str:
     """
     Generate a cache key for a request
     
+    The key leaves out max_tokens, which each worker learns on its own;
+    responses cut short by their budget are not cached.
+    
     Args:
         prompt: The user prompt
         model_id: The model ID
+        system_prompt: The system prompt
+        temperature: The sampling temperature
+        
+    Returns:
+        A unique cache key string, stable across workers and restarts
+    """
+    return make_cache_key(model_id, system_prompt, prompt, temperature)
+
+def build_headers() -> Dict[str, str]:
+    """
+    Build the request headers for the OpenRouter API
+    
+    Returns:
+        Dictionary of HTTP headers
+    """
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "HTTP-Referer": "https://edu-genie-app.com",
+        "X-Title": "AI-Powered Educator Companion",
+        **(tracing.propagation_headers() if tracing.TRACE_PROPAGATE_UPSTREAM else {})
+    }
+
+def build_payload(
+    prompt: str,
+    model_id: str,
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    stream: bool = False
+) -> Dict[str, Any]:
+    """
+    Build the chat completion request body
+    
+    Args:
+        prompt: The user prompt
+        model_id: The model ID from OpenRouter
+        system_prompt: The system prompt
+        temperature: Controls randomness (0.0-1.0)
         max_tokens: Maximum tokens to generate
+        stream: Whether to request a streamed (SSE) completion
         
     Returns:
-        A unique cache key string
+        The JSON request body
     """
-    return f"{model_id}:{hash(prompt)}:{max_tokens}"
+    data = {
+        "model": model_id,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if stream:
+        data["stream"] = True
+    return data
 
 async def generate_content(
     prompt: str,
@@ -144,97 +271,281 @@ async def generate_content(
         The generated text as a string
     """
     if not system_prompt:
-        system_prompt = "You are an AI educator assistant focused on helping teachers create high-quality educational content."
+        system_prompt = DEFAULT_SYSTEM_PROMPT
     
     if not OPENROUTER_API_KEY:
         raise Exception("OpenRouter API key is missing. Please set the OPENROUTER_API_KEY environment variable.")
     
     # Check cache first
-    cache_key = get_cache_key(prompt, model_id, max_tokens)
+    cache_key = get_cache_key(prompt, model_id, system_prompt, temperature)
     
-    if cache_key in RESPONSE_CACHE:
-        cache_entry = RESPONSE_CACHE[cache_key]
-        # If cache is still valid
-        if time.time() - cache_entry["timestamp"] < CACHE_EXPIRY:
-            print(f"Cache hit for prompt with model: {model_id}")
-            return cache_entry["content"]
+    with tracing.span("cache_lookup", cache=RESPONSE_CACHE.name) as span:
+        cached_content = await RESPONSE_CACHE.get(cache_key)
+        span.set_attribute("hit", cached_content is not None)
+    if cached_content is not None:
+        logger.debug("Cache hit for prompt with model: %s", model_id)
+        return cached_content
     
-    # Check rate limiting 
-    if not check_rate_limit(model_id):
-        print(f"Rate limit exceeded for model: {model_id}")
-        raise Exception(f"Local rate limit exceeded for model: {model_id}. Try a different model or wait.")
+    # Identical requests already in flight share one upstream call
+    data = build_payload(prompt, model_id, system_prompt, temperature, max_tokens)
+    try:
+        with tracing.span("inflight", model=model_id):
+            return await INFLIGHT_REQUESTS.do(
+                cache_key,
+                lambda: request_content(cache_key, model_id, data),
+                timeout=INFLIGHT_WAIT_TIMEOUT or None
+            )
+    except asyncio.TimeoutError:
+        raise Exception(f"Timed out waiting for an identical in-flight request to model: {model_id}")
+
+async def request_content(cache_key: str, model_id: str, data: Dict[str, Any]) -> str:
+    """
+    Call the OpenRouter API and cache the result
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": "https://edu-genie-app.com",
-        "X-Title": "AI-Powered Educator Companion"
-    }
+    Args:
+        cache_key: The cache key from get_cache_key
+        model_id: The model ID from OpenRouter
+        data: The request body from build_payload
+        
+    Returns:
+        The generated text as a string
+        
+    Raises:
+        CircuitOpenError: If the model's circuit is open (no call is made)
+        UpstreamError: A subclass saying how the call failed (see app/errors.py)
+    """
+    # Fail fast if the model has been failing, then check rate limiting,
+    # waiting briefly for capacity if configured
+    CIRCUIT_BREAKER.check(model_id)
+    try:
+        await wait_for_rate_limit(model_id)
+    except BaseException:
+        CIRCUIT_BREAKER.release(model_id)
+        raise
     
-    data = {
-        "model": model_id,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
+    headers = build_headers()
+    # Reported to the call observers; stays None if the call is cancelled
+    outcome = None
+    failure: Optional[UpstreamError] = None
+    completion_tokens = None
+    started = time.monotonic()
+    started_ns = time.time_ns()
     
     try:
-        print(f"Sending request to OpenRouter API for model: {model_id}")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(API_URL, headers=headers, json=data, timeout=180.0)
-            
-            # Parse the response JSON
+        logger.debug("Sending request to OpenRouter API for model: %s", model_id)
+        response = await http_client.post(API_URL, headers=headers, json=data)
+        
+        # Keep the local limiter in step with what OpenRouter reports
+        API_CALLS.update_from_headers(model_id, response.headers)
+        
+        # Parse the response JSON
+        try:
             response_json = response.json()
-            
-            # Check for error in the response
-            if "error" in response_json:
-                error_data = response_json["error"]
-                error_code = error_data.get("code", 0)
-                error_message = error_data.get("message", "Unknown error")
-                
-                # Handle rate limit errors
-                if error_code == 429 or "rate limit" in error_message.lower():
-                    print(f"Rate limit exceeded: {error_message}")
-                    raise Exception(f"OpenRouter API rate limit exceeded: {error_message}")
-                
-                # Handle other API errors
-                print(f"OpenRouter API error: {error_message}")
-                raise Exception(f"OpenRouter API error: {error_message}")
-            
-            # Handle non-200 status codes that don't have error in JSON
+        except ValueError:
             if response.status_code != 200:
-                print(f"OpenRouter API returned status code {response.status_code}")
-            response.raise_for_status()
-            
-            # Check for "choices" in the response
-            if "choices" not in response_json:
-                print(f"Invalid response format: 'choices' not found in response")
-                print(f"Response: {response.text}")
-                raise Exception("Invalid response format from OpenRouter API")
+                raise error_for_status(response.status_code, f"HTTP Error: {response.status_code}", model_id, response.headers)
+            logger.error("Invalid response format: body is not JSON", extra={"model": model_id})
+            raise MalformedResponseError(
+                "Error generating content: Invalid response format from OpenRouter API", model_id, response.status_code
+            )
+        
+        # Check for error in the response
+        if "error" in response_json:
+            error_data = response_json["error"]
+            error_code = error_data.get("code", 0)
+            error_message = error_data.get("message", "Unknown error")
             
-            # Extract the content from the response
-            content = response_json["choices"][0]["message"]["content"]
+            # Handle rate limit errors
+            if error_code == 429 or "rate limit" in error_message.lower():
+                logger.warning("Rate limit exceeded: %s", error_message, extra={"model": model_id})
+                raise error_for_status(
+                    429, f"Error generating content: OpenRouter API rate limit exceeded: {error_message}",
+                    model_id, response.headers
+                )
             
-            # Store in cache
-            RESPONSE_CACHE[cache_key] = {
-                "content": content,
-                "timestamp": time.time()
-            }
+            # Handle other API errors
+            logger.warning("OpenRouter API error: %s", error_message, extra={"model": model_id})
+            raise error_for_status(
+                error_code if isinstance(error_code, int) and error_code else response.status_code,
+                f"Error generating content: OpenRouter API error: {error_message}", model_id, response.headers
+            )
+        
+        # Handle non-200 status codes that don't have error in JSON
+        if response.status_code != 200:
+            logger.warning("OpenRouter API returned status code %s", response.status_code, extra={"model": model_id})
+            raise error_for_status(response.status_code, f"HTTP Error: {response.status_code}", model_id, response.headers)
+        
+        # Check for "choices" in the response
+        if "choices" not in response_json:
+            logger.error("Invalid response format: 'choices' not found in response", extra={"model": model_id})
+            logger.debug("Response: %s", response.text)
+            raise MalformedResponseError(
+                "Error generating content: Invalid response format from OpenRouter API", model_id, response.status_code
+            )
+        
+        # Extract the content from the response
+        content = response_json["choices"][0]["message"]["content"]
+        outcome = OUTCOME_OK
+        completion_tokens = (response_json.get("usage") or {}).get("completion_tokens")
+        
+        # Store in cache, unless max_tokens cut it short: the key holds no budget
+        if response_json["choices"][0].get("finish_reason") != FINISH_LENGTH:
+            await RESPONSE_CACHE.set(cache_key, content)
+        
+        return content
+        
+    except UpstreamError as e:
+        failure = e
+        raise
+    except httpx.TimeoutException as e:
+        logger.warning("OpenRouter API request timed out: %s", e, extra={"model": model_id})
+        failure = UpstreamTimeoutError(f"Request error: {str(e) or 'timed out'}", model_id)
+        raise failure
+    except httpx.RequestError as e:
+        logger.warning("OpenRouter API request error: %s", e, extra={"model": model_id})
+        failure = UpstreamConnectionError(f"Request error: {str(e)}", model_id)
+        raise failure
+    except (KeyError, IndexError, TypeError) as e:
+        logger.error("Invalid response format: %s", e, extra={"model": model_id})
+        failure = MalformedResponseError(f"Error generating content: {str(e)}", model_id)
+        raise failure
+    except Exception as e:
+        outcome = outcome or OUTCOME_ERROR
+        logger.error("Unexpected error with OpenRouter API: %s", e, extra={"model": model_id})
+        raise Exception(f"Error generating content: {str(e)}")
+    finally:
+        if failure is not None:
+            outcome = OUTCOME_RATE_LIMITED if failure.kind == FAILURE_RATE_LIMITED else OUTCOME_ERROR
+            CIRCUIT_BREAKER.record_failure(model_id, failure.kind, failure.retry_after)
+        elif outcome == OUTCOME_OK:
+            CIRCUIT_BREAKER.record_success(model_id)
+        else:
+            CIRCUIT_BREAKER.release(model_id)
+        if outcome is not None:
+            notify_call(model_id, time.monotonic() - started, outcome, completion_tokens)
+        tracing.record_span(
+            "upstream_call", started_ns, error=None if outcome == OUTCOME_OK else (outcome or "cancelled"),
+            model=model_id, completion_tokens=completion_tokens or 0
+        )
+
+async def stream_content(
+    prompt: str,
+    model_id: str,
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 2000
+) -> AsyncIterator[str]:
+    """
+    Stream content from the OpenRouter API as it is generated
+    
+    Uses the same cache and rate limiting as generate_content. A cache hit is
+    yielded as a single chunk, and a completed stream is stored in the cache.
+    
+    Args:
+        prompt: The user prompt
+        model_id: The model ID from OpenRouter
+        system_prompt: Optional system prompt
+        temperature: Controls randomness (0.0-1.0)
+        max_tokens: Maximum tokens to generate
+        
+    Yields:
+        Text deltas as they arrive from the model
+    """
+    if not system_prompt:
+        system_prompt = DEFAULT_SYSTEM_PROMPT
+    
+    if not OPENROUTER_API_KEY:
+        raise Exception("OpenRouter API key is missing. Please set the OPENROUTER_API_KEY environment variable.")
+    
+    # Check cache first
+    cache_key = get_cache_key(prompt, model_id, system_prompt, temperature)
+    
+    with tracing.span("cache_lookup", cache=RESPONSE_CACHE.name) as span:
+        cached_content = await RESPONSE_CACHE.get(cache_key)
+        span.set_attribute("hit", cached_content is not None)
+    if cached_content is not None:
+        logger.debug("Cache hit for streamed prompt with model: %s", model_id)
+        yield cached_content
+        return
+    
+    # Fail fast if the model has been failing, then check rate limiting,
+    # waiting briefly for capacity if configured
+    CIRCUIT_BREAKER.check(model_id)
+    try:
+        await wait_for_rate_limit(model_id)
+    except BaseException:
+        CIRCUIT_BREAKER.release(model_id)
+        raise
+    
+    headers = build_headers()
+    data = build_payload(prompt, model_id, system_prompt, temperature, max_tokens, stream=True)
+    chunks = []
+    # Reported to the call observers; stays None if the client goes away mid-stream
+    outcome = None
+    failure: Optional[UpstreamError] = None
+    completion_tokens = None
+    finish_reason = None
+    started = time.monotonic()
+    started_ns = time.time_ns()
+    
+    try:
+        logger.debug("Streaming request to OpenRouter API for model: %s", model_id)
+        async with http_client.stream("POST", API_URL, headers=headers, json=data) as response:
+            API_CALLS.update_from_headers(model_id, response.headers)
             
-            # Trim cache if it gets too large (keep most recent 100 entries)
-            if len(RESPONSE_CACHE) > 100:
-                # Sort by timestamp and keep only the most recent entries
-                sorted_keys = sorted(RESPONSE_CACHE.keys(), 
-                                    key=lambda k: RESPONSE_CACHE[k]["timestamp"], 
-                                    reverse=True)
-                for key in sorted_keys[100:]:
-                    del RESPONSE_CACHE[key]
+            # Errors before the stream starts come back as a normal JSON body
+            if response.status_code != 200:
+                await response.aread()
+                response.raise_for_status()
             
-            return content
+            async for line in response.aiter_lines():
+                # Skip blank separators and SSE comments such as ": OPENROUTER PROCESSING"
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+                
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                
+                try:
+                    chunk = json.loads(payload)
+                except ValueError:
+                    raise MalformedResponseError(f"Invalid stream event from OpenRouter API: {payload[:100]}", model_id)
+                
+                # Errors after the stream has started arrive as a data event
+                if "error" in chunk:
+                    error_message = chunk["error"].get("message", "Unknown error")
+                    error_code = chunk["error"].get("code")
+                    if error_code == 429 or "rate limit" in error_message.lower():
+                        raise error_for_status(429, f"OpenRouter API rate limit exceeded: {error_message}", model_id)
+                    raise error_for_status(
+                        error_code if isinstance(error_code, int) else None,
+                        f"OpenRouter API error: {error_message}", model_id
+                    )
+                
+                # The final chunk may carry token usage
+                if chunk.get("usage"):
+                    completion_tokens = chunk["usage"].get("completion_tokens")
+                
+                choices = chunk.get("choices") or []
+                if choices and choices[0].get("finish_reason"):
+                    finish_reason = choices[0]["finish_reason"]
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    if not chunks:
+                        metrics.UPSTREAM_FIRST_TOKEN.labels(model_id).observe(time.monotonic() - started)
+                    chunks.append(delta)
+                    yield delta
+        
+        outcome = OUTCOME_OK
+        
+        # Store the completed response in the cache, unless max_tokens cut it short
+        if finish_reason != FINISH_LENGTH:
+            await RESPONSE_CACHE.set(cache_key, "".join(chunks))
             
+    except UpstreamError as e:
+        failure = e
+        raise
     except httpx.HTTPStatusError as e:
         error_info = f"HTTP Error: {e.response.status_code}"
         try:
@@ -243,40 +554,65 @@ async def generate_content(
                 error_info += f" - {error_data['error']['message']}"
         except:
             pass
-        print(f"OpenRouter API HTTP error: {error_info}")
-        raise Exception(error_info)
+        logger.warning("OpenRouter API HTTP error: %s", error_info, extra={"model": model_id})
+        failure = error_for_status(e.response.status_code, error_info, model_id, e.response.headers)
+        raise failure
+    except httpx.TimeoutException as e:
+        logger.warning("OpenRouter API request timed out: %s", e, extra={"model": model_id})
+        failure = UpstreamTimeoutError(f"Request error: {str(e) or 'timed out'}", model_id)
+        raise failure
     except httpx.RequestError as e:
-        print(f"OpenRouter API request error: {str(e)}")
-        raise Exception(f"Request error: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error with OpenRouter API: {str(e)}")
-        raise Exception(f"Error generating content: {str(e)}")
+        logger.warning("OpenRouter API request error: %s", e, extra={"model": model_id})
+        failure = UpstreamConnectionError(f"Request error: {str(e)}", model_id)
+        raise failure
+    except Exception:
+        outcome = outcome or OUTCOME_ERROR
+        raise
+    finally:
+        if failure is not None:
+            outcome = OUTCOME_RATE_LIMITED if failure.kind == FAILURE_RATE_LIMITED else OUTCOME_ERROR
+            CIRCUIT_BREAKER.record_failure(model_id, failure.kind, failure.retry_after)
+        elif outcome == OUTCOME_OK:
+            CIRCUIT_BREAKER.record_success(model_id)
+        else:
+            CIRCUIT_BREAKER.release(model_id)
+        if outcome is not None:
+            notify_call(model_id, time.monotonic() - started, outcome, completion_tokens)
+        tracing.record_span(
+            "upstream_stream", started_ns, error=None if outcome == OUTCOME_OK else (outcome or "cancelled"),
+            model=model_id, completion_tokens=completion_tokens or 0, chunks=len(chunks)
+        )
 
 def sanitize_and_parse_json(json_string: str) -> Dict[str, Any]:
     """
     Attempt to parse and sanitize JSON from AI response.
     
+    Well-formed responses are parsed directly. Anything else (extra prose,
+    markdown code fences, trailing commas, single quotes, a truncated tail...)
+    goes through a single repairing pass of StreamingJSONParser.
+    
     Args:
         json_string: String containing JSON data
         
     Returns:
         Parsed JSON as a dictionary
     """
+    started = time.perf_counter()
     try:
         # First attempt to parse the response directly
-        return json.loads(json_string)
+        parsed = json.loads(json_string)
+        metrics.observe_parse(time.perf_counter() - started, None)
+        return parsed
     except json.JSONDecodeError:
-        # Try to extract JSON from the response (in case model added extra text)
-        import re
-        json_match = re.search(r'\{[\s\S]*\}', json_string)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except json.JSONDecodeError:
-                # Try cleaning the JSON by removing markdown code blocks
-                cleaned_json = re.sub(r'```(json|javascript)?\n?|\n?```', '', json_string).strip()
-                try:
-                    return json.loads(cleaned_json)
-                except json.JSONDecodeError:
-                    raise ValueError("Could not parse JSON from response")
-        raise ValueError("Could not extract valid JSON from response") 
\ No newline at end of file
+        pass
+    
+    # Extract and repair the JSON object in one pass
+    parser = StreamingJSONParser()
+    try:
+        parser.feed(json_string)
+        parsed = parser.close()
+    except ValueError:
+        metrics.observe_parse(time.perf_counter() - started, parser.repairs, failed=True)
+        raise
+    metrics.observe_parse(time.perf_counter() - started, parser.repairs)
+    return parsed
@@ -0,0 +1,291 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Set
+
+from dotenv import load_dotenv
+
+from .errors import RateLimitError, CircuitOpenError
+from .generation import GENERATION_KINDS
+from .library import ContentLibrary
+from .prompts import budget_max_tokens
+from .shared_state import StateStore
+from .openrouter import (
+    API_CALLS, STATE_STORE, CIRCUIT_BREAKER, RESPONSE_CACHE, DEFAULT_SYSTEM_PROMPT,
+    get_model_by_id, get_cache_key, build_payload, request_content, sanitize_and_parse_json
+)
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.prewarm")
+
+# Cache pre-warming configuration
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "False").lower() in ("true", "1", "t", "yes")
+PREWARM_AT = os.getenv("PREWARM_AT", "04:00")  # Server local time of the daily run (HH:MM)
+PREWARM_LOOKBACK_DAYS = int(os.getenv("PREWARM_LOOKBACK_DAYS", "7"))  # Days of requests counted
+PREWARM_MIN_REQUESTS = int(os.getenv("PREWARM_MIN_REQUESTS", "2"))  # One-off requests aren't worth a call
+PREWARM_TOP = int(os.getenv("PREWARM_TOP", "50"))  # Most popular requests considered per run
+PREWARM_MAX_CALLS = int(os.getenv("PREWARM_MAX_CALLS", "30"))  # Upstream calls a run may spend
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+
+# The endpoints' sampling temperature; the cache key depends on it
+PREWARM_TEMPERATURE = 0.7
+
+# State store row with the last run's date and results
+PREWARM_KEY = "prewarm:last_run"
+
+# Outcomes of warming one request
+WARMED = "warmed"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Prewarmer:
+    """
+    Generates the most popular requests ahead of the morning rush
+
+    Once a day at `at` (server local time), the most frequent requests of
+    the last `lookback_days` days (counted by the content library, cache
+    hits included) are generated again and stored in the response cache,
+    replacing any older entry so it lasts a full TTL from then. Each run
+    spends at most `max_calls` upstream calls, within the local rate
+    limits, and gives up on a model that is rate limited or whose circuit
+    is open. Responses are kept only if they parse and validate; the cache
+    key leaves out max_tokens, so they match whatever budget a worker later
+    uses. Workers claim the day's run through the state store, so only one
+    of them runs it.
+    """
+
+    def __init__(
+        self,
+        library: ContentLibrary,
+        store: StateStore = STATE_STORE,
+        at: str = PREWARM_AT,
+        lookback_days: int = PREWARM_LOOKBACK_DAYS,
+        min_requests: int = PREWARM_MIN_REQUESTS,
+        top: int = PREWARM_TOP,
+        max_calls: int = PREWARM_MAX_CALLS,
+        concurrency: int = PREWARM_CONCURRENCY
+    ):
+        """
+        Initialize the pre-warmer
+
+        Args:
+            library: The content library counting requests
+            store: Where the day's run is claimed and its results kept
+            at: Local time of the daily run, as HH:MM
+            lookback_days: Days of requests counted
+            min_requests: Fewest times a request must have been made
+            top: Most popular requests considered per run
+            max_calls: Upstream calls a run may spend
+            concurrency: Requests generated at once
+
+        Raises:
+            ValueError: If `at` is not a HH:MM time
+        """
+        self.library = library
+        self.store = store
+        self.at = datetime.strptime(at, "%H:%M").time()
+        self.lookback_days = lookback_days
+        self.min_requests = min_requests
+        self.top = top
+        self.max_calls = max_calls
+        self.concurrency = max(1, concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.calls = 0
+        self.warmed = 0
+        self.failed = 0
+
+    def next_run(self, now: datetime) -> datetime:
+        """Get the next daily run time after `now`"""
+        run_at = datetime.combine(now.date(), self.at)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+    async def start(self) -> None:
+        """Start the daily runs in the background"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop the daily runs"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """Run once a day until cancelled"""
+        while True:
+            now = datetime.now()
+            await asyncio.sleep((self.next_run(now) - now).total_seconds())
+            try:
+                if self._claim(datetime.now().date().isoformat()):
+                    await self.run()
+            except Exception:
+                logger.exception("Cache pre-warming failed")
+
+    def _claim(self, day: str) -> bool:
+        """Mark the day's run as taken by this worker; False if another worker has it"""
+        def claim(row):
+            row = row or {}
+            if row.get("date") == day:
+                return row, False
+            return {"date": day, "started_at": time.time()}, True
+
+        return self.store.update(PREWARM_KEY, claim)
+
+    async def run(
+        self,
+        top: Optional[int] = None,
+        max_calls: Optional[int] = None,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Generate the most popular requests into the response cache
+
+        Args:
+            top: Most popular requests to consider (defaults to `top`)
+            max_calls: Upstream calls to spend at most (defaults to `max_calls`)
+            dry_run: List the requests that would be generated without calling a model
+
+        Returns:
+            Dictionary with the counts of requests warmed, failed and
+            skipped and the calls spent, or the candidates for a dry run
+        """
+        started = time.time()
+        await asyncio.to_thread(self.library.forget_requests, self.lookback_days)
+        candidates = await asyncio.to_thread(
+            self.library.popular_requests, self.lookback_days, top or self.top, self.min_requests
+        )
+        if dry_run:
+            return {"candidates": [
+                {"kind": candidate["kind"], "count": candidate["count"], "request": candidate["request"]}
+                for candidate in candidates
+            ]}
+
+        self.runs += 1
+        budget = {"calls": self.max_calls if max_calls is None else max_calls}
+        # Models that ran out of capacity during this run
+        unavailable: Set[str] = set()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(candidate: Dict[str, Any]) -> str:
+            async with semaphore:
+                return await self.warm(candidate, budget, unavailable)
+
+        outcomes = await asyncio.gather(*(warm(candidate) for candidate in candidates))
+        summary = {
+            "date": datetime.fromtimestamp(started).date().isoformat(),
+            "started_at": started,
+            "duration": round(time.time() - started, 3),
+            "candidates": len(candidates),
+            "warmed": outcomes.count(WARMED),
+            "failed": outcomes.count(FAILED),
+            "skipped": outcomes.count(SKIPPED),
+            "calls": (self.max_calls if max_calls is None else max_calls) - budget["calls"],
+        }
+        self.store.update(PREWARM_KEY, lambda row: ({**(row or {}), **summary}, None))
+        logger.info(
+            "Pre-warmed %d of %d popular requests with %d calls",
+            summary["warmed"], summary["candidates"], summary["calls"], extra=summary
+        )
+        return summary
+
+    async def warm(self, candidate: Dict[str, Any], budget: Dict[str, int], unavailable: Set[str]) -> str:
+        """
+        Generate one request and store the response in the response cache
+
+        Args:
+            candidate: A popular request from ContentLibrary.popular_requests
+            budget: The run's remaining calls, shared by the requests
+            unavailable: Models to skip for the rest of the run; rate limited
+                or circuit-open models are added to it
+
+        Returns:
+            "warmed", "failed" or "skipped"
+        """
+        request_model, build_prompt, build_result = GENERATION_KINDS[candidate["kind"]]
+        try:
+            request = request_model(**candidate["request"])
+        except ValueError:
+            # Recorded before the request schema changed
+            return SKIPPED
+        model_id = request.model
+        model = get_model_by_id(model_id)
+        if model is None or model_id in unavailable:
+            return SKIPPED
+        if not CIRCUIT_BREAKER.available(model_id) or not API_CALLS.can_acquire(model_id):
+            unavailable.add(model_id)
+            return SKIPPED
+        if budget["calls"] <= 0:
+            return SKIPPED
+        budget["calls"] -= 1
+
+        # The same prompt, system prompt and temperature as the endpoints, so the cache key matches
+        prompt = await asyncio.to_thread(build_prompt, request)
+        max_tokens = budget_max_tokens(request, model, prompt)
+        cache_key = get_cache_key(prompt, model_id, DEFAULT_SYSTEM_PROMPT, PREWARM_TEMPERATURE)
+        data = build_payload(prompt, model_id, DEFAULT_SYSTEM_PROMPT, PREWARM_TEMPERATURE, max_tokens)
+
+        self.calls += 1
+        try:
+            content = await request_content(cache_key, model_id, data)
+        except (RateLimitError, CircuitOpenError) as e:
+            unavailable.add(model_id)
+            logger.info("Stopped pre-warming on %s: %s", model_id, e, extra={"model": model_id})
+            self.failed += 1
+            return FAILED
+        except Exception as e:
+            logger.warning("Could not pre-warm %s: %s", request.topic, e, extra={"model": model_id})
+            self.failed += 1
+            return FAILED
+
+        try:
+            build_result(sanitize_and_parse_json(content), request)
+        except ValueError as e:
+            # Don't leave a response that can't be served in the cache
+            await RESPONSE_CACHE.delete(cache_key)
+            logger.warning("Pre-warmed response for %s did not validate: %s", request.topic, e, extra={"model": model_id})
+            self.failed += 1
+            return FAILED
+
+        self.warmed += 1
+        return WARMED
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get pre-warming statistics
+
+        Returns:
+            Dictionary with the configuration, the last run's results (from
+            any worker) and this worker's counters
+        """
+        return {
+            "enabled": self._task is not None,
+            "at": self.at.strftime("%H:%M"),
+            "lookback_days": self.lookback_days,
+            "max_calls": self.max_calls,
+            "last_run": self.store.get(PREWARM_KEY),
+            "runs": self.runs,
+            "calls": self.calls,
+            "warmed": self.warmed,
+            "failed": self.failed,
+        }
+
+
+def create_prewarmer(library: Optional[ContentLibrary]) -> Optional[Prewarmer]:
+    """
+    Create the pre-warmer for a content library
+
+    Args:
+        library: The content library, or None when LIBRARY_ENABLED is off
+
+    Returns:
+        The pre-warmer, or None without a library to count requests
+    """
+    if library is None:
+        return None
+    return Prewarmer(library)
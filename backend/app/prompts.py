@@ -0,0 +1,476 @@
+import os
+import re
+import math
+import string
+import logging
+import textwrap
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from .model_stats import percentile
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.prompts")
+
+# Token budget configuration
+# max_tokens is the expected completion length times this, to leave room for longer answers
+PROMPT_BUDGET_HEADROOM = float(os.getenv("PROMPT_BUDGET_HEADROOM", "1.5"))
+# Percentile (0-100) of observed completion lengths taken as the expected length
+PROMPT_BUDGET_PERCENTILE = float(os.getenv("PROMPT_BUDGET_PERCENTILE", "95"))
+# Observations needed before they replace the per-content-type default
+PROMPT_BUDGET_MIN_SAMPLES = int(os.getenv("PROMPT_BUDGET_MIN_SAMPLES", "20"))
+# Recent completion lengths kept per content type
+PROMPT_BUDGET_WINDOW = int(os.getenv("PROMPT_BUDGET_WINDOW", "500"))
+PROMPT_BUDGET_MIN_TOKENS = int(os.getenv("PROMPT_BUDGET_MIN_TOKENS", "512"))
+# Tokens kept free for the system prompt and the chat format around the prompt
+PROMPT_BUDGET_RESERVE = int(os.getenv("PROMPT_BUDGET_RESERVE", "256"))
+
+# Expected completion tokens per unit before anything has been observed. An
+# assessment's unit is one question, so its length grows with the question count.
+DEFAULT_COMPLETION_TOKENS = {
+    "lesson": 2000,
+    "assessment": 180,
+    "lab": 1500,
+}
+
+# Request type -> content type
+REQUEST_KINDS = {
+    "LessonRequest": "lesson",
+    "AssessmentRequest": "assessment",
+    "LabRequest": "lab",
+}
+
+LESSON_TEMPLATE = """
+    Create a detailed lesson plan about "{topic}" for grade level "{gradeLevel}" with a duration of "{duration}".
+    {context}{references}
+    IMPORTANT INSTRUCTIONS:
+    {assessment_instruction}
+    {activities_instruction}
+
+    Format your response as a JSON object with the following structure:
+    {{
+        "title": "Descriptive title for the lesson",
+        "gradeLevel": "{gradeLevel}",
+        "subject": "Subject area",
+        "duration": "{duration}",
+        "overview": "Brief overview of the lesson (1-2 paragraphs)",
+        "objectives": ["learning objective 1", "learning objective 2", ...],
+        "materials": ["material 1", "material 2", ...],
+        "plan": "Detailed lesson plan with sections for introduction, instruction, practice, etc.",
+        "assessment": "Description of assessment methods",
+        "questions": [
+            {{
+                "text": "Question text",
+                "options": ["option 1", "option 2", "option 3", "option 4"],
+                "answer": "Correct answer",
+                "bloomsLevel": "Knowledge/Comprehension/Application/Analysis/Synthesis/Evaluation"
+            }},
+            ...
+        ],
+        "tags": ["relevant", "tags", "for", "this", "lesson"]
+    }}
+
+    IMPORTANT: Your response must be a valid JSON object with no additional text before or after.
+"""
+
+ASSESSMENT_TEMPLATE = """
+    Create a detailed assessment about "{topic}" for grade level "{gradeLevel}" with {numberOfQuestions} questions.
+    Question types to include: {questionTypes}
+    Bloom's taxonomy levels to target: {bloomsLevels}
+    {context}
+    EXTREMELY IMPORTANT:
+    - EVERY question MUST include an "answer" field with the correct answer.
+    - For multiple-choice questions, the "answer" MUST be the FULL TEXT of the correct option, not just A, B, C, D.
+    - For true-false questions, the "answer" MUST be either "True" or "False".
+    - For short-answer and essay questions, provide a sample correct answer.
+    - Do not skip providing an answer for ANY question type.
+
+    Format your response as a JSON object with the following structure:
+    {{
+        "title": "Descriptive title for the assessment",
+        "gradeLevel": "{gradeLevel}",
+        "instructions": "Instructions for taking the assessment",
+        "questions": [
+            {{
+                "text": "Question text",
+                "type": "one of: multiple-choice, true-false, short-answer, essay",
+                "options": ["option 1", "option 2", "option 3", "option 4"] (for multiple-choice and true-false only),
+                "answer": "FULL TEXT of the correct answer - THIS IS REQUIRED FOR ALL QUESTIONS",
+                "bloomsLevel": "Targeted Bloom's level"
+            }},
+            ...
+        ],
+        "tags": ["relevant", "tags", "for", "this", "assessment"]
+    }}
+
+    IMPORTANT: Your response must be a valid JSON object with no additional text before or after. EVERY QUESTION MUST HAVE AN ANSWER FIELD FILLED IN.
+"""
+
+LAB_TEMPLATE = """
+    Create a detailed virtual lab about "{topic}" for grade level "{gradeLevel}".
+    {context}{references}
+    Format your response as a JSON object with the following structure:
+    {{
+        "title": "Descriptive title for the lab",
+        "description": "Brief description of the lab (1-2 sentences)",
+        "category": "science category (physics, chemistry, biology, earth, etc.)",
+        "gradeLevel": "{gradeLevel}",
+        "objectives": ["learning objective 1", "learning objective 2", ...],
+        "steps": [
+            {{
+                "title": "Step 1 title",
+                "description": "Detailed description of step 1"
+            }},
+            ...
+        ],
+        "questions": [
+            {{
+                "text": "Question to consider during the lab",
+                "hint": "Optional hint for the question"
+            }},
+            ...
+        ],
+        "tags": ["relevant", "tags", "for", "this", "lab"]
+    }}
+
+    IMPORTANT: Your response must be a valid JSON object with no additional text before or after.
+"""
+
+# Approximates a BPE tokenizer's pre-tokenization: words with their leading
+# space, digit groups, punctuation runs and whitespace runs
+_TOKEN_PIECES = re.compile(r" ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+_encoding: Any = None
+_encoding_loaded = False
+
+
+def _get_encoding() -> Any:
+    """The tiktoken encoding if tiktoken and its data are available, else None"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a text is
+
+    Uses tiktoken's cl100k_base encoding when tiktoken is installed and its
+    data is available. Otherwise the text is split the way BPE tokenizers
+    pre-tokenize it and each piece is costed by length: a rough count, but
+    budgets carry headroom anyway.
+
+    Args:
+        text: The text
+
+    Returns:
+        The estimated token count
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        word = piece.strip()
+        if not word:
+            tokens += 1
+        elif word[0].isalpha():
+            # Common words are one token; longer ones split every ~4 letters
+            tokens += 1 if len(word) <= 7 else math.ceil(len(word) / 4)
+        elif word[0].isdigit():
+            tokens += 1
+        else:
+            # Punctuation pairs like '",' and '":' are usually one token
+            tokens += math.ceil(len(word) / 2)
+    return tokens
+
+
+class PromptTemplate:
+    """
+    A prompt compiled once into literal text and the fields filled in per request
+
+    The source is dedented (the prompt's indentation would only cost tokens)
+    and parsed with str.format syntax when the template is registered, so
+    rendering is a single join.
+    """
+
+    __slots__ = ("name", "_pieces", "fields")
+
+    def __init__(self, name: str, source: str):
+        """
+        Compile a template
+
+        Args:
+            name: The content type the template is for
+            source: The template, with {field} placeholders and {{ }} for literal braces
+        """
+        self.name = name
+        # Alternating literal text and field names; literals at even positions
+        pieces: List[str] = []
+        fields: List[str] = []
+        for literal, field, _, _ in string.Formatter().parse(textwrap.dedent(source).strip()):
+            if pieces and len(pieces) % 2 == 1:
+                pieces[-1] += literal
+            else:
+                pieces.append(literal)
+            if field is not None:
+                pieces.append(field)
+                fields.append(field)
+        if len(pieces) % 2 == 0:
+            pieces.append("")
+        self._pieces = pieces
+        self.fields = tuple(dict.fromkeys(fields))
+
+    def render(self, **values: Any) -> str:
+        """
+        Fill in the template
+
+        Args:
+            **values: A value for every field
+
+        Returns:
+            The prompt
+        """
+        pieces = self._pieces
+        parts = [pieces[0]]
+        for i in range(1, len(pieces), 2):
+            parts.append(str(values[pieces[i]]))
+            parts.append(pieces[i + 1])
+        return "".join(parts)
+
+
+PROMPT_TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_template(name: str, source: str) -> PromptTemplate:
+    """
+    Compile a template and add it to the registry
+
+    Args:
+        name: The content type
+        source: The template source
+
+    Returns:
+        The compiled template
+    """
+    template = PromptTemplate(name, source)
+    PROMPT_TEMPLATES[name] = template
+    return template
+
+
+def render_prompt(name: str, **values: Any) -> str:
+    """
+    Render a registered template
+
+    Args:
+        name: The content type
+        **values: A value for every field of the template
+
+    Returns:
+        The prompt
+    """
+    return PROMPT_TEMPLATES[name].render(**values)
+
+
+register_template("lesson", LESSON_TEMPLATE)
+register_template("assessment", ASSESSMENT_TEMPLATE)
+register_template("lab", LAB_TEMPLATE)
+
+
+def calculate_max_tokens(model: Dict[str, Any]) -> int:
+    """
+    Calculate the largest max_tokens to request from a model, based on its context length
+
+    Args:
+        model: Model info dictionary from AVAILABLE_MODELS
+
+    Returns:
+        The max_tokens ceiling
+    """
+    # For very large models, we can use more tokens for output
+    context_length = model["context_length"]
+    max_tokens = min(8000, context_length // 4)  # Cap at 8000 but use up to 1/4 of context window
+
+    # Special case for the largest models
+    if context_length >= 500000:  # For models like Llama 4 Scout and Gemini
+        max_tokens = min(12000, context_length // 8)  # Allow up to 12K tokens for massive models
+
+    return max_tokens
+
+
+def request_units(request: BaseModel) -> int:
+    """The number of units a request's completion length scales with (questions for an assessment)"""
+    if REQUEST_KINDS.get(type(request).__name__) == "assessment":
+        return max(int(getattr(request, "numberOfQuestions", 1) or 1), 1)
+    return 1
+
+
+class TokenBudget:
+    """
+    Sizes max_tokens for each generation from the completion lengths seen so far
+
+    Asking for far more tokens than a lesson needs makes nothing better,
+    but it holds more of the provider's capacity for the call and hides
+    runaway generations. Each content type starts from a default expected
+    length; once enough responses have been seen, the PROMPT_BUDGET_PERCENTILE
+    of their lengths (per question for assessments) takes over. The budget
+    is that times PROMPT_BUDGET_HEADROOM, never more than what is left of the
+    model's context after the prompt, nor more than calculate_max_tokens.
+    """
+
+    def __init__(
+        self,
+        headroom: float = PROMPT_BUDGET_HEADROOM,
+        quantile: float = PROMPT_BUDGET_PERCENTILE,
+        min_samples: int = PROMPT_BUDGET_MIN_SAMPLES,
+        window: int = PROMPT_BUDGET_WINDOW
+    ):
+        """
+        Initialize the budget
+
+        Args:
+            headroom: Multiplier on the expected completion length
+            quantile: Percentile of observed lengths taken as expected (0-100)
+            min_samples: Observations needed before they replace the default
+            window: Recent observations kept per content type
+        """
+        self.headroom = headroom
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.window = window
+        # Content type -> recent completion tokens per unit
+        self._observed: Dict[str, deque] = {}
+        self._truncated: Dict[str, int] = {}
+        self._budgeted: Dict[str, Tuple[int, int]] = {}
+
+    def expected_tokens(self, kind: str, units: int = 1) -> int:
+        """
+        Get the expected completion length
+
+        Args:
+            kind: The content type
+            units: Units the length scales with
+
+        Returns:
+            The expected completion tokens
+        """
+        observed = self._observed.get(kind)
+        if observed is not None and len(observed) >= self.min_samples:
+            per_unit = percentile(sorted(observed), self.quantile)
+        else:
+            per_unit = DEFAULT_COMPLETION_TOKENS.get(kind, DEFAULT_COMPLETION_TOKENS["lesson"])
+        return math.ceil(per_unit * units)
+
+    def max_tokens(self, kind: str, model: Dict[str, Any], prompt_tokens: int, units: int = 1) -> int:
+        """
+        Get the max_tokens to request
+
+        Args:
+            kind: The content type
+            model: Model info dictionary from AVAILABLE_MODELS
+            prompt_tokens: Tokens in the prompt
+            units: Units the completion length scales with
+
+        Returns:
+            The max_tokens value to request
+        """
+        available = model["context_length"] - prompt_tokens - PROMPT_BUDGET_RESERVE
+        if available < PROMPT_BUDGET_MIN_TOKENS:
+            raise Exception(
+                f"Prompt of about {prompt_tokens} tokens leaves no room for a response "
+                f"in {model['id']}'s {model['context_length']}-token context"
+            )
+        wanted = max(math.ceil(self.expected_tokens(kind, units) * self.headroom), PROMPT_BUDGET_MIN_TOKENS)
+        budget = min(wanted, available, calculate_max_tokens(model))
+        count, total = self._budgeted.get(kind, (0, 0))
+        self._budgeted[kind] = (count + 1, total + budget)
+        return budget
+
+    def observe(self, kind: str, completion_tokens: int, units: int = 1, max_tokens: Optional[int] = None) -> None:
+        """
+        Record the length of a generated response
+
+        Args:
+            kind: The content type
+            completion_tokens: Tokens in the response
+            units: Units the length scales with
+            max_tokens: The max_tokens it was generated with, to spot truncated responses
+        """
+        if completion_tokens <= 0:
+            return
+        if max_tokens and completion_tokens >= max_tokens * 0.95:
+            # Cut off at the limit; the full answer would have been longer
+            self._truncated[kind] = self._truncated.get(kind, 0) + 1
+            completion_tokens = math.ceil(completion_tokens * self.headroom)
+        observed = self._observed.get(kind)
+        if observed is None:
+            observed = self._observed[kind] = deque(maxlen=self.window)
+        observed.append(completion_tokens / max(units, 1))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get budget statistics per content type
+
+        Returns:
+            Dictionary with the observed lengths, expected length and mean budget per content type
+        """
+        result = {}
+        for kind in sorted(set(DEFAULT_COMPLETION_TOKENS) | set(self._observed)):
+            observed = sorted(self._observed.get(kind, ()))
+            count, total = self._budgeted.get(kind, (0, 0))
+            result[kind] = {
+                "samples": len(observed),
+                "source": "observed" if len(observed) >= self.min_samples else "default",
+                "expected_tokens_per_unit": self.expected_tokens(kind),
+                "p50_tokens_per_unit": round(percentile(observed, 50)) if observed else None,
+                "truncated": self._truncated.get(kind, 0),
+                "budgets": count,
+                "mean_max_tokens": round(total / count) if count else None,
+            }
+        return result
+
+
+TOKEN_BUDGET = TokenBudget()
+
+
+def budget_max_tokens(request: BaseModel, model: Dict[str, Any], prompt: str) -> int:
+    """
+    Get the max_tokens to request for a generation request's prompt
+
+    Args:
+        request: A LessonRequest, AssessmentRequest or LabRequest
+        model: Model info dictionary from AVAILABLE_MODELS
+        prompt: The rendered prompt
+
+    Returns:
+        The max_tokens value to request
+    """
+    kind = REQUEST_KINDS.get(type(request).__name__)
+    if kind is None:
+        return calculate_max_tokens(model)
+    return TOKEN_BUDGET.max_tokens(kind, model, estimate_tokens(prompt), request_units(request))
+
+
+def observe_completion(request: BaseModel, response: str, max_tokens: Optional[int] = None) -> None:
+    """
+    Record the length of a response generated for a request
+
+    Args:
+        request: The generation request
+        response: The model response
+        max_tokens: The max_tokens it was generated with
+    """
+    kind = REQUEST_KINDS.get(type(request).__name__)
+    if kind is not None:
+        TOKEN_BUDGET.observe(kind, estimate_tokens(response), request_units(request), max_tokens)
@@ -0,0 +1,488 @@
+import os
+import re
+import json
+import time
+import zlib
+import shutil
+import logging
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from dotenv import load_dotenv
+
+from .prompts import estimate_tokens
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.rag")
+
+# Retrieval-augmented generation configuration
+RAG_ENABLED = os.getenv("RAG_ENABLED", "False").lower() in ("true", "1", "t", "yes")
+RAG_INDEX_PATH = os.getenv(
+    "RAG_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "rag")
+)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+# Cosine similarity (0-1) a chunk needs to be put in a prompt
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.2"))
+# Most tokens of retrieved text added to one prompt
+RAG_MAX_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "1000"))
+# Used when building an index; an index keeps the settings it was built with
+RAG_DIMENSIONS = int(os.getenv("RAG_DIMENSIONS", "512"))
+RAG_CHUNK_WORDS = int(os.getenv("RAG_CHUNK_WORDS", "180"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "30"))
+
+# Files the ingestion pipeline reads
+DOCUMENT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst")
+# Chunks scored against the queries at a time, bounding the score matrix's memory
+SEARCH_BLOCK_ROWS = 65536
+# Chunks vectorized at a time while building
+BUILD_BATCH = 4096
+
+_TOKENS = re.compile(r"[a-z0-9]+")
+_PARAGRAPHS = re.compile(r"\n\s*\n")
+
+# Words too common to say what a chunk is about
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from had has have how i if in into is it its
+of on or our so such than that the their them then there these they this to was we were what
+when which while who will with would you your
+""".split())
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise Exception("The 'numpy' package is required for retrieval (RAG). Install it with: pip install numpy")
+    return numpy
+
+
+class HashingVectorizer:
+    """
+    Turns text into fixed-size vectors without a vocabulary or a model
+
+    Each word is hashed (crc32) to one of `dimensions` buckets with a sign
+    from another bit of the hash, so collisions tend to cancel out rather
+    than add up. Counts are dampened (1 + log tf), weighted by the inverse
+    document frequency of the bucket in the indexed chunks, and the vector
+    is L2-normalized, so a dot product is a cosine similarity.
+    """
+
+    def __init__(self, dimensions: int = RAG_DIMENSIONS):
+        self.dimensions = dimensions
+        self.idf = None
+        # word -> (bucket, sign), since the same words come up again and again
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def _bucket(self, word: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            hashed = zlib.crc32(word.encode())
+            bucket = (hashed % self.dimensions, 1.0 if hashed & 0x80000000 else -1.0)
+            if len(self._buckets) < 1_000_000:
+                self._buckets[word] = bucket
+        return bucket
+
+    def counts(self, texts: List[str]):
+        """
+        Get the signed, dampened word counts of texts
+
+        Args:
+            texts: The texts
+
+        Returns:
+            float32 array of shape (len(texts), dimensions)
+        """
+        np = _numpy()
+        rows: List[int] = []
+        columns: List[int] = []
+        signs: List[float] = []
+        for row, text in enumerate(texts):
+            for word in _TOKENS.findall(text.lower()):
+                if len(word) < 2 or word in STOPWORDS:
+                    continue
+                bucket, sign = self._bucket(word)
+                rows.append(row)
+                columns.append(bucket)
+                signs.append(sign)
+
+        flat = np.asarray(rows, dtype=np.int64) * self.dimensions + np.asarray(columns, dtype=np.int64)
+        signed = np.bincount(flat, weights=np.asarray(signs, dtype=np.float64), minlength=len(texts) * self.dimensions)
+        magnitude = np.abs(signed)
+        matrix = np.where(magnitude > 0, np.sign(signed) * (1.0 + np.log(np.maximum(magnitude, 1.0))), 0.0)
+        return matrix.astype(np.float32).reshape(len(texts), self.dimensions)
+
+    def transform(self, texts: List[str]):
+        """
+        Vectorize texts with the fitted IDF weights
+
+        Args:
+            texts: The texts
+
+        Returns:
+            L2-normalized float32 array of shape (len(texts), dimensions)
+        """
+        np = _numpy()
+        matrix = self.counts(texts)
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+def chunk_text(text: str, chunk_words: int = RAG_CHUNK_WORDS, overlap: int = RAG_CHUNK_OVERLAP) -> List[str]:
+    """
+    Split a document into overlapping chunks of about chunk_words words
+
+    Paragraphs are kept together where they fit, so chunks tend to break
+    at paragraph ends; a paragraph longer than a chunk is split by words.
+
+    Args:
+        text: The document
+        chunk_words: Words per chunk
+        overlap: Words repeated at the start of the next chunk
+
+    Returns:
+        The chunks
+    """
+    overlap = min(overlap, chunk_words - 1)
+    chunks: List[str] = []
+    current: List[str] = []
+    # Words in current not yet in an emitted chunk
+    pending = 0
+    for paragraph in _PARAGRAPHS.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if pending and len(current) + len(words) > chunk_words and len(words) <= chunk_words:
+            # Start the paragraph in a new chunk rather than splitting it
+            chunks.append(" ".join(current))
+            current = current[-overlap:] if overlap else []
+            pending = 0
+        current.extend(words)
+        pending += len(words)
+        while len(current) >= chunk_words:
+            chunks.append(" ".join(current[:chunk_words]))
+            current = current[chunk_words - overlap:]
+            pending = max(len(current) - overlap, 0)
+    if pending:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Read the documents under the given files and directories
+
+    Args:
+        paths: Files, or directories searched recursively for DOCUMENT_EXTENSIONS files
+
+    Yields:
+        (path, text) per document
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                        full_path = os.path.join(directory, name)
+                        with open(full_path, encoding="utf-8", errors="replace") as f:
+                            yield full_path, f.read()
+        else:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                yield path, f.read()
+
+
+def build_index(
+    chunks: Iterable[Tuple[str, str]],
+    path: str = RAG_INDEX_PATH,
+    dimensions: int = RAG_DIMENSIONS
+) -> Dict[str, Any]:
+    """
+    Build an index from (source, chunk text) pairs and write it to a directory
+
+    The vectors go to a float32 .npy file and the chunk texts to one UTF-8
+    file with an offsets array, so a worker memory-maps the index instead of
+    reading it. The new index is written next to the old one and swapped in
+    with a rename, so workers never see half an index.
+
+    Args:
+        chunks: (source, text) per chunk
+        path: The index directory
+        dimensions: Vector size
+
+    Returns:
+        The index metadata
+    """
+    np = _numpy()
+    started = time.perf_counter()
+    vectorizer = HashingVectorizer(dimensions)
+    building = f"{path}.building-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    sources: List[str] = []
+    source_ids: Dict[str, int] = {}
+    chunk_sources: List[int] = []
+    offsets = [0]
+    document_frequency = np.zeros(dimensions, dtype=np.float64)
+    count = 0
+
+    # First pass: raw counts to disk and document frequencies per bucket
+    with open(os.path.join(building, "chunks.txt"), "wb") as texts_file, \
+            open(os.path.join(building, "counts.f32"), "wb") as counts_file:
+        batch: List[str] = []
+
+        def flush() -> None:
+            matrix = vectorizer.counts(batch)
+            document_frequency[:] += (matrix != 0).sum(axis=0)
+            counts_file.write(matrix.tobytes())
+            batch.clear()
+
+        for source, text in chunks:
+            if source not in source_ids:
+                source_ids[source] = len(sources)
+                sources.append(source)
+            chunk_sources.append(source_ids[source])
+            encoded = text.encode("utf-8")
+            texts_file.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            batch.append(text)
+            count += 1
+            if len(batch) >= BUILD_BATCH:
+                flush()
+        if batch:
+            flush()
+
+    # Second pass: IDF weighting and normalization, a batch at a time
+    idf = (np.log((1.0 + count) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+    counts = np.memmap(os.path.join(building, "counts.f32"), dtype=np.float32, mode="r", shape=(count, dimensions)) if count else None
+    vectors = np.lib.format.open_memmap(
+        os.path.join(building, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dimensions)
+    )
+    for start in range(0, count, BUILD_BATCH):
+        block = counts[start:start + BUILD_BATCH] * idf
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        vectors[start:start + BUILD_BATCH] = block / np.maximum(norms, 1e-12)
+    vectors.flush()
+    del vectors, counts
+    os.remove(os.path.join(building, "counts.f32"))
+
+    np.save(os.path.join(building, "idf.npy"), idf)
+    np.save(os.path.join(building, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(building, "sources.npy"), np.asarray(chunk_sources, dtype=np.int32))
+    meta = {
+        "chunks": count,
+        "sources": sources,
+        "dimensions": dimensions,
+        "built_at": time.time(),
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(building, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # Swap the new index in
+    previous = f"{path}.previous-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, previous)
+    os.replace(building, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    logger.info("Built retrieval index", extra={"chunks": count, "sources": len(sources), "seconds": meta["build_seconds"]})
+    return meta
+
+
+def ingest(paths: Iterable[str], path: str = RAG_INDEX_PATH, chunk_words: int = RAG_CHUNK_WORDS,
+           overlap: int = RAG_CHUNK_OVERLAP, dimensions: int = RAG_DIMENSIONS) -> Dict[str, Any]:
+    """
+    Chunk local documents and build the index from them
+
+    Args:
+        paths: Files, or directories of DOCUMENT_EXTENSIONS files
+        path: The index directory
+        chunk_words: Words per chunk
+        overlap: Words shared by consecutive chunks
+        dimensions: Vector size
+
+    Returns:
+        The index metadata
+    """
+    def chunks() -> Iterator[Tuple[str, str]]:
+        for source, text in iter_documents(paths):
+            for chunk in chunk_text(text, chunk_words, overlap):
+                yield source, chunk
+
+    return build_index(chunks(), path, dimensions)
+
+
+class RAGIndex:
+    """A built index, memory-mapped read-only"""
+
+    def __init__(self, path: str = RAG_INDEX_PATH):
+        """
+        Open an index
+
+        Args:
+            path: The index directory
+        """
+        np = _numpy()
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.vectorizer = HashingVectorizer(self.meta["dimensions"])
+        self.vectorizer.idf = np.load(os.path.join(path, "idf.npy"))
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.sources = np.load(os.path.join(path, "sources.npy"), mmap_mode="r")
+        self.texts = np.memmap(os.path.join(path, "chunks.txt"), dtype=np.uint8, mode="r") if self.offsets[-1] else None
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def __len__(self) -> int:
+        return self.meta["chunks"]
+
+    def chunk(self, index: int) -> Dict[str, Any]:
+        """Get a chunk's text and source document"""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return {
+            "text": bytes(self.texts[start:end]).decode("utf-8") if self.texts is not None else "",
+            "source": self.meta["sources"][int(self.sources[index])],
+        }
+
+    def search(self, queries: List[str], k: int = RAG_TOP_K) -> List[List[Tuple[int, float]]]:
+        """
+        Find the chunks most similar to each of several queries
+
+        All queries are scored against a block of chunks with one matrix
+        product, keeping only each query's best k so far.
+
+        Args:
+            queries: The query texts
+            k: Chunks to return per query
+
+        Returns:
+            Per query, up to k (chunk index, similarity) pairs, best first
+        """
+        np = _numpy()
+        started = time.perf_counter()
+        count = len(self)
+        if not queries or count == 0 or k <= 0:
+            return [[] for _ in queries]
+
+        query_vectors = self.vectorizer.transform(queries)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores = query_vectors @ block.T
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_indices = np.concatenate([best_indices, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_indices = np.take_along_axis(best_indices, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_indices = np.take_along_axis(best_indices, order, axis=1)
+        self.searches += len(queries)
+        self.search_seconds += time.perf_counter() - started
+        return [
+            [(int(index), float(score)) for index, score in zip(indices, scores)]
+            for indices, scores in zip(best_indices, best_scores)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics
+
+        Returns:
+            Dictionary with the index size, build time and mean search latency
+        """
+        return {
+            "path": self.path,
+            "chunks": len(self),
+            "sources": len(self.meta["sources"]),
+            "dimensions": self.meta["dimensions"],
+            "built_at": self.meta["built_at"],
+            "build_seconds": self.meta["build_seconds"],
+            "searches": self.searches,
+            "mean_search_ms": round(self.search_seconds / self.searches * 1000, 3) if self.searches else None,
+        }
+
+
+_index: Optional[RAGIndex] = None
+_index_built_at: Optional[float] = None
+
+
+def get_index(path: str = RAG_INDEX_PATH) -> Optional[RAGIndex]:
+    """
+    Get the index, opening it again if it has been rebuilt since
+
+    Args:
+        path: The index directory
+
+    Returns:
+        The index, or None if none has been built
+    """
+    global _index, _index_built_at
+    try:
+        built_at = os.stat(os.path.join(path, "meta.json")).st_mtime
+    except FileNotFoundError:
+        _index = None
+        return None
+    if _index is None or built_at != _index_built_at or _index.path != path:
+        _index = RAGIndex(path)
+        _index_built_at = built_at
+    return _index
+
+
+def retrieve_references(query: str, k: int = RAG_TOP_K) -> str:
+    """
+    Get curriculum excerpts relevant to a generation request, formatted for a prompt
+
+    Args:
+        query: What the request is about (topic, grade level, notes)
+        k: Most chunks to include
+
+    Returns:
+        The excerpts with an instruction to use them, or "" when retrieval is
+        off, there is no index or nothing is similar enough
+    """
+    if not RAG_ENABLED:
+        return ""
+    index = get_index()
+    if index is None:
+        return ""
+
+    excerpts = []
+    tokens = 0
+    for chunk_index, score in index.search([query], k)[0]:
+        if score < RAG_MIN_SCORE:
+            break
+        chunk = index.chunk(chunk_index)
+        excerpt = f"[{len(excerpts) + 1}] ({os.path.basename(chunk['source'])}) {chunk['text']}"
+        excerpt_tokens = estimate_tokens(excerpt)
+        if tokens + excerpt_tokens > RAG_MAX_CONTEXT_TOKENS:
+            break
+        excerpts.append(excerpt)
+        tokens += excerpt_tokens
+    if not excerpts:
+        return ""
+    return "Use these excerpts from our curriculum documents where they are relevant:\n" + "\n".join(excerpts) + "\n"
+
+
+def get_rag_stats() -> Dict[str, Any]:
+    """
+    Get retrieval statistics
+
+    Returns:
+        Whether retrieval is enabled and the index statistics
+    """
+    if not RAG_ENABLED:
+        return {"enabled": False}
+    index = get_index()
+    return {"enabled": True, "index": index.stats() if index is not None else None}
@@ -0,0 +1,404 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple, List, Mapping, Callable, Set
+
+from .shared_state import StateStore, MemoryStateStore
+
+logger = logging.getLogger("edugenie.rate_limiter")
+
+# Window of an X-RateLimit-Limit that doesn't give one (OpenRouter's limits are per minute)
+UPSTREAM_LIMIT_WINDOW = 60.0
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[int, float]]:
+    """
+    Parse per-model limits from configuration
+
+    Accepts JSON mapping model IDs to "calls/seconds" strings or
+    [calls, seconds] pairs, e.g. {"deepseek/deepseek-chat:free": "20/60"}.
+
+    Args:
+        value: The configuration string
+
+    Returns:
+        Dictionary of model ID to (calls, window seconds)
+    """
+    if not value:
+        return {}
+
+    try:
+        raw = json.loads(value)
+    except json.JSONDecodeError:
+        logger.warning("Could not parse rate limit configuration, ignoring it")
+        return {}
+
+    limits = {}
+    for model_id, limit in raw.items():
+        try:
+            if isinstance(limit, str):
+                calls, window = limit.split("/")
+            else:
+                calls, window = limit
+            limits[model_id] = (int(calls), float(window))
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid rate limit for {model_id}: {limit!r}")
+    return limits
+
+
+class TokenBucket:
+    """
+    A token bucket holding up to ``capacity`` tokens, refilled continuously
+
+    A full bucket allows a burst of ``capacity`` calls, after which calls are
+    spread out at the refill rate, so at most capacity + rate * t calls can
+    happen in any period t (unlike a fixed window, which allows 2x at its edges).
+    """
+
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated", "blocked_until", "learned")
+
+    def __init__(self, capacity: float, window: float, now: float, state: Optional[Dict[str, float]] = None):
+        self.capacity = float(capacity)
+        self.refill_rate = capacity / window  # tokens per second
+        self.tokens = float(capacity)
+        self.updated = now
+        # Set when the upstream API tells us to stop until a given time
+        self.blocked_until = 0.0
+        # [calls, window seconds] learned from the upstream headers, kept for every worker
+        self.learned: Optional[List[float]] = None
+        if state:
+            # The limit may have been lowered since the state was written
+            self.tokens = min(self.capacity, state["tokens"])
+            self.updated = state["updated"]
+            self.blocked_until = state["blocked_until"]
+            self.learned = state.get("limit")
+
+    def to_state(self) -> Dict[str, Any]:
+        """The mutable part of the bucket, as stored in the state store"""
+        state = {"tokens": self.tokens, "updated": self.updated, "blocked_until": self.blocked_until}
+        if self.learned:
+            state["limit"] = self.learned
+        return state
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+            self.updated = now
+
+    def time_until(self, cost: float, now: float) -> float:
+        """Seconds until ``cost`` tokens are available (after refilling)"""
+        wait = max(0.0, self.blocked_until - now)
+        missing = cost - self.tokens
+        if missing > 0:
+            wait = max(wait, missing / self.refill_rate if self.refill_rate > 0 else float("inf"))
+        return wait
+
+
+class RateLimiter:
+    """
+    Per-key (per-model) token bucket rate limiter
+
+    Every operation is O(1): each key has its own bucket, refilled lazily
+    from the elapsed time when it is touched. Limits come from the default,
+    per-key configuration, or the upstream X-RateLimit-* / Retry-After headers.
+    A limit learned from X-RateLimit-Limit replaces the default for its key,
+    but not a configured one.
+
+    Bucket state lives in a StateStore, so with a shared store (SQLite or a
+    network store) every worker process draws from the same buckets. A
+    learned limit is kept in its bucket's state, so every worker applies it.
+    """
+
+    def __init__(
+        self,
+        default_limit: int,
+        window: float,
+        limits: Optional[Dict[str, Tuple[int, float]]] = None,
+        store: Optional[StateStore] = None,
+        namespace: str = "rate",
+        header_window: float = UPSTREAM_LIMIT_WINDOW
+    ):
+        """
+        Initialize the limiter
+
+        Args:
+            default_limit: Calls allowed per window for keys without their own limit
+            window: Window length in seconds
+            limits: Optional per-key (calls, window seconds) overrides
+            store: Where bucket state is kept (defaults to this process only)
+            namespace: Prefix separating this limiter's keys from others in the store
+            header_window: Window in seconds of an upstream limit that doesn't state one
+        """
+        self.default_limit = default_limit
+        self.window = window
+        self.limits = dict(limits or {})
+        # Keys whose limit was configured; learned limits live in the store (see update_from_headers)
+        self.configured: Set[str] = set(self.limits)
+        self.header_window = header_window
+        self.store = store or MemoryStateStore()
+        self.namespace = namespace
+        self.allowed = 0
+        self.rejected = 0
+
+    def _state_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _limit(self, key: str, state: Optional[Dict[str, Any]]) -> Tuple[int, float]:
+        """The key's (calls, window seconds): configured, else learned, else the default"""
+        if key not in self.configured and state and state.get("limit"):
+            calls, window = state["limit"]
+            return calls, window
+        return self.limits.get(key, (self.default_limit, self.window))
+
+    def _new_bucket(self, key: str, now: float, state: Optional[Dict[str, Any]]) -> TokenBucket:
+        calls, window = self._limit(key, state)
+        bucket = TokenBucket(calls, window, now, state)
+        bucket.refill(now)
+        return bucket
+
+    def _update(
+        self,
+        key: str,
+        fn: Callable[[TokenBucket, float], Any],
+        learned: Optional[Tuple[int, float]] = None
+    ) -> Any:
+        """Apply fn to the key's bucket as one atomic update of the store, storing any learned limit with it"""
+        now = time.time()
+
+        def apply(state):
+            if learned is not None:
+                if (state or {}).get("limit") != list(learned):
+                    logger.info("Learned rate limit for %s: %d calls per %.0fs", key, *learned)
+                # A new key's bucket starts full at the learned limit
+                state = {"tokens": learned[0], "updated": now, "blocked_until": 0.0, **(state or {}), "limit": list(learned)}
+            bucket = self._new_bucket(key, now, state)
+            result = fn(bucket, now)
+            return bucket.to_state(), result
+
+        return self.store.update(self._state_key(key), apply)
+
+    def _peek(self, key: str, now: float) -> TokenBucket:
+        """Read the key's bucket without writing it back"""
+        return self._new_bucket(key, now, self.store.get(self._state_key(key)))
+
+    def set_limit(self, key: str, calls: int, window: float) -> None:
+        """
+        Configure the limit for a key
+
+        Args:
+            key: The key (model ID)
+            calls: Calls allowed per window
+            window: Window length in seconds
+        """
+        self.limits[key] = (calls, window)
+        self.configured.add(key)
+
+    def try_acquire(self, key: str, cost: float = 1.0) -> bool:
+        """
+        Take tokens if they are available
+
+        Args:
+            key: The key (model ID)
+            cost: Number of tokens to take
+
+        Returns:
+            True if allowed, False if rate limited
+        """
+        def take(bucket: TokenBucket, now: float) -> bool:
+            if bucket.time_until(cost, now) > 0:
+                return False
+            bucket.tokens -= cost
+            return True
+
+        if self._update(key, take):
+            self.allowed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def consume(self, key: str, cost: float = 1.0) -> None:
+        """
+        Take tokens unconditionally, going into debt if necessary
+
+        Used to record calls that happen even though the key is limited.
+        The debt is capped at one full bucket.
+
+        Args:
+            key: The key (model ID)
+            cost: Number of tokens to take
+        """
+        def take(bucket: TokenBucket, now: float) -> None:
+            bucket.tokens = max(-bucket.capacity, bucket.tokens - cost)
+
+        self._update(key, take)
+
+    def can_acquire(self, key: str, cost: float = 1.0) -> bool:
+        """Check whether tokens are available without taking them"""
+        return self.time_until_available(key, cost) == 0
+
+    def time_until_available(self, key: str, cost: float = 1.0) -> float:
+        """
+        Get how long until a call would be allowed
+
+        Args:
+            key: The key (model ID)
+            cost: Number of tokens needed
+
+        Returns:
+            Seconds until available (0 if available now)
+        """
+        now = time.time()
+        return self._peek(key, now).time_until(cost, now)
+
+    async def acquire(self, key: str, cost: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Wait asynchronously until tokens are available, then take them
+
+        Args:
+            key: The key (model ID)
+            cost: Number of tokens to take
+            timeout: Maximum seconds to wait (None to wait as long as needed)
+
+        Returns:
+            True if acquired, False if it would take longer than the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_acquire(key, cost):
+                return True
+
+            wait = self.time_until_available(key, cost)
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            # Another waiter (possibly in another worker) may take the tokens first,
+            # so re-check after sleeping
+            await asyncio.sleep(wait)
+
+    def block(self, key: str, seconds: float) -> None:
+        """
+        Block a key for a number of seconds, e.g. after a 429 with Retry-After
+
+        Args:
+            key: The key (model ID)
+            seconds: How long to block
+        """
+        def apply(bucket: TokenBucket, now: float) -> None:
+            bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+
+        self._update(key, apply)
+
+    def update_from_headers(self, key: str, headers: Mapping[str, str]) -> None:
+        """
+        Sync a key's bucket with the upstream rate limit headers
+
+        X-RateLimit-Limit (a number of calls, optionally with ";w=<seconds>",
+        otherwise per `header_window`) becomes the key's limit unless one
+        is configured, and is stored with the bucket so every worker uses
+        it. X-RateLimit-Remaining then caps the bucket's tokens,
+        since both describe the same window; under another limit it is only
+        used, with X-RateLimit-Reset (epoch seconds or milliseconds), to wait
+        for the reset when nothing remains. Retry-After blocks the key.
+
+        Args:
+            key: The key (model ID)
+            headers: Response headers
+        """
+        limit = _header_limit(headers)
+        learned = None
+        if limit is not None and key not in self.configured:
+            calls, window = limit
+            learned = (calls, window or self.header_window)
+
+        remaining = _header_number(headers, "x-ratelimit-remaining")
+        reset = _header_number(headers, "x-ratelimit-reset")
+        retry_after = _header_number(headers, "retry-after")
+        if learned is None and remaining is None and retry_after is None:
+            # Nothing to sync; skip the store round trip
+            return
+
+        def apply(bucket: TokenBucket, now: float) -> None:
+            if remaining is not None and bucket.learned and key not in self.configured:
+                bucket.tokens = min(bucket.tokens, remaining)
+
+            if reset is not None and remaining is not None and remaining <= 0:
+                # OpenRouter sends milliseconds; accept seconds too
+                reset_at = reset / 1000.0 if reset > 1e11 else reset
+                bucket.blocked_until = max(bucket.blocked_until, reset_at)
+
+            if retry_after is not None:
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+
+        self._update(key, apply, learned)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get per-key limiter state
+
+        Returns:
+            Dictionary of key to capacity, available tokens and time until available
+        """
+        now = time.time()
+        keys = {}
+        prefix = self._state_key("")
+        for state_key in self.store.keys(prefix):
+            key = state_key[len(prefix):]
+            state = self.store.get(state_key)
+            bucket = self._new_bucket(key, now, state)
+            keys[key] = {
+                "capacity": bucket.capacity,
+                "available": round(bucket.tokens, 3),
+                "used": round(bucket.capacity - bucket.tokens, 3),
+                "retry_after": round(bucket.time_until(1.0, now), 3),
+                "limit": "{}/{:g}".format(*self._limit(key, state)),
+                "learned": bool(bucket.learned) and key not in self.configured,
+            }
+        return {
+            "default_limit": self.default_limit,
+            "window": self.window,
+            "store": self.store.name,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "keys": keys,
+        }
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _header_limit(headers: Mapping[str, str]) -> Optional[Tuple[int, Optional[float]]]:
+    """
+    Read X-RateLimit-Limit, e.g. "20", "20;w=60" or "20, 20;w=60"
+
+    Returns:
+        (calls, window seconds or None if not given), or None if absent or invalid
+    """
+    value = headers.get("x-ratelimit-limit")
+    if value is None:
+        return None
+    calls, window = None, None
+    for item in value.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        try:
+            number = int(float(parts[0]))
+        except ValueError:
+            continue
+        if calls is None:
+            calls = number
+        for part in parts[1:]:
+            name, _, param = part.partition("=")
+            if name.strip() == "w" and window is None and number == calls:
+                try:
+                    window = float(param)
+                except ValueError:
+                    pass
+    if calls is None or calls <= 0 or (window is not None and window <= 0):
+        return None
+    return calls, window
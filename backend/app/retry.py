@@ -0,0 +1,190 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator, TypeVar
+
+from dotenv import load_dotenv
+
+from .errors import (
+    UpstreamError, UpstreamTimeoutError, FAILURE_RATE_LIMITED, FAILURE_CIRCUIT_OPEN, FAILURE_CLIENT
+)
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.retry")
+
+T = TypeVar("T")
+
+# Retry configuration
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # Attempts per request, including the first
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # Backoff before the first retry, at most
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "10"))  # Backoff cap
+# Seconds a request may spend on all its attempts and waits together
+RETRY_TIME_BUDGET = float(os.getenv("RETRY_TIME_BUDGET", "300"))
+
+# Failures that another attempt can't fix
+NOT_RETRYABLE = (FAILURE_CLIENT,)
+# Failures that are about the model's capacity: another model can be tried straight away
+CAPACITY_FAILURES = (FAILURE_RATE_LIMITED, FAILURE_CIRCUIT_OPEN)
+
+
+class RetryPolicy:
+    """
+    Retries failed generations, switching models where that helps
+
+    Only typed upstream errors (app/errors.py) are retried, and not bad
+    requests. Each retry goes to another model when one is available: at
+    once after a rate limit or an open circuit, since the next model's
+    capacity is unrelated, and otherwise after an exponential backoff with
+    full jitter. With no other model, the same model is retried after the
+    backoff or the upstream's Retry-After, whichever is longer. Attempts
+    and waits together stay within the time budget.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        time_budget: float = RETRY_TIME_BUDGET
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            max_attempts: Attempts per request, including the first
+            base_delay: Upper bound of the first backoff in seconds
+            max_delay: Upper bound of any backoff in seconds
+            time_budget: Seconds all attempts and waits may take together
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.time_budget = time_budget
+        self.requests = 0
+        self.retries = 0
+        self.model_switches = 0
+        self.exhausted = 0
+        self.failures_by_kind: Dict[str, int] = {}
+
+    def backoff(self, retry: int) -> float:
+        """
+        Get a full-jitter backoff delay
+
+        Args:
+            retry: The retry number, from 0
+
+        Returns:
+            A delay drawn uniformly between 0 and min(max_delay, base_delay * 2^retry)
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    async def run(
+        self,
+        model_id: str,
+        attempt: Callable[[str], Awaitable[T]],
+        alternative: Callable[[str, List[str]], Optional[str]]
+    ) -> T:
+        """
+        Run an attempt, retrying failures
+
+        Args:
+            model_id: The model for the first attempt
+            attempt: Does the work on a model, raising UpstreamError subclasses on failure
+            alternative: Returns another model to try, given the failed one and
+                every model tried so far (None if there is none)
+
+        Returns:
+            The first successful attempt's result
+
+        Raises:
+            UpstreamError: The last failure, once attempts or time run out
+        """
+        self.requests += 1
+        deadline = time.monotonic() + self.time_budget
+        tried = [model_id]
+        retry = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                return await asyncio.wait_for(attempt(model_id), timeout=remaining)
+            except asyncio.TimeoutError:
+                self.exhausted += 1
+                raise UpstreamTimeoutError(
+                    f"Request error: gave up after the {self.time_budget:.0f}s time budget", model_id
+                )
+            except UpstreamError as error:
+                self.failures_by_kind[error.kind] = self.failures_by_kind.get(error.kind, 0) + 1
+                if error.kind in NOT_RETRYABLE:
+                    raise
+                if retry + 1 >= self.max_attempts:
+                    self.exhausted += 1
+                    raise
+
+                next_model = alternative(model_id, tried)
+                if next_model is not None and next_model not in tried:
+                    delay = 0.0 if error.kind in CAPACITY_FAILURES else self.backoff(retry)
+                else:
+                    next_model = model_id
+                    delay = max(self.backoff(retry), error.retry_after or 0.0)
+                if time.monotonic() + delay >= deadline:
+                    self.exhausted += 1
+                    raise
+
+                logger.warning(
+                    "Attempt %d on %s failed (%s), retrying on %s in %.2fs",
+                    retry + 1, model_id, error.kind, next_model, delay,
+                    extra={"model": model_id, "retry_model": next_model}
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if next_model != model_id:
+                    self.model_switches += 1
+                    tried.append(next_model)
+                model_id = next_model
+                retry += 1
+                self.retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get retry statistics
+
+        Returns:
+            Dictionary with the configuration and this worker's retry counters
+        """
+        return {
+            "max_attempts": self.max_attempts,
+            "time_budget": self.time_budget,
+            "requests": self.requests,
+            "retries": self.retries,
+            "model_switches": self.model_switches,
+            "exhausted": self.exhausted,
+            "failures": dict(self.failures_by_kind),
+        }
+
+
+async def prime_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Wait for a stream's first item, so a failure to start raises here and can be retried
+
+    Args:
+        stream: The stream
+
+    Returns:
+        A stream yielding the first item and then the rest
+    """
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def resume() -> AsyncIterator[str]:
+        if first is None:
+            return
+        yield first
+        async for item in stream:
+            yield item
+
+    return resume()
@@ -0,0 +1,374 @@
+import os
+import re
+import time
+import zlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.semantic_cache")
+
+# Semantic cache configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() in ("true", "1", "t", "yes")
+# Cosine similarity (0-1) a stored request needs to be served for a new one
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60))))
+# Fraction of near-duplicate hits regenerated in the background to measure precision
+SEMANTIC_CACHE_VERIFY_RATE = float(os.getenv("SEMANTIC_CACHE_VERIFY_RATE", "0"))
+# Similarity between the served and the regenerated result's title and tags for a hit to count as correct
+SEMANTIC_CACHE_VERIFY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_VERIFY_THRESHOLD", "0.5"))
+
+# Hashed feature space for character n-grams and words
+FEATURES = 4096
+NGRAM = 3
+
+# Per request type: (kind, free-text fields compared by similarity, fields that must match exactly)
+REQUEST_FIELDS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {
+    "LessonRequest": ("lesson", ("topic", "additionalNotes"), ("gradeLevel", "duration", "includeAssessment", "includeActivities")),
+    "AssessmentRequest": ("assessment", ("topic", "additionalInstructions"), ("gradeLevel", "numberOfQuestions", "questionTypes", "bloomsLevels")),
+    "LabRequest": ("lab", ("topic", "additionalNotes"), ("gradeLevel",)),
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+_NUMBER = re.compile(r"\d+")
+
+# Words that don't change what a lesson is about
+STOPWORDS = frozenset({
+    "a", "an", "the", "of", "to", "in", "on", "for", "about", "with",
+    "intro", "introduction", "basic", "basics", "overview", "lesson", "unit",
+})
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, and collapse whitespace"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def normalize_value(field: str, value: Any) -> str:
+    """Normalize an exact-match field so trivially different spellings agree"""
+    if isinstance(value, (list, tuple)):
+        return ",".join(sorted(normalize_text(str(item)) for item in value))
+    if field == "gradeLevel":
+        # "Grade 5", "5th grade" and "5" are the same grade
+        numbers = _NUMBER.findall(str(value))
+        return "-".join(numbers) if numbers else normalize_text(str(value))
+    if field == "duration":
+        # "45 minutes", "45 min" and "45" are the same duration
+        numbers = _NUMBER.findall(str(value))
+        unit = "h" if "hour" in str(value).lower() else "m"
+        return "-".join(numbers) + unit if numbers else normalize_text(str(value))
+    return normalize_text(str(value))
+
+
+def describe_request(request: BaseModel) -> Optional[Tuple[str, str]]:
+    """
+    Split a generation request into its exact-match partition and its free text
+
+    Args:
+        request: A LessonRequest, AssessmentRequest or LabRequest
+
+    Returns:
+        (partition key, normalized text), or None for other request types
+    """
+    fields = REQUEST_FIELDS.get(type(request).__name__)
+    if fields is None:
+        return None
+    kind, text_fields, exact_fields = fields
+    partition = "|".join([kind] + [f"{field}={normalize_value(field, getattr(request, field, None))}" for field in exact_fields])
+    text = " ".join(normalize_text(getattr(request, field, None)) for field in text_fields).strip()
+    return partition, text
+
+
+def _model_partition(partition: str, model_id: Optional[str]) -> str:
+    """Narrow a request's partition to one model's responses"""
+    return f"{partition}|model={model_id or ''}"
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Hashed counts of the words and character n-grams of normalized text"""
+    counts: Dict[int, float] = {}
+    for word in text.split():
+        if word in STOPWORDS:
+            continue
+        for feature in (f"w:{word}",) + tuple(
+            padded[i:i + NGRAM] for padded in (f" {word} ",) for i in range(max(len(padded) - NGRAM + 1, 1))
+        ):
+            index = zlib.crc32(feature.encode()) % FEATURES
+            counts[index] = counts.get(index, 0.0) + 1.0
+    return counts
+
+
+class _Entry:
+    __slots__ = ("partition", "text", "features", "response", "expires_at")
+
+    def __init__(self, partition: str, text: str, features: Dict[int, float], response: str, expires_at: float):
+        self.partition = partition
+        self.text = text
+        self.features = features
+        self.response = response
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    """
+    Serves a stored generation for a request that is nearly the same as an earlier one
+
+    Requests only match others with the same kind and exact-match fields
+    (grade level, duration, question types...), answered by the model they
+    name, so a response always comes from the model it is reported as.
+    Within that partition the
+    free text (topic and notes) is compared by cosine similarity of TF-IDF
+    weighted word and character n-gram vectors, so "Photosynthesis",
+    "photosynthesis " and "Photosynthesis basics" land together while
+    "The Rock Cycle" and "The Water Cycle" don't. Entries live in this
+    worker's memory.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl: float = SEMANTIC_CACHE_TTL
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            threshold: Similarity needed to serve a stored result
+            max_entries: Entries kept; the least recently used go first
+            ttl: Seconds an entry is served for
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise Exception("The 'numpy' package is required for SEMANTIC_CACHE_ENABLED=true. Install it with: pip install numpy")
+        self._np = numpy
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._partitions: Dict[str, List[int]] = {}
+        # Per partition: rows of raw term counts, aligned with self._partitions
+        self._matrices: Dict[str, Any] = {}
+        self._document_frequency = numpy.zeros(FEATURES, dtype=numpy.float32)
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.similarity_sum = 0.0
+        self.verified = 0
+        self.verified_correct = 0
+
+    def _vector(self, features: Dict[int, float]):
+        vector = self._np.zeros(FEATURES, dtype=self._np.float32)
+        for index, count in features.items():
+            vector[index] = count
+        return vector
+
+    def _idf(self):
+        documents = len(self._entries)
+        return self._np.log((1.0 + documents) / (1.0 + self._document_frequency)) + 1.0
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        ids = self._partitions[entry.partition]
+        row = ids.index(entry_id)
+        ids.pop(row)
+        if ids:
+            self._matrices[entry.partition] = self._np.delete(self._matrices[entry.partition], row, axis=0)
+        else:
+            del self._partitions[entry.partition]
+            del self._matrices[entry.partition]
+        for index in entry.features:
+            self._document_frequency[index] -= 1
+
+    def lookup(self, request: BaseModel) -> Optional[Tuple[str, float, bool]]:
+        """
+        Find a stored generation for a near-identical request
+
+        Args:
+            request: The generation request
+
+        Returns:
+            (stored model response, similarity, whether the normalized text
+            was identical), or None on a miss
+        """
+        described = describe_request(request)
+        if described is None:
+            return None
+        partition, text = described
+        partition = _model_partition(partition, getattr(request, "model", None))
+        self.lookups += 1
+
+        ids = self._partitions.get(partition)
+        if not ids:
+            return None
+
+        np = self._np
+        idf = self._idf()
+        query = self._vector(_features(text)) * idf
+        query_norm = float(np.linalg.norm(query))
+        matrix = self._matrices[partition] * idf
+        norms = np.linalg.norm(matrix, axis=1)
+        if query_norm == 0:
+            return None
+        similarities = (matrix @ query) / np.maximum(norms * query_norm, 1e-12)
+
+        now = time.time()
+        found = None
+        expired = []
+        for row in np.argsort(-similarities):
+            similarity = float(similarities[row])
+            if similarity < self.threshold:
+                break
+            entry = self._entries[ids[row]]
+            if entry.expires_at <= now:
+                expired.append(ids[row])
+                continue
+            self._entries.move_to_end(ids[row])
+            self.hits += 1
+            self.similarity_sum += similarity
+            if entry.text == text:
+                self.exact_hits += 1
+            found = entry.response, similarity, entry.text == text
+            break
+
+        for entry_id in expired:
+            self._remove(entry_id)
+            self.expirations += 1
+        return found
+
+    def store(self, request: BaseModel, response: str, model_id: Optional[str] = None) -> None:
+        """
+        Store the model response generated for a request
+
+        Args:
+            request: The generation request
+            response: The raw model response, once it parsed and validated
+            model_id: The model that generated it, if not the requested one
+                (a hedge or retry); only requests naming it are served it
+        """
+        described = describe_request(request)
+        if described is None:
+            return
+        partition, text = described
+        partition = _model_partition(partition, model_id or getattr(request, "model", None))
+        features = _features(text)
+        if not features:
+            return
+
+        # Replace an earlier entry for exactly the same request
+        for entry_id in list(self._partitions.get(partition, ())):
+            if self._entries[entry_id].text == text:
+                self._remove(entry_id)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(partition, text, features, response, time.time() + self.ttl)
+        for index in features:
+            self._document_frequency[index] += 1
+
+        row = self._vector(features)[None, :]
+        if partition in self._partitions:
+            self._partitions[partition].append(entry_id)
+            self._matrices[partition] = self._np.vstack([self._matrices[partition], row])
+        else:
+            self._partitions[partition] = [entry_id]
+            self._matrices[partition] = row
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    @property
+    def misses(self) -> int:
+        return self.lookups - self.hits
+
+    def similarity(self, first: str, second: str) -> float:
+        """
+        Cosine similarity of two texts, using the cache's current term weights
+
+        Args:
+            first: A text
+            second: Another text
+
+        Returns:
+            Similarity between 0 and 1
+        """
+        idf = self._idf()
+        a = self._vector(_features(normalize_text(first))) * idf
+        b = self._vector(_features(normalize_text(second))) * idf
+        norm = float(self._np.linalg.norm(a) * self._np.linalg.norm(b))
+        return float(a @ b) / norm if norm else 0.0
+
+    def record_verification(self, served: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+        """
+        Judge a near-duplicate hit against a freshly generated result
+
+        The hit counts as correct if the two results' titles and tags are
+        similar, i.e. the model would have written about the same thing.
+
+        Args:
+            served: The parsed result that was served from the cache
+            fresh: The parsed result generated for the request itself
+
+        Returns:
+            Whether the hit was correct
+        """
+        def summary(result: Dict[str, Any]) -> str:
+            return " ".join([str(result.get("title", ""))] + [str(tag) for tag in result.get("tags") or []])
+
+        correct = self.similarity(summary(served), summary(fresh)) >= SEMANTIC_CACHE_VERIFY_THRESHOLD
+        self.verified += 1
+        self.verified_correct += int(correct)
+        return correct
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get semantic cache statistics
+
+        Returns:
+            Dictionary with size, hit rate, mean hit similarity and verified precision
+        """
+        return {
+            "entries": len(self._entries),
+            "partitions": len(self._partitions),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "near_hits": self.hits - self.exact_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "mean_similarity": round(self.similarity_sum / self.hits, 4) if self.hits else None,
+            "verified": self.verified,
+            # None until a hit has been verified (SEMANTIC_CACHE_VERIFY_RATE > 0)
+            "precision": self.verified_correct / self.verified if self.verified else None,
+        }
+
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """
+    Create the semantic cache if it is enabled
+
+    Returns:
+        The cache, or None when SEMANTIC_CACHE_ENABLED is off
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticCache()
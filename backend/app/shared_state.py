@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable, Tuple, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.shared_state")
+
+# Shared state configuration
+STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite").lower()
+STATE_PATH = os.getenv(
+    "SHARED_STATE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "state.sqlite3")
+)
+STATE_REDIS_URL = os.getenv("SHARED_STATE_REDIS_URL", "redis://localhost:6379/0")
+
+# An update function receives the current value (or None) and returns
+# (new value or None to delete, result to hand back to the caller)
+UpdateFunction = Callable[[Optional[Dict[str, Any]]], Tuple[Optional[Dict[str, Any]], Any]]
+
+
+class StateStore:
+    """
+    Interface for counters and limiter state shared between worker processes
+
+    Values are small JSON-serializable dicts. update() is an atomic
+    read-modify-write, so workers never lose each other's increments.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a value
+
+        Args:
+            key: The state key
+
+        Returns:
+            The value, or None if missing or expired
+        """
+        raise NotImplementedError
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None) -> Any:
+        """
+        Atomically read, modify and write a value
+
+        Args:
+            key: The state key
+            fn: Receives the current value and returns (new value, result)
+            ttl: Optional time to live in seconds for the new value
+
+        Returns:
+            The result returned by fn
+        """
+        raise NotImplementedError
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """
+        List keys with a prefix
+
+        Args:
+            prefix: The key prefix
+
+        Returns:
+            Matching keys
+        """
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """State kept in this process only (one worker, or tests)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Dict[str, Any], float]] = {}  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._values.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            value, result = fn(self.get(key))
+            if value is None:
+                self._values.pop(key, None)
+            else:
+                self._values[key] = (value, time.time() + ttl if ttl else float("inf"))
+            return result
+
+    def keys(self, prefix: str = "") -> List[str]:
+        now = time.time()
+        return [key for key, entry in self._values.items() if key.startswith(prefix) and entry[1] > now]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    State shared by every worker on the host through a SQLite file
+
+    Updates run in a BEGIN IMMEDIATE transaction, which takes the database
+    write lock, so read-modify-write cycles from different workers are
+    serialized. With WAL mode an update takes tens of microseconds.
+    """
+
+    name = "sqlite"
+
+    # Delete expired rows once every this many updates
+    CLEANUP_INTERVAL = 1000
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._updates = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database lazily, once per process (connections can't cross a fork)"""
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None) -> Any:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+            current = None
+            if row is not None and (row[1] is None or row[1] > now):
+                current = json.loads(row[0])
+
+            value, result = fn(current)
+            if value is None:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                    (key, json.dumps(value), now + ttl if ttl else None)
+                )
+
+            self._updates += 1
+            if self._updates % self.CLEANUP_INTERVAL == 0:
+                conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def keys(self, prefix: str = "") -> List[str]:
+        rows = self._connection().execute(
+            "SELECT key FROM state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "￿", time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class KeyValueClient:
+    """
+    Minimal client protocol for a network key-value store
+
+    Any store offering get, an atomic compare-and-set and a prefix scan can
+    back NetworkStateStore (Redis, memcached with CAS, etcd, ...).
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def compare_and_set(self, key: str, expected: Optional[str], value: Optional[str], ttl: Optional[float]) -> bool:
+        """Set (or delete, if value is None) only if the current value equals expected"""
+        raise NotImplementedError
+
+    def scan(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+
+class FakeKeyValueClient(KeyValueClient):
+    """In-process stand-in for a network key-value store, for tests"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def compare_and_set(self, key: str, expected: Optional[str], value: Optional[str], ttl: Optional[float]) -> bool:
+        with self._lock:
+            if self.get(key) != expected:
+                return False
+            if value is None:
+                self._values.pop(key, None)
+            else:
+                self._values[key] = (value, time.time() + ttl if ttl else float("inf"))
+            return True
+
+    def scan(self, prefix: str) -> List[str]:
+        return [key for key in list(self._values) if key.startswith(prefix) and self.get(key) is not None]
+
+
+class RedisKeyValueClient(KeyValueClient):
+    """KeyValueClient for Redis, using a Lua script for compare-and-set"""
+
+    _CAS_SCRIPT = """
+        local current = redis.call('GET', KEYS[1])
+        if (current == false and ARGV[1] == '') or current == ARGV[1] then
+            if ARGV[2] == '' then
+                redis.call('DEL', KEYS[1])
+            elseif tonumber(ARGV[3]) > 0 then
+                redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+            else
+                redis.call('SET', KEYS[1], ARGV[2])
+            end
+            return 1
+        end
+        return 0
+    """
+
+    def __init__(self, url: str = STATE_REDIS_URL):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("The 'redis' package is required for SHARED_STATE_BACKEND=redis. Install it with: pip install redis")
+        # Short timeouts: this sits on the request hot path
+        self._client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=0.25, socket_connect_timeout=0.5)
+        self._cas = self._client.register_script(self._CAS_SCRIPT)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def compare_and_set(self, key: str, expected: Optional[str], value: Optional[str], ttl: Optional[float]) -> bool:
+        ttl_ms = int(ttl * 1000) if ttl else 0
+        return bool(self._cas(keys=[key], args=[expected or "", value or "", ttl_ms]))
+
+    def scan(self, prefix: str) -> List[str]:
+        return list(self._client.scan_iter(match=prefix + "*"))
+
+
+class NetworkStateStore(StateStore):
+    """
+    State shared across hosts through a network key-value store
+
+    Updates use optimistic concurrency: read, compute, then compare-and-set,
+    retrying if another worker changed the value in between.
+    """
+
+    name = "network"
+
+    MAX_RETRIES = 20
+
+    def __init__(self, client: KeyValueClient, prefix: str = "edugenie:state:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def update(self, key: str, fn: UpdateFunction, ttl: Optional[float] = None) -> Any:
+        full_key = self.prefix + key
+        for _ in range(self.MAX_RETRIES):
+            raw = self.client.get(full_key)
+            value, result = fn(json.loads(raw) if raw is not None else None)
+            new_raw = json.dumps(value) if value is not None else None
+            if self.client.compare_and_set(full_key, raw, new_raw, ttl):
+                return result
+        raise Exception(f"Could not update shared state for {key}: too much contention")
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return [key[len(self.prefix):] for key in self.client.scan(self.prefix + prefix)]
+
+
+def create_state_store(backend: str = STATE_BACKEND) -> StateStore:
+    """
+    Create the configured shared state store
+
+    Args:
+        backend: "memory", "sqlite", "redis" or "fake" (in-process network store)
+
+    Returns:
+        A StateStore instance
+    """
+    backend = backend.lower()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "redis":
+        return NetworkStateStore(RedisKeyValueClient())
+    if backend == "fake":
+        return NetworkStateStore(FakeKeyValueClient())
+    if backend != "memory":
+        logger.warning(f"Unknown shared state backend '{backend}', using in-process state")
+    return MemoryStateStore()
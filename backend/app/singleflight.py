@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+logger = logging.getLogger("edugenie.singleflight")
+
+
+class _Call:
+    """An in-flight call and the number of callers waiting on it"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution
+
+    The first caller for a key (the leader) starts the work in its own task;
+    callers arriving while it runs (followers) wait on the same task and
+    share its result or exception. A caller that is cancelled or times out
+    stops waiting without affecting the others, and the work itself is only
+    cancelled once nobody is waiting for it any more.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.shared_errors = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn for this key, or join the call already in flight
+
+        Args:
+            key: Identifies identical calls
+            fn: Coroutine function doing the work
+            timeout: How long this caller will wait, in seconds (None to wait indefinitely)
+
+        Returns:
+            The result of fn
+        """
+        call = self._calls.get(key)
+        is_leader = call is None
+
+        if is_leader:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        call.waiters += 1
+        try:
+            if timeout:
+                return await asyncio.wait_for(asyncio.shield(call.task), timeout)
+            return await asyncio.shield(call.task)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            if not is_leader:
+                self.shared_errors += 1
+            raise
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting for this result any more
+                logger.info(f"Cancelling abandoned in-flight call for key {key[:16]}")
+                call.task.cancel()
+                self.abandoned += 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing statistics
+
+        Returns:
+            Dictionary with leader/follower counts and upstream calls saved
+        """
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "waiting": sum(call.waiters for call in self._calls.values()),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "upstream_calls_saved": self.followers,
+            "saved_ratio": self.followers / total if total else 0.0,
+            "shared_errors": self.shared_errors,
+            "cancelled_waiters": self.cancelled,
+            "timed_out_waiters": self.timeouts,
+            "abandoned_calls": self.abandoned,
+        }
@@ -0,0 +1,481 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from typing import Dict, Any, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("edugenie.tracing")
+
+# Tracing configuration
+# Fraction of requests traced; 0 turns tracing off (request ids are still assigned)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# "jsonl" appends one span per line to TRACE_JSONL_PATH; "otlp" posts OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl").lower()
+TRACE_JSONL_PATH = os.getenv(
+    "TRACE_JSONL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "traces.jsonl")
+)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "edugenie-api")
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+# Follow a caller's traceparent sampled flag even with TRACE_SAMPLE_RATE=0; only for trusted callers,
+# since any client can send one
+TRACE_TRUST_TRACEPARENT = os.getenv("TRACE_TRUST_TRACEPARENT", "False").lower() in ("true", "1", "t", "yes")
+# Send X-Request-ID and traceparent on calls to OpenRouter, a third party
+TRACE_PROPAGATE_UPSTREAM = os.getenv("TRACE_PROPAGATE_UPSTREAM", "False").lower() in ("true", "1", "t", "yes")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+TRACEPARENT_HEADER = "traceparent"
+# Incoming request ids are echoed into logs and headers, so only accept tame ones
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    """Stands in for a span when the request isn't sampled"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed stage of a request
+
+    Used as a context manager: entering makes it the parent of spans started
+    inside it (including in tasks created inside it), and exiting records
+    its duration and any exception, then hands it to the exporter.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "attributes",
+                 "start_ns", "end_ns", "_started", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any], kind: str = "internal"):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self._started = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _exporter.submit(self)
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns / 1e9,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def span(name: str, **attributes: Any):
+    """
+    Start a span under the current one
+
+    Outside a sampled trace this returns a shared no-op span, so
+    instrumentation costs one context variable lookup when tracing is off.
+
+    Args:
+        name: The stage, e.g. "upstream_call"
+        **attributes: Attributes to record on the span
+
+    Returns:
+        A context manager yielding the span
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def record_span(name: str, start_ns: int, error: Optional[str] = None, **attributes: Any) -> None:
+    """
+    Record a stage that has already finished as a span under the current one
+
+    For stages that can't be wrapped in a with block, such as a stream
+    consumed across yields.
+
+    Args:
+        name: The stage
+        start_ns: When it started, from time.time_ns()
+        error: The error it ended with, if any
+        **attributes: Attributes to record on the span
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    finished = Span(name, parent.trace_id, parent.span_id, attributes)
+    finished.start_ns = start_ns
+    finished.end_ns = time.time_ns()
+    finished.error = error
+    _exporter.submit(finished)
+
+
+def current_span():
+    """Get the innermost active span (a no-op span if none)"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def get_request_id() -> Optional[str]:
+    """Get the id of the request being handled, if any"""
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """
+    Set the request id for the current context
+
+    Args:
+        request_id: The id sent by the client, if any and well formed
+
+    Returns:
+        The id in use; a new one if none was given
+    """
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, kind: str = "server", **attributes: Any):
+    """
+    Start the root span of a trace, if this trace is sampled
+
+    A W3C traceparent header from the caller continues the caller's trace.
+    While tracing is on (TRACE_SAMPLE_RATE > 0), or with
+    TRACE_TRUST_TRACEPARENT, it also follows the caller's sampling decision;
+    otherwise TRACE_SAMPLE_RATE decides, so clients can't turn tracing on.
+
+    Args:
+        name: The root span name
+        traceparent: The caller's traceparent header, if any
+        kind: "server" for requests, "internal" for background work
+        **attributes: Attributes to record on the span
+
+    Returns:
+        A context manager yielding the root span (a no-op span if not sampled)
+    """
+    match = TRACEPARENT_PATTERN.match(traceparent) if traceparent else None
+    trace_id, parent_id, flags = match.groups() if match else (None, None, None)
+    if flags is not None and (TRACE_SAMPLE_RATE > 0 or TRACE_TRUST_TRACEPARENT):
+        sampled = int(flags, 16) & 1
+    else:
+        sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return NOOP_SPAN
+    request_id = _request_id.get()
+    if request_id:
+        attributes["request.id"] = request_id
+    return Span(name, trace_id or os.urandom(16).hex(), parent_id, attributes, kind=kind)
+
+
+def propagation_headers() -> Dict[str, str]:
+    """
+    Get headers carrying the request id and trace to an outgoing call
+
+    Returns:
+        X-Request-ID, plus traceparent inside a sampled trace
+    """
+    headers = {}
+    request_id = _request_id.get()
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
+    parent = _current_span.get()
+    if parent is not None:
+        headers[TRACEPARENT_HEADER] = f"00-{parent.trace_id}-{parent.span_id}-01"
+    return headers
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class SpanExporter:
+    """Interface for writing finished spans somewhere"""
+
+    name = "base"
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+
+class JSONLExporter(SpanExporter):
+    """Appends one JSON object per span to a file shared by every worker"""
+
+    name = "jsonl"
+
+    def __init__(self, path: str = TRACE_JSONL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        # One O_APPEND write per batch keeps lines from different workers whole
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode())
+        finally:
+            os.close(fd)
+
+
+class OTLPExporter(SpanExporter):
+    """Posts spans to an OpenTelemetry collector using OTLP/HTTP with JSON encoding"""
+
+    name = "otlp"
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, service_name: str = TRACE_SERVICE_NAME):
+        self.endpoint = endpoint
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self.client = httpx.Client(timeout=10)
+
+    def export(self, spans: List[Span]) -> None:
+        body = {"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{
+                "scope": {"name": "edugenie"},
+                "spans": [self._span(span) for span in spans],
+            }],
+        }]}
+        self.client.post(self.endpoint, json=body).raise_for_status()
+
+    @staticmethod
+    def _span(span: Span) -> Dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            # SPAN_KIND_INTERNAL = 1, SPAN_KIND_SERVER = 2
+            "kind": 2 if span.kind == "server" else 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in span.attributes.items()],
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+
+def create_exporter(name: str = TRACE_EXPORTER) -> SpanExporter:
+    """
+    Create the configured span exporter
+
+    Args:
+        name: "jsonl" or "otlp"
+
+    Returns:
+        The exporter
+    """
+    if name == "otlp":
+        return OTLPExporter()
+    if name != "jsonl":
+        logger.warning(f"Unknown trace exporter '{name}', using jsonl")
+    return JSONLExporter()
+
+
+class ExportQueue:
+    """
+    Hands finished spans to the exporter on a background thread
+
+    Requests only pay for putting the span on a queue. The thread starts on
+    the first span, in whichever worker process records it.
+    """
+
+    def __init__(self, interval: float = TRACE_EXPORT_INTERVAL, max_batch: int = 512):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.exporter: Optional[SpanExporter] = None
+        self.exported = 0
+        self.failed = 0
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(span)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.exporter is None:
+                self.exporter = create_exporter()
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"Could not export {len(batch)} spans: {str(e)}")
+
+    def flush(self) -> None:
+        """Export the queued spans and stop the thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._pid = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "exporter": self.exporter.name if self.exporter else TRACE_EXPORTER,
+            "exported": self.exported,
+            "failed": self.failed,
+        }
+
+
+_exporter = ExportQueue()
+
+
+def get_tracing_stats() -> Dict[str, Any]:
+    """
+    Get tracing statistics for this worker
+
+    Returns:
+        Dictionary with the sample rate, exporter and span counters
+    """
+    return _exporter.stats()
+
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    record = _default_record_factory(*args, **kwargs)
+    record.request_id = _request_id.get() or "-"
+    return record
+
+
+# Every log record carries the request id, for %(request_id)s in log formats
+logging.setLogRecordFactory(_record_factory)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware giving each request an id and, if sampled, a root span
+
+    The id comes from the X-Request-ID header when the client sends a
+    sensible one, and is returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = set_request_id((headers.get(b"x-request-id") or b"").decode("latin-1"))
+        traceparent = (headers.get(b"traceparent") or b"").decode("latin-1") or None
+        encoded_id = request_id.encode()
+
+        with start_trace(scope["method"], traceparent, **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+            async def send_with_request_id(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", encoded_id)]
+                    root.set_attribute("http.status_code", message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route and root is not NOOP_SPAN:
+                    root.name = f"{scope['method']} {route}"
+                    root.set_attribute("http.route", route)
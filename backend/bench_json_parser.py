@@ -0,0 +1,116 @@
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Any, Callable, List
+
+from app.json_stream import StreamingJSONParser, parse_json_object
+from app.openrouter import sanitize_and_parse_json
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Benchmark AI-response JSON parsing")
+parser.add_argument("files", nargs="*", default=["rag_test_result.json"],
+                    help="JSON model outputs to build the corpus from (default: rag_test_result.json)")
+parser.add_argument("--repeat", type=int, default=200, help="Iterations per case (default: 200)")
+parser.add_argument("--chunk-size", type=int, default=16, help="Chunk size for the streaming run (default: 16)")
+args = parser.parse_args()
+
+
+def legacy_sanitize_and_parse_json(json_string: str) -> Dict[str, Any]:
+    """The regex-based implementation sanitize_and_parse_json used before the streaming parser"""
+    try:
+        return json.loads(json_string)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\{[\s\S]*\}', json_string)
+        if json_match:
+            try:
+                return json.loads(json_match.group(0))
+            except json.JSONDecodeError:
+                cleaned_json = re.sub(r'```(json|javascript)?\n?|\n?```', '', json_string).strip()
+                try:
+                    return json.loads(cleaned_json)
+                except json.JSONDecodeError:
+                    raise ValueError("Could not parse JSON from response")
+        raise ValueError("Could not extract valid JSON from response")
+
+
+def streaming_parse(text: str) -> Dict[str, Any]:
+    """Feed the text in chunks, as the SSE endpoints do"""
+    stream_parser = StreamingJSONParser()
+    for i in range(0, len(text), args.chunk_size):
+        stream_parser.feed(text[i:i + args.chunk_size])
+    return stream_parser.close()
+
+
+def build_corpus(text: str) -> Dict[str, str]:
+    """Build variants of a model output with the defects models commonly produce"""
+    data = json.loads(text)
+    pretty = json.dumps(data, indent=2, ensure_ascii=False)
+    # A 12k-token style response: the same lesson with a long plan
+    large = dict(data, plan=" ".join([str(data.get("plan", ""))] * 20))
+    large_text = json.dumps(large, indent=2, ensure_ascii=False)
+
+    return {
+        "clean": pretty,
+        "clean_large": large_text,
+        "prose_and_fence": f"Here is your lesson plan:\n\n```json\n{pretty}\n```\n\nLet me know if you need changes!",
+        "trailing_commas": re.sub(r'("|\]|\})(\n\s*)(\]|\})', r'\1,\2\3', pretty),
+        "truncated": pretty[: int(len(pretty) * 0.8)],
+        "truncated_large": large_text[: int(len(large_text) * 0.9)],
+        # Prose full of braces with no closing brace: worst case for the greedy regex
+        "pathological": "Note: {" * 2000 + " the model stopped here",
+    }
+
+
+def run_case(func: Callable[[str], Any], text: str, repeat: int) -> Dict[str, Any]:
+    """Time a parser on one input"""
+    try:
+        result = func(text)
+        ok = isinstance(result, dict) and bool(result)
+    except ValueError:
+        ok = False
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            func(text)
+        except ValueError:
+            pass
+    elapsed = (time.perf_counter() - start) / repeat
+
+    return {"ok": ok, "ms": elapsed * 1000}
+
+
+def main() -> None:
+    parsers = {
+        "legacy": legacy_sanitize_and_parse_json,
+        "sanitize": sanitize_and_parse_json,
+        "single_pass": parse_json_object,
+        "streaming": streaming_parse,
+    }
+
+    rows: List[Dict[str, Any]] = []
+    for path in args.files:
+        with open(path) as f:
+            corpus = build_corpus(f.read())
+        for case, text in corpus.items():
+            row = {"file": path, "case": case, "chars": len(text)}
+            for name, func in parsers.items():
+                # The pathological case is quadratic for the legacy parser, so keep it short
+                repeat = max(1, args.repeat // 50) if case == "pathological" else args.repeat
+                row[name] = run_case(func, text, repeat)
+            rows.append(row)
+
+    header = f"{'case':<18}{'chars':>8}" + "".join(f"{name:>22}" for name in parsers)
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        cells = "".join(
+            f"{row[name]['ms']:>12.3f} ms {'ok' if row[name]['ok'] else 'FAIL':>6}" for name in parsers
+        )
+        print(f"{row['case']:<18}{row['chars']:>8}{cells}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import sys
+import time
+import copy
+import random
+import logging
+import argparse
+import contextlib
+from typing import Dict, Any, Callable, List
+
+from app.models import AssessmentRequest
+from app.generation import build_assessment_result
+from app.logging_config import configure_logging, flush_logging, JSONFormatter
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Benchmark event-loop time spent logging assessment generation")
+parser.add_argument("--questions", type=int, default=200, help="Questions per assessment (default: 200)")
+parser.add_argument("--repeat", type=int, default=200, help="Assessments per case (default: 200)")
+parser.add_argument("--sink-delay", type=float, default=20.0,
+                    help="Microseconds each write to the log output takes, e.g. a pipe to a log shipper (default: 20)")
+args = parser.parse_args()
+
+
+class SlowSink:
+    """A log output where every write blocks for a while, like a busy pipe (releasing the GIL, as real I/O does)"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def make_assessment(count: int) -> Dict[str, Any]:
+    """A parsed model response with the answer mistakes build_assessment_result fixes"""
+    rng = random.Random(7)
+    questions = []
+    for number in range(count):
+        options = [f"Option {letter} for question {number}" for letter in "ABCD"]
+        answer = rng.choice([rng.choice(options), rng.choice("ABCD"), "(B)", None, "Not an option"])
+        questions.append({"text": f"Question {number}?", "type": "multiple-choice", "options": options, "answer": answer})
+    return {"title": "Benchmark Assessment", "gradeLevel": "6-8", "instructions": "Answer all.", "questions": questions, "tags": []}
+
+
+def legacy_build_assessment_result(parsed_response: Dict[str, Any], request: AssessmentRequest):
+    """build_assessment_result as it was, printing every question and fix to stdout"""
+    questions = parsed_response.get("questions", [])
+    print(f"Assessment generated with {len(questions)} questions")
+    for i, question in enumerate(questions):
+        answer = question.get("answer")
+        print(f"Question {i+1} ({question.get('type')}): Answer present: {answer is not None}, Answer: {answer}")
+    for question in questions:
+        if not question.get("answer"):
+            question["answer"] = question["options"][0]
+            print(f"Setting default answer for multiple-choice: {question['answer']}")
+        elif len(question["answer"]) == 1:
+            question["answer"] = question["options"][ord(question["answer"]) - ord("A")]
+            print(f"Converting letter answer to full text: '{question['answer']}'")
+        elif question["answer"] not in question["options"]:
+            print(f"Answer '{question['answer']}' not found in options, setting to first option")
+            question["answer"] = question["options"][0]
+    return build_assessment_result(parsed_response, request)
+
+
+def use_sync_handler(sink: SlowSink, level: int) -> None:
+    """Log straight to the output on the calling thread, as logging.basicConfig does"""
+    flush_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JSONFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def run_case(build: Callable, parsed: Dict[str, Any], request: AssessmentRequest, repeat: int) -> Dict[str, float]:
+    """Time build on fresh copies of the assessment; the time is all spent on the event loop thread"""
+    times: List[float] = []
+    for _ in range(repeat):
+        response = copy.deepcopy(parsed)
+        start = time.perf_counter()
+        build(response, request)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"mean_ms": sum(times) / len(times) * 1000, "p99_ms": times[int(len(times) * 0.99) - 1] * 1000}
+
+
+def main() -> None:
+    request = AssessmentRequest(
+        topic="Benchmarking", gradeLevel="6-8", numberOfQuestions=args.questions,
+        questionTypes=["multiple-choice"], bloomsLevels=["Application"], model="benchmark"
+    )
+    parsed = make_assessment(args.questions)
+    sink = SlowSink(args.sink_delay / 1e6)
+
+    def run_print(response, request):
+        with contextlib.redirect_stdout(sink):
+            return legacy_build_assessment_result(response, request)
+
+    cases = {}
+
+    # Before: print() per question and per fix, straight to the output
+    use_sync_handler(sink, logging.INFO)
+    cases["print (before)"] = run_case(run_print, parsed, request, args.repeat)
+
+    # Per-question detail written synchronously on the event loop
+    use_sync_handler(sink, logging.DEBUG)
+    cases["sync handler, DEBUG"] = run_case(build_assessment_result, parsed, request, args.repeat)
+
+    # Per-question detail handed to the listener thread
+    configure_logging("DEBUG", "json", stream=sink)
+    cases["queue handler, DEBUG"] = run_case(build_assessment_result, parsed, request, args.repeat)
+
+    # Production default: one summary line per assessment, detail gated off
+    configure_logging("INFO", "json", stream=sink)
+    cases["queue handler, INFO"] = run_case(build_assessment_result, parsed, request, args.repeat)
+    flush_logging()
+
+    print(f"{args.questions} questions per assessment, {args.sink_delay:.0f} µs per write, {args.repeat} runs")
+    header = f"{'case':<24}{'mean':>12}{'p99':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, result in cases.items():
+        print(f"{name:<24}{result['mean_ms']:>9.3f} ms{result['p99_ms']:>9.3f} ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
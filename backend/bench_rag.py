@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from typing import List, Tuple
+
+from app.rag import build_index, RAGIndex, RAG_DIMENSIONS, RAG_CHUNK_WORDS
+from app.model_stats import percentile
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Benchmark building and searching the retrieval index")
+parser.add_argument("--chunks", type=int, default=100000, help="Chunks to index (default: 100000)")
+parser.add_argument("--chunk-words", type=int, default=RAG_CHUNK_WORDS, help=f"Words per chunk (default: {RAG_CHUNK_WORDS})")
+parser.add_argument("--dimensions", type=int, default=RAG_DIMENSIONS, help=f"Vector size (default: {RAG_DIMENSIONS})")
+parser.add_argument("--batch-sizes", default="1,8,32,128", help="Queries searched together (default: 1,8,32,128)")
+parser.add_argument("--k", type=int, default=4, help="Chunks returned per query (default: 4)")
+parser.add_argument("--queries", type=int, default=256, help="Queries per batch size (default: 256)")
+parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+args = parser.parse_args()
+
+
+def make_corpus(rng: random.Random, chunks: int, words_per_chunk: int) -> Tuple[List[str], List[str]]:
+    """
+    Synthesize curriculum-like chunks: Zipf-distributed common words plus a few topic words per chunk
+
+    Returns:
+        The chunks and, per chunk, a short query made of its topic words
+    """
+    vocabulary = [f"w{i}" for i in range(20000)]
+    cumulative, total = [], 0.0
+    for rank in range(len(vocabulary)):
+        total += 1.0 / (rank + 1)
+        cumulative.append(total)
+    topics = [f"topic{i}" for i in range(50000)]
+    texts, queries = [], []
+    for _ in range(chunks):
+        topic_words = rng.sample(topics, 3)
+        words = rng.choices(vocabulary, cum_weights=cumulative, k=words_per_chunk - 9) + topic_words * 3
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        queries.append(" ".join(topic_words[:2]))
+    return texts, queries
+
+
+def main() -> None:
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    texts, queries = make_corpus(rng, args.chunks, args.chunk_words)
+    print(f"Generated {args.chunks} chunks of {args.chunk_words} words in {time.perf_counter() - started:.1f}s")
+
+    directory = tempfile.mkdtemp(prefix="bench-rag-")
+    path = os.path.join(directory, "index")
+    try:
+        meta = build_index(((f"doc{i // 20}.md", text) for i, text in enumerate(texts)), path, args.dimensions)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"Built the index in {meta['build_seconds']:.1f}s "
+              f"({args.chunks / meta['build_seconds']:.0f} chunks/s, {size / 1e6:.0f} MB on disk)")
+
+        started = time.perf_counter()
+        index = RAGIndex(path)
+        print(f"Opened it in {(time.perf_counter() - started) * 1000:.1f} ms (memory-mapped)")
+        index.search(["warm up"], args.k)
+
+        header = f"{'batch':>6}{'per batch p50':>15}{'p99':>10}{'per query':>12}{'queries/s':>11}{'recall@k':>10}"
+        print(header)
+        print("-" * len(header))
+        for batch_size in (int(value) for value in args.batch_sizes.split(",")):
+            picks = [rng.randrange(args.chunks) for _ in range(max(args.queries, batch_size))]
+            times, found = [], 0
+            for start in range(0, len(picks) - batch_size + 1, batch_size):
+                batch = picks[start:start + batch_size]
+                began = time.perf_counter()
+                results = index.search([queries[i] for i in batch], args.k)
+                times.append(time.perf_counter() - began)
+                found += sum(1 for i, hits in zip(batch, results) if any(index_ == i for index_, _ in hits))
+            searched = len(times) * batch_size
+            times.sort()
+            total = sum(times)
+            print(f"{batch_size:>6}{percentile(times, 50) * 1000:>12.2f} ms{percentile(times, 99) * 1000:>7.2f} ms"
+                  f"{total / searched * 1000:>9.3f} ms{searched / total:>11.0f}{found / searched:>10.0%}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
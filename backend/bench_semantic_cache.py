@@ -0,0 +1,78 @@
+import sys
+import argparse
+from typing import List, Tuple
+
+from app.models import LessonRequest
+from app.semantic_cache import SemanticCache
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Measure semantic cache precision and hit rate on labelled topic pairs")
+parser.add_argument("--thresholds", default="0.6,0.7,0.75,0.8,0.85,0.9",
+                    help="Comma-separated similarity thresholds to try (default: 0.6,0.7,0.75,0.8,0.85,0.9)")
+args = parser.parse_args()
+
+# Lessons already generated
+STORED = [
+    "Photosynthesis", "The Water Cycle", "Fractions", "Plate Tectonics", "The French Revolution",
+    "Cell Division", "Newton's Laws", "Poetry Analysis", "Ecosystems", "The Solar System",
+    "The Rock Cycle", "Multiplying Fractions", "The American Revolution", "Photosynthesis and Respiration",
+    "Cell Structure", "Chemical Reactions", "World War II", "Persuasive Writing",
+]
+
+# (new request's topic, the stored topic that may be served for it or None)
+QUERIES: List[Tuple[str, object]] = [
+    ("photosynthesis", "Photosynthesis"),
+    ("Photosynthesis basics", "Photosynthesis"),
+    ("Intro to Photosynthesis", "Photosynthesis"),
+    ("Water cycle", "The Water Cycle"),
+    ("the water-cycle", "The Water Cycle"),
+    ("Rock cycle", "The Rock Cycle"),
+    ("Fractions basics", "Fractions"),
+    ("Ecosystem", "Ecosystems"),
+    ("Newton's laws", "Newton's Laws"),
+    ("Cell division (mitosis)", "Cell Division"),
+    ("Chemical reaction", "Chemical Reactions"),
+    ("WWII", "World War II"),
+    ("Introduction to Persuasive Writing", "Persuasive Writing"),
+    ("Adding fractions", None),
+    ("Dividing Fractions", None),
+    ("The Russian Revolution", None),
+    ("Cells", None),
+    ("Solar system planets", None),
+    ("Volcanoes", None),
+    ("Respiration", None),
+    ("Nuclear Reactions", None),
+    ("World War I", None),
+    ("Narrative Writing", None),
+    ("The Nitrogen Cycle", None),
+]
+
+
+def lesson(topic: str) -> LessonRequest:
+    return LessonRequest(topic=topic, gradeLevel="5", duration="45 minutes", model="benchmark")
+
+
+def main() -> None:
+    print(f"{len(STORED)} stored lessons, {len(QUERIES)} labelled requests "
+          f"({sum(1 for _, expected in QUERIES if expected)} should hit)")
+    header = f"{'threshold':>10}{'hit rate':>10}{'precision':>11}{'recall':>8}"
+    print(header)
+    print("-" * len(header))
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        cache = SemanticCache(threshold=threshold)
+        for topic in STORED:
+            cache.store(lesson(topic), topic)
+
+        hits = correct = 0
+        for topic, expected in QUERIES:
+            hit = cache.lookup(lesson(topic))
+            if hit is not None:
+                hits += 1
+                correct += int(hit[0] == expected)
+        should_hit = sum(1 for _, expected in QUERIES if expected)
+        precision = correct / hits if hits else 1.0
+        print(f"{threshold:>10.2f}{hits / len(QUERIES):>10.0%}{precision:>11.0%}{correct / should_hit:>8.0%}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+A local stand-in for the OpenRouter chat completions API
+
+Answers lesson, assessment, lab and teaching tip prompts with plausible JSON
+after a configurable latency, so the backend can be load tested without
+spending quota. It can also answer with 429s (with OpenRouter's rate limit
+headers), server errors and malformed JSON. Answers longer than max_tokens
+are cut short with finish_reason "length".
+
+Point the backend at it with:
+    OPENROUTER_API_URL=http://localhost:9100/api/v1/chat/completions OPENROUTER_API_KEY=fake
+"""
+
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def parse_latency(spec: str):
+    """
+    Parse a latency distribution into a function returning seconds
+
+    Accepts "fixed:S", "uniform:LOW,HIGH", "exp:MEAN", or "lognormal:MEDIAN,SIGMA"
+    (long-tailed, like real models: most calls near the median, a few much slower).
+
+    Args:
+        spec: The distribution spec
+
+    Returns:
+        Function taking a random.Random and returning a latency in seconds
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def topic_of(prompt: str) -> str:
+    match = re.search(r'about "([^"]*)"', prompt)
+    return match.group(1) if match else "General Studies"
+
+
+def grade_of(prompt: str) -> str:
+    match = re.search(r'grade level "([^"]*)"', prompt)
+    return match.group(1) if match else "6-8"
+
+
+def fake_content(prompt: str, max_tokens: int, rng: random.Random) -> str:
+    """Build a plausible model answer for one of the backend's prompts"""
+    topic = topic_of(prompt)
+    grade = grade_of(prompt)
+    tags = [word.lower() for word in topic.split()[:3]] + ["science", f"grade {grade}"]
+
+    if max_tokens <= 300 and "teaching tip" in prompt:
+        return f"Start each {topic or 'class'} lesson with a short retrieval quiz so students connect new ideas to what they already know."
+
+    # Match each template's opening words: a lesson prompt mentions assessments too
+    if "lesson plan about" in prompt:
+        return fake_lesson(topic, grade, tags)
+
+    if "virtual lab about" in prompt:
+        return json.dumps({
+            "title": f"Investigating {topic}",
+            "description": f"A hands-on virtual investigation of {topic}.",
+            "category": "biology",
+            "gradeLevel": grade,
+            "objectives": [f"Observe {topic} in a controlled setting", "Record and interpret measurements"],
+            "steps": [
+                {"title": f"Step {step}", "description": f"Carry out part {step} of the {topic} investigation and note what you see."}
+                for step in range(1, 6)
+            ],
+            "questions": [
+                {"text": f"What changed during step {step}?", "hint": "Compare with your prediction."}
+                for step in range(1, 4)
+            ],
+            "tags": tags,
+        }, indent=2)
+
+    if "assessment about" in prompt:
+        match = re.search(r"with (\d+) questions", prompt)
+        count = int(match.group(1)) if match else 5
+        return json.dumps({
+            "title": f"{topic} Assessment",
+            "gradeLevel": grade,
+            "instructions": "Answer every question. Show your reasoning where asked.",
+            "questions": [
+                {
+                    "text": f"Question {number} about {topic}?",
+                    "type": "multiple-choice",
+                    "options": [f"Option {letter}" for letter in "ABCD"],
+                    "answer": f"Option {rng.choice('ABCD')}",
+                    "bloomsLevel": "Application",
+                }
+                for number in range(1, count + 1)
+            ],
+            "tags": tags,
+        }, indent=2)
+
+    return fake_lesson(topic, grade, tags)
+
+
+def fake_lesson(topic: str, grade: str, tags: list) -> str:
+    paragraph = f"Students explore {topic} through discussion, guided practice and reflection. " * 6
+    return json.dumps({
+        "title": f"Exploring {topic}",
+        "gradeLevel": grade,
+        "subject": "Science",
+        "duration": "45 minutes",
+        "overview": paragraph,
+        "objectives": [f"Explain the key ideas of {topic}", f"Apply {topic} to a real-world example"],
+        "materials": ["Whiteboard", "Worksheets", "Projector"],
+        "plan": "Introduction (10 min). " + paragraph + " Practice (20 min). Closure (5 min).",
+        "assessment": "Exit ticket with three short questions.",
+        "questions": [
+            {"text": f"Which statement about {topic} is true?", "options": ["A", "B", "C", "D"], "answer": "A", "bloomsLevel": "Comprehension"}
+            for _ in range(3)
+        ],
+        "tags": tags,
+    }, indent=2)
+
+
+def malform(content: str, rng: random.Random) -> str:
+    """Damage JSON the way free models do; the backend's parser should repair all of these"""
+    kind = rng.choice(["fenced", "prose", "trailing_comma", "single_quotes", "truncated"])
+    if kind == "fenced":
+        return "```json\n" + content + "\n```"
+    if kind == "prose":
+        return "Sure! Here is the JSON you asked for:\n\n" + content + "\n\nLet me know if you need changes."
+    if kind == "trailing_comma":
+        return re.sub(r'(["\]}])\n(\s*[\]}])', r"\1,\n\2", content, count=3)
+    if kind == "single_quotes":
+        return content.replace('"title"', "'title'")
+    return content[: int(len(content) * rng.uniform(0.6, 0.95))]
+
+
+class FakeRateLimit:
+    """Per-model fixed window limit, reported with OpenRouter's X-RateLimit-* headers"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._windows: Dict[str, Tuple[float, int]] = {}
+
+    def check(self, model: str) -> Tuple[bool, Dict[str, str]]:
+        now = time.time()
+        start, count = self._windows.get(model, (now, 0))
+        if now - start >= self.window:
+            start, count = now, 0
+        allowed = count < self.limit
+        if allowed:
+            count += 1
+        self._windows[model] = (start, count)
+        reset = start + self.window
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, self.limit - count)),
+            "X-RateLimit-Reset": str(int(reset * 1000)),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(reset - now)))
+        return allowed, headers
+
+
+def create_app(
+    latency: str = "lognormal:2,0.5",
+    model_latency: Optional[Dict[str, str]] = None,
+    rate_limit: Optional[str] = None,
+    error_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    tokens_per_second: float = 200.0,
+    seed: Optional[int] = None
+) -> FastAPI:
+    """
+    Create the fake API
+
+    Args:
+        latency: Default latency distribution (see parse_latency)
+        model_latency: Per-model latency distributions
+        rate_limit: Per-model limit as "CALLS/SECONDS", or None for no limit
+        error_rate: Fraction of calls answered with a 502
+        malformed_rate: Fraction of answers with damaged JSON
+        tokens_per_second: Streaming speed after the first token
+        seed: Random seed, for repeatable runs
+
+    Returns:
+        The FastAPI app
+    """
+    app = FastAPI(title="Fake OpenRouter")
+    rng = random.Random(seed)
+    default_latency = parse_latency(latency)
+    latencies = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+    limiter = None
+    if rate_limit:
+        calls, window = rate_limit.split("/")
+        limiter = FakeRateLimit(int(calls), float(window))
+
+    stats: Dict[str, Any] = {"calls": 0, "streams": 0, "rate_limited": 0, "errors": 0, "malformed": 0, "models": {}}
+
+    def error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+        return JSONResponse({"error": {"code": status, "message": message}}, status_code=status, headers=headers)
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "unknown")
+        stats["calls"] += 1
+        stats["models"][model] = stats["models"].get(model, 0) + 1
+
+        headers: Dict[str, str] = {}
+        if limiter is not None:
+            allowed, headers = limiter.check(model)
+            if not allowed:
+                stats["rate_limited"] += 1
+                return error(429, f"Rate limit exceeded: free-models-per-min for {model}", headers)
+
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(rng.uniform(0.05, 0.5))
+            return error(502, "Upstream provider returned an error")
+
+        messages = body.get("messages") or [{}]
+        prompt = messages[-1].get("content", "")
+        max_tokens = body.get("max_tokens", 2000)
+        content = fake_content(prompt, max_tokens, rng)
+        if rng.random() < malformed_rate:
+            stats["malformed"] += 1
+            content = malform(content, rng)
+        # Like a real model, stop at max_tokens (about 4 characters per token)
+        finish_reason = "stop"
+        if len(content) // 4 > max_tokens:
+            content = content[:max_tokens * 4]
+            finish_reason = "length"
+
+        delay = latencies.get(model, default_latency)(rng)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return JSONResponse({
+                "id": f"gen-{stats['calls']}",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": usage,
+            }, headers=headers)
+
+        stats["streams"] += 1
+
+        async def events():
+            # Like OpenRouter: keep-alive comments until the model starts, then ~4 characters per token
+            waited = 0.0
+            while waited < delay:
+                yield ": OPENROUTER PROCESSING\n\n"
+                step = min(1.0, delay - waited)
+                await asyncio.sleep(step)
+                waited += step
+            chunk_size = 16
+            for start in range(0, len(content), chunk_size):
+                chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(chunk_size / 4 / tokens_per_second)
+            yield f"data: {json.dumps({'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.get("/stats")
+    async def get_stats():
+        """Calls received so far, for load tests to count upstream calls"""
+        return stats
+
+    @app.post("/reset")
+    async def reset():
+        stats.update({"calls": 0, "streams": 0, "rate_limited": 0, "errors": 0, "malformed": 0, "models": {}})
+        return stats
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenRouter API")
+    parser.add_argument("--port", type=int, default=9100, help="Port to listen on (default: 9100)")
+    parser.add_argument("--latency", default="lognormal:2,0.5",
+                        help="Latency distribution: fixed:S, uniform:LOW,HIGH, exp:MEAN or lognormal:MEDIAN,SIGMA (default: lognormal:2,0.5)")
+    parser.add_argument("--model-latency", default="{}",
+                        help='Per-model latency as JSON, e.g. \'{"deepseek/deepseek-chat:free": "lognormal:60,0.6"}\'')
+    parser.add_argument("--rate-limit", default=None, help="Per-model rate limit as CALLS/SECONDS, e.g. 20/60")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 502")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of answers with damaged JSON")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Streaming speed (default: 200)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(
+            latency=args.latency,
+            model_latency=json.loads(args.model_latency),
+            rate_limit=args.rate_limit,
+            error_rate=args.error_rate,
+            malformed_rate=args.malformed_rate,
+            tokens_per_second=args.tokens_per_second,
+            seed=args.seed,
+        ),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,22 @@
+import os
+import shutil
+import tempfile
+
+# Picked up automatically by gunicorn when started from this directory
+
+# Each worker writes its metrics to files here and /metrics sums them, so
+# counters cover every worker whichever one answers the scrape
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "edugenie-metrics"))
+
+
+def on_starting(server):
+    """Drop metric files left by a previous run"""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Stop counting a dead worker's gauges"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
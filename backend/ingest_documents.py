@@ -0,0 +1,24 @@
+import sys
+import argparse
+
+from app.rag import ingest, RAG_INDEX_PATH, RAG_CHUNK_WORDS, RAG_CHUNK_OVERLAP, RAG_DIMENSIONS, DOCUMENT_EXTENSIONS
+
+# Parse command line arguments
+parser = argparse.ArgumentParser(description="Chunk curriculum documents and build the retrieval index")
+parser.add_argument("paths", nargs="+", help=f"Files, or directories of {', '.join(DOCUMENT_EXTENSIONS)} files")
+parser.add_argument("--index", default=RAG_INDEX_PATH, help=f"Index directory (default: {RAG_INDEX_PATH})")
+parser.add_argument("--chunk-words", type=int, default=RAG_CHUNK_WORDS, help=f"Words per chunk (default: {RAG_CHUNK_WORDS})")
+parser.add_argument("--overlap", type=int, default=RAG_CHUNK_OVERLAP,
+                    help=f"Words shared by consecutive chunks (default: {RAG_CHUNK_OVERLAP})")
+parser.add_argument("--dimensions", type=int, default=RAG_DIMENSIONS, help=f"Vector size (default: {RAG_DIMENSIONS})")
+args = parser.parse_args()
+
+
+def main() -> None:
+    meta = ingest(args.paths, args.index, args.chunk_words, args.overlap, args.dimensions)
+    print(f"Indexed {meta['chunks']} chunks from {len(meta['sources'])} documents "
+          f"in {meta['build_seconds']:.2f}s to {args.index}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
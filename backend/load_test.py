@@ -0,0 +1,314 @@
+"""
+Load test the generation endpoints
+
+Sends requests to a running backend at increasing concurrency and reports
+throughput, latency percentiles, upstream calls per request, cache hit rate
+and worker memory. Meant to run against fake_openrouter.py so results are
+repeatable and free:
+
+    python fake_openrouter.py --latency lognormal:2,0.5 &
+    OPENROUTER_API_URL=http://localhost:9100/api/v1/chat/completions OPENROUTER_API_KEY=fake \\
+        gunicorn -w 4 -k uvicorn.workers.UvicornWorker app.api:app &
+    python load_test.py --concurrency 1,8,32 --requests 200 --output results.json
+
+Save a run as a baseline and pass it with --compare to fail (exit 1) when a
+later run is slower or makes more upstream calls than the tolerance allows.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from app.model_stats import percentile
+
+TOPICS = [
+    "Photosynthesis", "The Water Cycle", "Fractions", "Plate Tectonics", "The French Revolution",
+    "Cell Division", "Newton's Laws", "Poetry Analysis", "Ecosystems", "The Solar System",
+]
+KINDS = ["lesson", "assessment", "lab", "tip"]
+
+
+def build_request(kind: str, topic: str, model: str) -> Dict[str, Any]:
+    """Build the path and body for one generation request"""
+    if kind == "lesson":
+        return {"path": "/generate/lesson", "json": {
+            "topic": topic, "gradeLevel": "6-8", "duration": "45 minutes", "model": model}}
+    if kind == "assessment":
+        return {"path": "/generate/assessment", "json": {
+            "topic": topic, "gradeLevel": "6-8", "numberOfQuestions": 5,
+            "questionTypes": ["multiple-choice"], "bloomsLevels": ["Application"], "model": model}}
+    if kind == "lab":
+        return {"path": "/generate/lab", "json": {"topic": topic, "gradeLevel": "6-8", "model": model}}
+    return {"path": "/generate/teaching-tip", "json": {"subject": topic, "model": model}}
+
+
+def make_workload(count: int, kinds: List[str], unique_ratio: float, model: str, rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    Build the requests for one concurrency level
+
+    Args:
+        count: Number of requests
+        kinds: Request kinds to mix
+        unique_ratio: Fraction of requests with a topic never sent before;
+            the rest repeat a small set of popular topics and can hit the cache
+        model: Model to request
+        rng: Random source
+
+    Returns:
+        List of request specs
+    """
+    workload = []
+    for _ in range(count):
+        if rng.random() < unique_ratio:
+            topic = f"{rng.choice(TOPICS)} {rng.getrandbits(48):x}"
+        else:
+            topic = rng.choice(TOPICS)
+        workload.append(build_request(rng.choice(kinds), topic, model))
+    return workload
+
+
+async def get_json(client: httpx.AsyncClient, url: str) -> Optional[Dict[str, Any]]:
+    try:
+        response = await client.get(url, timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def poll_processes(client: httpx.AsyncClient, url: str, seen: Dict[int, Dict[str, Any]], stop: asyncio.Event):
+    """
+    Sample /status/process until stopped
+
+    Each connection lands on whichever worker accepts it, so polling with
+    fresh connections soon sees every worker. Keeps the first and latest sample per pid.
+    """
+    while not stop.is_set():
+        sample = await get_json(client, f"{url}/status/process")
+        if sample is not None:
+            pid = sample["process"]["pid"]
+            entry = seen.setdefault(pid, {"first": sample, "peak_rss": 0})
+            entry["last"] = sample
+            entry["peak_rss"] = max(entry["peak_rss"], sample["process"]["rss_bytes"])
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.1)
+        except asyncio.TimeoutError:
+            pass
+
+
+def cache_delta(seen: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the response cache lookups each worker made between its first and latest sample"""
+    hits = misses = 0
+    for entry in seen.values():
+        first = entry["first"]["cache"]["responses"]
+        last = entry["last"]["cache"]["responses"]
+        hits += last["hits"] - first["hits"]
+        misses += last["misses"] - first["misses"]
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    url: str,
+    fake_url: Optional[str],
+    workload: List[Dict[str, Any]],
+    concurrency: int,
+    stream: bool
+) -> Dict[str, Any]:
+    """
+    Send a workload with a fixed number of requests in flight
+
+    Returns:
+        Results for this concurrency level
+    """
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue = list(reversed(workload))
+
+    async def send(spec: Dict[str, Any]):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            params = {"stream": "true"} if stream and spec["path"] != "/generate/teaching-tip" else None
+            async with client.stream("POST", url + spec["path"], json=spec["json"], params=params) as response:
+                first_byte = None
+                async for _ in response.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                status = str(response.status_code)
+            if status == "200":
+                latencies.append(time.perf_counter() - started)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def worker():
+        while queue:
+            await send(queue.pop())
+
+    upstream_before = await get_json(client, f"{fake_url}/stats") if fake_url else None
+    seen: Dict[int, Dict[str, Any]] = {}
+    stop = asyncio.Event()
+    # A new connection per sample, so the samples spread over the workers
+    poll_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=0))
+    poller = asyncio.create_task(poll_processes(poll_client, url, seen, stop))
+    # Let the poller take a first sample of the workers before load starts
+    await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    await asyncio.sleep(0.5)
+    stop.set()
+    await poller
+    await poll_client.aclose()
+
+    latencies.sort()
+    first_bytes.sort()
+    result: Dict[str, Any] = {
+        "concurrency": concurrency,
+        "requests": len(workload),
+        "statuses": statuses,
+        "elapsed": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "cache": cache_delta(seen),
+        "workers": {
+            str(pid): {"rss_mb": entry["last"]["process"]["rss_bytes"] / 2 ** 20, "peak_rss_mb": entry["peak_rss"] / 2 ** 20}
+            for pid, entry in sorted(seen.items())
+        },
+    }
+    if stream:
+        result["first_byte"] = {"p50": percentile(first_bytes, 50), "p95": percentile(first_bytes, 95)}
+
+    upstream_after = await get_json(client, f"{fake_url}/stats") if fake_url else None
+    if upstream_before and upstream_after:
+        calls = upstream_after["calls"] - upstream_before["calls"]
+        result["upstream"] = {
+            "calls": calls,
+            "calls_per_request": calls / len(workload) if workload else 0.0,
+            "rate_limited": upstream_after["rate_limited"] - upstream_before["rate_limited"],
+        }
+    return result
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Find regressions against a baseline run
+
+    A level regresses if its throughput falls, or its p95 latency or
+    upstream calls per request rise, by more than the tolerance.
+
+    Returns:
+        One message per regression
+    """
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        before = baseline_levels.get(level["concurrency"])
+        if before is None:
+            continue
+        name = f"concurrency {level['concurrency']}"
+        if level["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {level['rps']:.1f} rps, baseline {before['rps']:.1f}")
+        p95, before_p95 = level["latency"]["p95"], before["latency"]["p95"]
+        if p95 is not None and before_p95 is not None and p95 > before_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 latency {p95:.2f}s, baseline {before_p95:.2f}s")
+        if "upstream" in level and "upstream" in before:
+            calls, before_calls = level["upstream"]["calls_per_request"], before["upstream"]["calls_per_request"]
+            if calls > before_calls * (1 + tolerance):
+                regressions.append(f"{name}: {calls:.2f} upstream calls per request, baseline {before_calls:.2f}")
+    return regressions
+
+
+def print_level(level: Dict[str, Any]):
+    latency = level["latency"]
+    line = (
+        f"c={level['concurrency']:<4} {level['rps']:8.2f} rps  "
+        f"p50 {latency['p50'] or 0:6.2f}s  p95 {latency['p95'] or 0:6.2f}s  p99 {latency['p99'] or 0:6.2f}s  "
+        f"cache hit {level['cache']['hit_rate']:5.1%}"
+    )
+    if "upstream" in level:
+        line += f"  upstream/req {level['upstream']['calls_per_request']:.2f}"
+    print(line)
+    print(f"       statuses {level['statuses']}")
+    for pid, worker in level["workers"].items():
+        print(f"       worker {pid}: {worker['rss_mb']:.1f} MB (peak {worker['peak_rss_mb']:.1f} MB)")
+
+
+async def main(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    kinds = KINDS if args.kind == "mixed" else [args.kind]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    results: Dict[str, Any] = {
+        "config": {
+            "url": args.url, "kind": args.kind, "requests": args.requests,
+            "unique_ratio": args.unique_ratio, "stream": args.stream, "model": args.model, "seed": args.seed,
+        },
+        "levels": [],
+    }
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if await get_json(client, f"{args.url}/health") is None:
+            print(f"Backend not reachable at {args.url}")
+            return 2
+        for concurrency in args.concurrency:
+            workload = make_workload(args.requests, kinds, args.unique_ratio, args.model, rng)
+            level = await run_level(client, args.url, args.fake_url, workload, concurrency, args.stream)
+            results["levels"].append(level)
+            print_level(level)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the EduGenie generation endpoints")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend URL (default: http://localhost:8000)")
+    parser.add_argument("--fake-url", default="http://localhost:9100",
+                        help="fake_openrouter.py URL, to count upstream calls; empty to skip (default: http://localhost:9100)")
+    parser.add_argument("--kind", choices=KINDS + ["mixed"], default="mixed", help="Requests to send (default: mixed)")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 8, 32],
+                        help="Comma-separated requests in flight per level (default: 1,8,32)")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level (default: 100)")
+    parser.add_argument("--unique-ratio", type=float, default=0.5,
+                        help="Fraction of requests with a new topic; the rest repeat popular topics (default: 0.5)")
+    parser.add_argument("--stream", action="store_true", help="Use ?stream=true and also report time to first byte")
+    parser.add_argument("--model", default="meta-llama/llama-4-scout:free", help="Model to request")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds (default: 300)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the workload (default: 1)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed regression as a fraction (default: 0.1)")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
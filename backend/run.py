@@ -8,13 +8,45 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+def prewarm(args) -> int:
+    """Generate the most popular requests into the response cache once, then exit"""
+    import json
+    import asyncio
+    import logging
+    from app import http_client
+    from app.library import create_content_library
+    from app.prewarm import Prewarmer
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    library = create_content_library()
+    if library is None:
+        print("The content library is disabled (LIBRARY_ENABLED), so there are no request counts to pre-warm from")
+        return 1
+    
+    async def run():
+        try:
+            return await Prewarmer(library).run(top=args.top, max_calls=args.max_calls, dry_run=args.dry_run)
+        finally:
+            await http_client.close_client()
+    
+    print(json.dumps(asyncio.run(run()), indent=2))
+    return 0
+
 if __name__ == "__main__":
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Run the EduGenie backend server")
+    parser.add_argument("command", nargs="?", choices=["serve", "prewarm"], default="serve",
+                        help="serve (default) or prewarm: generate popular requests into the response cache and exit")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     parser.add_argument("--port", type=int, default=8000, help="Port to run the server on (default: 8000)")
+    parser.add_argument("--top", type=int, default=None, help="prewarm: most popular requests to consider (default: PREWARM_TOP)")
+    parser.add_argument("--max-calls", type=int, default=None, help="prewarm: upstream calls to spend at most (default: PREWARM_MAX_CALLS)")
+    parser.add_argument("--dry-run", action="store_true", help="prewarm: list the requests without generating them")
     args = parser.parse_args()
     
+    if args.command == "prewarm":
+        sys.exit(prewarm(args))
+    
     debug = os.getenv("DEBUG", "False").lower() in ("true", "1", "t", "yes")
     port = args.port
     
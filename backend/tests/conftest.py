@@ -0,0 +1,101 @@
+"""
+Shared test setup
+
+The backend reads its configuration when app modules are imported, so the
+environment is set here first: every store lives in a temporary directory
+and OpenRouter calls go to fake_openrouter.py, served from a thread.
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import functools
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+DATA_DIR = tempfile.mkdtemp(prefix="edugenie-tests-")
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+FAKE_PORT = _free_port()
+
+os.environ.update({
+    "OPENROUTER_API_KEY": "fake",
+    "OPENROUTER_API_URL": f"http://127.0.0.1:{FAKE_PORT}/api/v1/chat/completions",
+    "OPENROUTER_HTTP2": "False",
+    "RESPONSE_CACHE_BACKEND": "sqlite",
+    "RESPONSE_CACHE_PATH": os.path.join(DATA_DIR, "responses.sqlite3"),
+    "SHARED_STATE_BACKEND": "sqlite",
+    "SHARED_STATE_PATH": os.path.join(DATA_DIR, "state.sqlite3"),
+    "JOB_STORE_PATH": os.path.join(DATA_DIR, "jobs.sqlite3"),
+    "LIBRARY_PATH": os.path.join(DATA_DIR, "library.sqlite3"),
+    "TRACE_JSONL_PATH": os.path.join(DATA_DIR, "traces.jsonl"),
+    "TRACE_SAMPLE_RATE": "0",
+    "MAX_CALLS_PER_MODEL": "100000",
+    "CONCURRENCY_LIMIT_ENABLED": "true",
+    "HEALTH_PROBE_ENABLED": "false",
+    "PREWARM_ENABLED": "false",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "HEDGING_ENABLED": "false",
+    "RAG_ENABLED": "false",
+})
+
+from fake_openrouter import create_app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def fake_openrouter():
+    """The fake OpenRouter API, answering at once; yields its base URL"""
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(latency="fixed:0", seed=1, tokens_per_second=100000),
+        host="127.0.0.1", port=FAKE_PORT, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("fake_openrouter did not start")
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{FAKE_PORT}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture(scope="session")
+def client(fake_openrouter):
+    """A client for the backend app, started once for the whole session"""
+    from starlette.testclient import TestClient
+    from app.api import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def run(client):
+    """Run a coroutine function on the app's event loop, which the shared HTTP client belongs to"""
+    def run(fn, *args, **kwargs):
+        return client.portal.call(functools.partial(fn, *args, **kwargs))
+    return run
+
+
+@pytest.fixture
+def upstream_calls(fake_openrouter):
+    """Get the number of calls the fake OpenRouter has answered"""
+    return lambda: httpx.get(f"{fake_openrouter}/stats").json()["calls"]
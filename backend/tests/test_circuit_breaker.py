@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from app.circuit_breaker import CircuitBreaker
+from app.errors import CircuitOpenError, FAILURE_SERVER, FAILURE_MALFORMED
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(threshold=2, base_cooldown=60)
+    breaker.record_failure("m", FAILURE_SERVER)
+    assert breaker.state("m") == "closed"
+    breaker.record_failure("m", FAILURE_SERVER)
+
+    assert breaker.state("m") == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check("m")
+    assert breaker.available("other")
+
+
+def test_success_resets_the_count():
+    breaker = CircuitBreaker(threshold=2, base_cooldown=60)
+    breaker.record_failure("m", FAILURE_SERVER)
+    breaker.record_success("m")
+    breaker.record_failure("m", FAILURE_SERVER)
+
+    assert breaker.state("m") == "closed"
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(threshold=1, base_cooldown=0.01, trials=1)
+    breaker.record_failure("m", FAILURE_SERVER)
+    time.sleep(0.02)
+
+    assert breaker.state("m") == "half_open"
+    breaker.check("m")
+    assert not breaker.available("m")
+    breaker.record_success("m")
+    assert breaker.state("m") == "closed"
+
+    breaker.record_failure("m", FAILURE_MALFORMED)
+    time.sleep(0.02)
+    breaker.check("m")
+    breaker.record_failure("m", FAILURE_MALFORMED)
+    assert breaker.state("m") == "open"
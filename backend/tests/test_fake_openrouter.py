@@ -0,0 +1,54 @@
+import random
+
+import httpx
+import pytest
+
+from fake_openrouter import fake_content
+from app.generation import GENERATION_KINDS
+from app.models import LessonRequest, AssessmentRequest, LabRequest, LessonResult, AssessmentResult, Lab
+from app.openrouter import sanitize_and_parse_json
+
+REQUESTS = {
+    "lesson": (LessonRequest(topic="Photosynthesis", gradeLevel="6-8", duration="45 minutes", model="m"), LessonResult),
+    "assessment": (
+        AssessmentRequest(
+            topic="Photosynthesis", gradeLevel="6-8", numberOfQuestions=4,
+            questionTypes=["multiple-choice"], bloomsLevels=["Application"], model="m"
+        ),
+        AssessmentResult,
+    ),
+    "lab": (LabRequest(topic="Photosynthesis", gradeLevel="6-8", model="m"), Lab),
+}
+
+
+@pytest.mark.parametrize("kind", sorted(REQUESTS))
+def test_fake_response_validates_into_its_result_model(kind):
+    request, result_model = REQUESTS[kind]
+    _, build_prompt, build_result = GENERATION_KINDS[kind]
+
+    content = fake_content(build_prompt(request), 4000, random.Random(1))
+    result = build_result(sanitize_and_parse_json(content), request)
+
+    assert isinstance(result, result_model)
+    assert "Photosynthesis" in result.title
+    assert result.objectives if kind != "assessment" else len(result.questions) == 4
+
+
+def test_lesson_prompt_gets_a_lesson_not_an_assessment():
+    request, _ = REQUESTS["lesson"]
+    _, build_prompt, build_result = GENERATION_KINDS["lesson"]
+
+    result = build_result(sanitize_and_parse_json(fake_content(build_prompt(request), 4000, random.Random(1))), request)
+
+    assert "Assessment" not in result.title
+    assert result.overview != "Overview not generated."
+
+
+def test_fake_server_answers_chat_completions(fake_openrouter):
+    response = httpx.post(f"{fake_openrouter}/api/v1/chat/completions", json={
+        "model": "m",
+        "messages": [{"role": "user", "content": 'Create a detailed virtual lab about "Magnets" for grade level "5".'}],
+    })
+
+    assert response.status_code == 200
+    assert sanitize_and_parse_json(response.json()["choices"][0]["message"]["content"])["title"] == "Investigating Magnets"
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from app import jobs, http_client
+from app.jobs import JobQueue, MemoryJobStore, SQLiteJobStore, check_callback_url, current_owner, post_callback
+
+
+def callback_error(url: str, allowed_hosts: str = ""):
+    try:
+        asyncio.run(check_callback_url(url, allowed_hosts))
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost:8000/hook",
+    "http://127.0.0.1/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "http://10.0.0.5/hook",
+    "http://172.16.0.1/hook",
+    "http://192.168.1.1/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[fe80::1]/hook",
+    "http://224.0.0.1/hook",
+])
+def test_callback_to_private_host_is_rejected(url):
+    assert "not a public address" in callback_error(url)
+
+
+@pytest.mark.parametrize("url", ["ftp://example.com/hook", "http:///hook", "/hook"])
+def test_callback_must_be_http(url):
+    assert callback_error(url) == "callback_url must be an http(s) URL"
+
+
+def test_callback_to_public_address_is_accepted():
+    assert callback_error("https://8.8.8.8/hook") is None
+
+
+def test_callback_check_returns_the_address_to_connect_to():
+    assert asyncio.run(check_callback_url("https://8.8.8.8/hook", "")) == "8.8.8.8"
+    assert asyncio.run(check_callback_url("https://hooks.example.com/hook", ".example.com")) is None
+
+
+def test_callback_connects_to_the_vetted_address(fake_openrouter):
+    # hooks.invalid doesn't resolve, so the request can only arrive by the pinned address
+    port = fake_openrouter.rsplit(":", 1)[1]
+    requests = http_client.POOL_STATS["requests"]
+    body = {"model": "m", "messages": [{"role": "user", "content": "Hi"}]}
+
+    response = asyncio.run(post_callback(f"http://hooks.invalid:{port}/api/v1/chat/completions", body, "127.0.0.1"))
+
+    assert response.status_code == 200
+    assert http_client.POOL_STATS["requests"] == requests
+
+
+def test_callback_allowlist():
+    assert callback_error("http://10.0.0.5/hook", "10.0.0.5") is None
+    assert callback_error("https://hooks.example.com/hook", ".example.com") is None
+    assert callback_error("https://example.com/hook", ".example.com") is None
+    assert "is not allowed" in callback_error("https://notexample.com/hook", ".example.com")
+    assert "is not allowed" in callback_error("https://8.8.8.8/hook", "hooks.example.com")
+
+
+def test_submit_with_private_callback_is_rejected(client):
+    response = client.post(
+        "/jobs/lesson",
+        params={"callback_url": "http://169.254.169.254/latest"},
+        json={"topic": "Tides", "gradeLevel": "6-8", "duration": "45 minutes", "model": "deepseek/deepseek-chat:free"},
+    )
+
+    assert response.status_code == 400
+    assert "not a public address" in response.json()["detail"]
+
+
+def test_backlog_for_one_model_does_not_hold_up_another():
+    async def scenario():
+        queue = JobQueue(store=MemoryJobStore(), workers=2, per_kind=10, per_model=1)
+        finished = []
+
+        async def handler(request):
+            await asyncio.sleep(0.2 if request["model"] == "slow" else 0)
+            finished.append(request["model"])
+            return {}
+
+        queue.register("lesson", handler)
+        await queue.start()
+        try:
+            for topic in range(4):
+                queue.submit("lesson", {"model": "slow", "topic": str(topic)})
+            queue.submit("lesson", {"model": "fast", "topic": "x"})
+            await asyncio.sleep(0.1)
+            return finished[:]
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == ["fast"]
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc for process start times")
+def test_orphans_of_a_reused_pid_are_claimed(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    sleeper = subprocess.Popen(["sleep", "5"])
+    try:
+        live_owner = f"{sleeper.pid}:{jobs._process_start(sleeper.pid)}"
+        owners = {
+            "mine": current_owner(),
+            "live": live_owner,
+            # A dead worker whose pid this process, or the sleeper, was given since
+            "reused_by_me": f"{os.getpid()}:1",
+            "reused_by_other": f"{sleeper.pid}:1",
+            "dead": "999999999",
+        }
+        for job_id, owner in owners.items():
+            store.create({
+                "id": job_id, "kind": "lesson", "model": "m", "status": jobs.QUEUED, "priority": 5,
+                "request": {}, "owner": owner, "created_at": time.time(),
+            })
+
+        claimed = {job["id"] for job in store.claim_orphans(current_owner())}
+    finally:
+        sleeper.kill()
+
+    assert claimed == {"reused_by_me", "reused_by_other", "dead"}
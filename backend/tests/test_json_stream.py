@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from app.json_stream import StreamingJSONParser, parse_json_object
+from app.openrouter import sanitize_and_parse_json
+
+LESSON = {
+    "title": "Exploring Tides",
+    "objectives": ["Explain tides", "Predict high tide"],
+    "questions": [{"text": "What causes tides?", "answer": "The Moon"}],
+    "duration": 45,
+}
+TEXT = json.dumps(LESSON, indent=2)
+
+
+@pytest.mark.parametrize("text, repair", [
+    ('{"title": "Tides", "tags": ["a", "b",],}', "trailing_comma"),
+    ("{'title': 'Tides', 'tags': ['a', 'b']}", "single_quotes"),
+    ('{title: "Tides", tags: ["a", "b"]}', "bare_key"),
+    ('{"title": "Tides" "tags": ["a", "b"]}', "missing_comma"),
+    ('{"title": "Tides", "done": True, "tags": ["a", "b"]}', "python_literal"),
+])
+def test_common_mistakes_are_repaired(text, repair):
+    parser = StreamingJSONParser()
+    parser.feed(text)
+    parsed = parser.close()
+
+    assert parsed["title"] == "Tides"
+    assert parsed["tags"] == ["a", "b"]
+    assert repair in parser.repairs
+
+
+@pytest.mark.parametrize("text", [
+    "```json\n" + TEXT + "\n```",
+    "Sure! Here is the JSON you asked for:\n\n" + TEXT + "\n\nLet me know if you need changes.",
+])
+def test_prose_and_code_fences_are_skipped(text):
+    assert sanitize_and_parse_json(text) == LESSON
+
+
+def test_truncated_response_keeps_completed_fields():
+    parser = StreamingJSONParser()
+    parser.feed(TEXT[:TEXT.index('"questions"') + 30])
+    parsed = parser.close()
+
+    assert parsed["title"] == LESSON["title"]
+    assert parsed["objectives"] == LESSON["objectives"]
+    assert "truncated" in parser.repairs
+
+
+def test_chunked_feed_matches_single_pass_and_reports_fields():
+    parser = StreamingJSONParser()
+    events = []
+    for start in range(0, len(TEXT), 7):
+        events.extend(parser.feed(TEXT[start:start + 7]))
+
+    assert parser.close() == parse_json_object(TEXT) == LESSON
+    assert [path for path, _ in events if "[" not in path] == ["title", "objectives", "questions", "duration"]
+    assert ("questions[0]", LESSON["questions"][0]) in events
+
+
+def test_text_without_json_is_rejected():
+    with pytest.raises(ValueError):
+        sanitize_and_parse_json("I can't help with that.")
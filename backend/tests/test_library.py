@@ -0,0 +1,68 @@
+import random
+
+from fake_openrouter import fake_content
+from app.generation import GENERATION_KINDS
+from app.library import ContentLibrary
+from app.models import LessonRequest
+from app.openrouter import sanitize_and_parse_json
+
+
+def lesson(topic: str, model: str = "m", **fields) -> LessonRequest:
+    return LessonRequest(topic=topic, gradeLevel="6-8", duration="45 minutes", model=model, **fields)
+
+
+def generated(request: LessonRequest):
+    _, build_prompt, build_result = GENERATION_KINDS["lesson"]
+    return build_result(sanitize_and_parse_json(fake_content(build_prompt(request), 4000, random.Random(1))), request)
+
+
+def test_saved_result_is_found_and_reused_across_models(tmp_path):
+    library = ContentLibrary(str(tmp_path / "library.sqlite3"))
+    library.save(lesson("Photosynthesis"), generated(lesson("Photosynthesis")), "model-a")
+
+    match = library.find_match(lesson("  photosynthesis ", model="model-b"))
+
+    assert match["model"] == "model-a"
+    assert match["result"]["title"] == "Exploring Photosynthesis"
+    assert library.find_match(lesson("Photosynthesis", additionalNotes="Use a lab")) is None
+
+
+def test_search_matches_words_and_filters(tmp_path):
+    library = ContentLibrary(str(tmp_path / "library.sqlite3"))
+    for topic in ("Photosynthesis", "Plate Tectonics"):
+        library.save(lesson(topic), generated(lesson(topic)), "m")
+
+    found = library.search(query="photo")
+
+    assert found["total"] == 1
+    assert found["items"][0]["title"] == "Exploring Photosynthesis"
+    assert library.search(kind="assessment")["total"] == 0
+    assert library.search(grade_level="6-8")["total"] == 2
+
+
+def test_request_counts_rank_popular_requests(tmp_path):
+    library = ContentLibrary(str(tmp_path / "library.sqlite3"))
+    for _ in range(3):
+        library.record_request(lesson("Tides"))
+    library.record_request(lesson("Volcanoes"))
+    library.record_request(lesson("Tides", model="other"))
+
+    popular = library.popular_requests(days=1, limit=10, min_count=2)
+
+    assert [(entry["request"]["topic"], entry["count"]) for entry in popular] == [("Tides", 3)]
+
+
+def test_library_endpoints_and_reuse_through_the_api(client, upstream_calls):
+    body = {"topic": "Ocean Currents", "gradeLevel": "6-8", "duration": "45 minutes", "model": "deepseek/deepseek-chat:free"}
+    first = client.post("/generate/lesson", json=body)
+    assert first.status_code == 200
+
+    calls = upstream_calls()
+    reused = client.post("/generate/lesson", params={"reuse": True}, json={**body, "model": "qwen/qwen3-4b:free"})
+
+    assert upstream_calls() == calls
+    content_id = reused.headers["X-Library-Id"]
+    found = client.get("/library", params={"q": "ocean"}).json()
+    assert [item["id"] for item in found["items"]] == [content_id]
+    assert client.get(f"/library/{content_id}").json()["result"] == reused.json()
+    assert client.get("/library/unknown").status_code == 404
@@ -0,0 +1,36 @@
+import time
+
+from app.lru_cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_byte_limit_evicts_until_it_fits():
+    cache = LRUCache(max_entries=None, max_bytes=10, sizeof=len)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.put("c", "123")
+
+    assert list(cache.keys()) == ["b", "c"]
+    assert cache.bytes == 8
+
+
+def test_expired_entry_is_a_miss():
+    cache = LRUCache(ttl=0.01)
+    cache.put("a", 1)
+    cache.put("b", 2, ttl=60)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert (cache.hits, cache.misses, cache.expirations) == (1, 1, 1)
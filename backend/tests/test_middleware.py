@@ -0,0 +1,73 @@
+import asyncio
+
+from app import concurrency, tracing
+from app.api import app
+from app.openrouter import build_headers
+
+ORIGIN = "https://edu-genie.app"
+LESSON = {"topic": "Tides", "gradeLevel": "6-8", "duration": "45 minutes", "model": "deepseek/deepseek-chat:free"}
+
+
+def test_cors_wraps_load_shedding():
+    # Outermost first: middleware added later wraps middleware added earlier
+    order = [middleware.cls.__name__ for middleware in app.user_middleware]
+
+    assert order.index("CORSMiddleware") < order.index("ConcurrencyMiddleware")
+    assert order.index("TracingMiddleware") < order.index("MetricsMiddleware") < order.index("CORSMiddleware")
+
+
+def test_shed_request_carries_cors_headers(client, monkeypatch):
+    async def full(self, timeout=0):
+        return False
+
+    monkeypatch.setattr(concurrency.AdaptiveLimit, "acquire", full)
+    response = client.post("/generate/lesson", json=LESSON, headers={"Origin": ORIGIN})
+
+    assert response.status_code == 503
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+    assert "retry-after" in response.headers
+    assert "x-request-id" in response.headers
+
+
+def test_caller_cannot_turn_tracing_on(monkeypatch):
+    traceparent = f"00-{'a' * 32}-{'b' * 16}-01"
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+
+    assert tracing.start_trace("GET", traceparent) is tracing.NOOP_SPAN
+
+    monkeypatch.setattr(tracing, "TRACE_TRUST_TRACEPARENT", True)
+    span = tracing.start_trace("GET", traceparent)
+    assert span is not tracing.NOOP_SPAN and span.trace_id == "a" * 32
+
+
+def test_request_id_is_not_sent_upstream_by_default(monkeypatch):
+    tracing.set_request_id("client-request-1")
+
+    assert "X-Request-ID" not in build_headers()
+
+    monkeypatch.setattr(tracing, "TRACE_PROPAGATE_UPSTREAM", True)
+    assert build_headers()["X-Request-ID"] == "client-request-1"
+
+
+def test_calls_adjust_the_limit_of_the_requested_model():
+    limiter = concurrency.ConcurrencyLimiter(lambda model_id: True)
+
+    async def app(scope, receive, send):
+        # The model manager sent the request to a substitute
+        limiter.observe_call("substitute", 0.5, "ok", 10)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def request():
+        messages = [{"type": "http.request", "body": b'{"model": "requested"}'}]
+        middleware = concurrency.ConcurrencyMiddleware(app, limiter, paths=["/generate/lesson"])
+        scope = {"type": "http", "method": "POST", "path": "/generate/lesson"}
+        sent = []
+        await middleware(scope, lambda: asyncio.sleep(0, messages.pop(0)), lambda message: asyncio.sleep(0, sent.append(message)))
+        return sent
+
+    asyncio.run(request())
+    limiter.observe_call("substitute", 0.5, "ok", 10)
+
+    assert limiter.models["requested"].samples == 1
+    assert limiter.models["substitute"].samples == 1
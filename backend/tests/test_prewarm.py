@@ -0,0 +1,41 @@
+from app.generation import GENERATION_KINDS
+from app.library import ContentLibrary
+from app.models import LabRequest
+from app.openrouter import DEFAULT_SYSTEM_PROMPT, generate_content
+from app.prewarm import Prewarmer, PREWARM_TEMPERATURE
+from app.shared_state import MemoryStateStore
+
+MODEL = "deepseek/deepseek-chat:free"
+
+
+def test_popular_request_is_generated_into_the_response_cache(tmp_path, run, upstream_calls):
+    library = ContentLibrary(str(tmp_path / "library.sqlite3"))
+    popular = LabRequest(topic="Prewarmed Magnets", gradeLevel="5", model=MODEL)
+    for _ in range(3):
+        library.record_request(popular)
+    library.record_request(LabRequest(topic="One-off Magnets", gradeLevel="5", model=MODEL))
+    prewarmer = Prewarmer(library, store=MemoryStateStore(), min_requests=2, max_calls=5)
+
+    dry_run = run(prewarmer.run, dry_run=True)
+    assert [candidate["request"]["topic"] for candidate in dry_run["candidates"]] == ["Prewarmed Magnets"]
+
+    summary = run(prewarmer.run)
+    assert (summary["warmed"], summary["failed"], summary["calls"]) == (1, 0, 1)
+
+    # A request with another budget is now answered from the cache
+    calls = upstream_calls()
+    prompt = GENERATION_KINDS["lab"][1](popular)
+    run(generate_content, prompt, MODEL, DEFAULT_SYSTEM_PROMPT, PREWARM_TEMPERATURE, max_tokens=1234)
+    assert upstream_calls() == calls
+
+
+def test_run_stops_at_its_call_budget(tmp_path, run):
+    library = ContentLibrary(str(tmp_path / "library.sqlite3"))
+    for topic in ("Budget A", "Budget B", "Budget C"):
+        for _ in range(2):
+            library.record_request(LabRequest(topic=topic, gradeLevel="5", model=MODEL))
+    prewarmer = Prewarmer(library, store=MemoryStateStore(), min_requests=2, max_calls=2)
+
+    summary = run(prewarmer.run)
+
+    assert (summary["warmed"], summary["skipped"], summary["calls"]) == (2, 1, 2)
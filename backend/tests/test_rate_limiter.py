@@ -0,0 +1,51 @@
+import httpx
+
+from app.rate_limiter import RateLimiter, parse_rate_limits
+from app.shared_state import MemoryStateStore
+
+
+def test_bucket_allows_up_to_its_limit():
+    limiter = RateLimiter(default_limit=3, window=3600)
+
+    assert [limiter.try_acquire("m") for _ in range(4)] == [True, True, True, False]
+    assert limiter.time_until_available("m") > 0
+    assert limiter.try_acquire("other")
+
+
+def test_configured_limits_override_the_default():
+    limiter = RateLimiter(default_limit=1, window=3600, limits=parse_rate_limits('{"m": [2, 60]}'))
+
+    assert [limiter.try_acquire("m") for _ in range(3)] == [True, True, False]
+
+
+def test_limit_is_learned_from_headers_unless_configured():
+    limiter = RateLimiter(default_limit=100, window=3600, limits={"configured": (5, 60)})
+    headers = httpx.Headers({"X-RateLimit-Limit": "2", "X-RateLimit-Remaining": "2"})
+
+    limiter.update_from_headers("m", headers)
+    limiter.update_from_headers("configured", headers)
+
+    assert [limiter.try_acquire("m") for _ in range(3)] == [True, True, False]
+    assert limiter.stats()["keys"]["m"]["learned"]
+    assert limiter.limits["configured"] == (5, 60)
+
+
+def test_workers_share_buckets_through_the_store():
+    store = MemoryStateStore()
+    first = RateLimiter(default_limit=2, window=3600, store=store)
+    second = RateLimiter(default_limit=2, window=3600, store=store)
+
+    assert first.try_acquire("m") and second.try_acquire("m")
+    assert not first.try_acquire("m")
+
+
+def test_learned_limit_is_shared_through_the_store():
+    store = MemoryStateStore()
+    first = RateLimiter(default_limit=100, window=3600, store=store)
+    second = RateLimiter(default_limit=100, window=3600, store=store)
+
+    first.update_from_headers("m", httpx.Headers({"X-RateLimit-Limit": "3;w=60"}))
+
+    assert second.stats()["keys"]["m"]["limit"] == "3/60"
+    assert second.stats()["keys"]["m"]["learned"]
+    assert [second.try_acquire("m") for _ in range(4)] == [True, True, True, False]
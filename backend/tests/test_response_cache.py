@@ -0,0 +1,88 @@
+import asyncio
+
+from app.cache import SQLiteCache
+from app.openrouter import RESPONSE_CACHE, generate_content, stream_content, get_cache_key
+
+MODEL = "deepseek/deepseek-chat:free"
+
+
+def lab_prompt(topic: str) -> str:
+    return f'Create a detailed virtual lab about "{topic}" for grade level "6-8".'
+
+
+def test_cache_key_leaves_out_max_tokens():
+    assert get_cache_key("prompt", MODEL) == get_cache_key("prompt", MODEL, None, 0.7)
+    assert get_cache_key("prompt", MODEL) != get_cache_key("prompt", MODEL, temperature=0.2)
+    assert get_cache_key("prompt", MODEL) != get_cache_key("other prompt", MODEL)
+
+
+def test_response_is_reused_whatever_the_budget(run, upstream_calls):
+    calls = upstream_calls()
+    hits, misses = RESPONSE_CACHE.hits, RESPONSE_CACHE.misses
+
+    first = run(generate_content, lab_prompt("Cache Budgets"), MODEL, max_tokens=3000)
+    second = run(generate_content, lab_prompt("Cache Budgets"), MODEL, max_tokens=2500)
+
+    assert second == first
+    assert upstream_calls() == calls + 1
+    # One lookup per request: the miss and the hit are each counted once
+    assert (RESPONSE_CACHE.hits - hits, RESPONSE_CACHE.misses - misses) == (1, 1)
+
+
+def test_response_is_stored_once(run):
+    size = RESPONSE_CACHE.size()["entries"]
+
+    run(generate_content, lab_prompt("Cache Entries"), MODEL, max_tokens=3000)
+
+    assert RESPONSE_CACHE.size()["entries"] == size + 1
+
+
+def test_truncated_response_is_not_cached(run, upstream_calls):
+    calls = upstream_calls()
+
+    run(generate_content, lab_prompt("Cache Truncation"), MODEL, max_tokens=50)
+    run(generate_content, lab_prompt("Cache Truncation"), MODEL, max_tokens=50)
+
+    assert upstream_calls() == calls + 2
+    assert run(RESPONSE_CACHE.get, get_cache_key(lab_prompt("Cache Truncation"), MODEL)) is None
+
+
+def test_streamed_response_is_cached(run, upstream_calls):
+    async def collect(max_tokens):
+        return "".join([delta async for delta in stream_content(lab_prompt("Cache Streams"), MODEL, max_tokens=max_tokens)])
+
+    calls = upstream_calls()
+    streamed = run(collect, 3000)
+
+    assert run(collect, 2000) == streamed
+    assert upstream_calls() == calls + 1
+
+
+def test_repeated_generation_request_calls_upstream_once(client, upstream_calls):
+    body = {"topic": "Cache Tides", "gradeLevel": "6-8", "duration": "45 minutes", "model": MODEL}
+    calls = upstream_calls()
+
+    first = client.post("/generate/lesson", json=body)
+    second = client.post("/generate/lesson", json=body)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["title"] == first.json()["title"] == "Exploring Cache Tides"
+    assert upstream_calls() == calls + 1
+
+
+def test_sqlite_cache_size_is_kept_without_querying(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    cache, other = SQLiteCache(path), SQLiteCache(path)
+
+    async def fill():
+        await cache.set("a", "xx")
+        await other.set("b", "yyy")
+        await cache.delete("missing")
+
+    asyncio.run(fill())
+
+    assert other.size() == {"entries": 2, "bytes": 5}
+    assert cache.size() == {"entries": 2, "bytes": 5}
+    # A busy query in another thread doesn't hold up stats on the event loop
+    with cache._lock:
+        assert cache.stats()["entries"] == 2
@@ -0,0 +1,41 @@
+import pytest
+
+from app.models import LessonRequest
+
+pytest.importorskip("numpy")
+
+from app.semantic_cache import SemanticCache  # noqa: E402
+
+
+def lesson(topic: str, grade: str = "6-8", model: str = "m") -> LessonRequest:
+    return LessonRequest(topic=topic, gradeLevel=grade, duration="45 minutes", model=model)
+
+
+def test_near_duplicate_is_served():
+    cache = SemanticCache(threshold=0.8)
+    cache.store(lesson("Photosynthesis"), "stored lesson")
+
+    response, similarity, exact = cache.lookup(lesson("photosynthesis "))
+
+    assert response == "stored lesson"
+    assert exact and similarity == pytest.approx(1.0)
+
+
+def test_different_topic_or_exact_field_misses():
+    cache = SemanticCache(threshold=0.8)
+    cache.store(lesson("The Rock Cycle"), "rock cycle lesson")
+
+    assert cache.lookup(lesson("The Water Cycle")) is None
+    assert cache.lookup(lesson("The Rock Cycle", grade="9-12")) is None
+
+
+def test_response_is_only_served_for_the_model_that_generated_it():
+    cache = SemanticCache(threshold=0.8)
+    cache.store(lesson("Photosynthesis", model="model-a"), "lesson from a")
+    # A retry answered a request for model-a with model-b
+    cache.store(lesson("Volcanoes", model="model-a"), "lesson from b", "model-b")
+
+    assert cache.lookup(lesson("Photosynthesis", model="model-b")) is None
+    assert cache.lookup(lesson("Photosynthesis", model="model-a"))[0] == "lesson from a"
+    assert cache.lookup(lesson("Volcanoes", model="model-a")) is None
+    assert cache.lookup(lesson("Volcanoes", model="model-b"))[0] == "lesson from b"
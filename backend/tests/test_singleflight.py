@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(scenario())
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert (flight.leaders, flight.followers) == (1, 4)
+
+
+def test_errors_are_shared_and_not_remembered():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        return results, await flight.do("key", lambda: asyncio.sleep(0, "recovered")), flight
+
+    results, retried, flight = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == "recovered"
+    assert flight.shared_errors == 1
+
+
+def test_timed_out_follower_leaves_the_leader_running():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("key", slow, timeout=0.01)
+        return await leader
+
+    assert asyncio.run(scenario()) == "done"